@@ -1,6 +1,7 @@
 from scipy.interpolate import RegularGridInterpolator
 import numpy as np
 import os, sys
+from math import sqrt
 
 #####################
 class Battery:
@@ -77,12 +78,14 @@ class Battery:
         RI_table = table[:, RI_cols]
         self.VOC = RegularGridInterpolator((SOC, VOC_temps), VOC_table)
         self.R_internal = RegularGridInterpolator((SOC, RI_temps), RI_table)
+        self.table = BatteryTable(SOC, VOC_temps, VOC_table, RI_temps, RI_table)
 
 
     # ---
     def Voltage(self):
         SOC = self.level/self.capacity
-        return self.VOC((SOC,self.temperature))
+        if np.ndim(SOC): return self.table.lookup_array(SOC, self.temperature)[0]
+        return self.table.lookup(SOC, self.temperature)[0]
     
     # ---
     def SOC(self):
@@ -99,26 +102,205 @@ class Battery:
         if power (in W) is negative, we discharge the battery
         '''
 
-        SOC = self.level/self.capacity
+        if np.ndim(power) or np.ndim(self.level): return self.apply_power_array(power, deltaT)
+
+        self.level = self.step(self.level, self.capacity, power, deltaT)
+
+    # ---
+    def step(self, level, capacity, power, deltaT):
+        '''
+        The charge after applying the power (scalar) for deltaT seconds to the charge 'level', see apply_power
+        '''
+        level += self.current(level/capacity, power)*deltaT
+        return min(level, capacity) if power>0 else max(level, 0)
+
+    # ---
+    def current(self, SOC, power):
+        '''
+        The current (A) into the battery when the power (W) is applied: positive when charging, negative when discharging
+        '''
+        VOC, R_internal = self.table.lookup(SOC, self.temperature)
+        if R_internal == 0:
+            R_internal = 1e-10 ## avoid division by zero
 
         if (power>0):
-            VOC = self.VOC((SOC, self.temperature))
-            R_internal = self.R_internal((SOC, self.temperature))
-            if R_internal == 0:
-                R_internal = 1e-10 ## avoid division by zero
-            I = (-VOC + np.sqrt(VOC**2 + 4*R_internal*power))/(2*R_internal) 
-            self.level += I*deltaT
-            self.level = min(self.level, self.capacity)
+            return (-VOC + sqrt(VOC**2 + 4*R_internal*power))/(2*R_internal)
         else:
-            VOC = self.VOC((SOC, self.temperature))
-            R_internal = self.R_internal((SOC, self.temperature))
-            if R_internal == 0:
-                R_internal = 1e-10 ## avoid division by zero
-            power = np.abs(power)
-            I = (VOC - np.sqrt(VOC**2 - 4*R_internal*power))/(2*R_internal)
-            self.level -= I*deltaT
-            self.level = max(self.level, 0)
+            power = abs(power)
+            D = VOC**2 - 4*R_internal*power
+            return -(VOC - (sqrt(D) if D >= 0 else np.sqrt(D)))/(2*R_internal) # NaN beyond the maximum power
+
+    # ---
+    def apply_power_series (self, power, deltaT, soc, voltage=None):
+        '''
+        Applies the power series (W, one value per time step of deltaT seconds), each step followed by the ageing,
+        as apply_power and apply_age would, and fills the array soc (and voltage, if given) with the state after
+        each step. For the vectorized engines, where the steps depend on each other but not on the rest of the system.
+        '''
+        loss        = np.exp(-deltaT/self.discharge_tau)
+        lookup      = self.table.lookup
+        level       = self.level
+        capacity    = self.capacity
+        for k, p in enumerate(np.asarray(power).tolist()):
+            level       = self.step(level, capacity, p, deltaT)
+            capacity    *= loss
+            level       *= loss
+            soc[k]      = level/capacity
+            if voltage is not None: voltage[k] = lookup(level/capacity, self.temperature)[0]
+        self.level      = level
+        self.capacity   = capacity
     
+    # ---
+    def apply_power_array (self, power, deltaT):
+        '''
+        Same as apply_power, for an ensemble of batteries: the level and capacity are arrays,
+        and the power can be an array too (one value per member) or a scalar.
+        '''
+
+        level, capacity = np.broadcast_arrays(np.asarray(self.level, dtype=float), self.capacity)
+        power   = np.broadcast_to(power, level.shape)
+        SOC     = level/capacity
+        VOC, R_internal = self.table.lookup_array(SOC, self.temperature)
+        R_internal = np.where(R_internal == 0, 1e-10, R_internal) ## avoid division by zero
+
+        # Both branches on the whole arrays, selected with np.where rather than indexed with the masks
+        charge  = power>0
+        P       = np.abs(power)
+        root    = np.sqrt(VOC**2 + np.where(charge, 4, -4)*R_internal*P)
+        I       = np.where(charge, -VOC + root, VOC - root)/(2*R_internal)
+
+        self.level = np.where(charge, np.minimum(level + I*deltaT, capacity), np.maximum(level - I*deltaT, 0))
+
+    # ---
+    def apply_power_series_array (self, power, deltaT, soc):
+        '''
+        apply_power_series for an ensemble of batteries: power is of shape (time steps, members), and soc is filled
+        with the state of charge of each member after each step (with the ageing). The temperature is the same for
+        all the steps, so VOC and R_internal are tabulated along the uniform SOC grid once, and each step is a handful
+        of operations on the member arrays: the linear interpolation by index arithmetic, and the current
+        (sqrt(VOC**2 + 4*R*P) - VOC)/(2*R) for the signed power P, i.e. both branches of current.
+        This agrees with apply_power_array to the rounding.
+        '''
+
+        S           = self.table.SOC
+        VOC_S, R_S  = self.table.lookup_array(S, self.temperature)
+        R_S         = np.where(R_S == 0, 1e-10, R_S) ## avoid division by zero
+        dVOC, dR    = np.diff(VOC_S), np.diff(R_S)
+        top         = S.size-2
+        loss        = np.exp(-deltaT/self.discharge_tau)
+
+        level       = np.broadcast_to(self.level, soc.shape[1:]).astype(float)
+        capacity    = np.broadcast_to(self.capacity, soc.shape[1:]).astype(float)
+        for k, p in enumerate(power):
+            y       = (level/capacity - S[0])*self.table.inv_dS
+            i       = np.minimum(y.astype(int), top)
+            y      -= i
+            VOC     = VOC_S.take(i) + y*dVOC.take(i)
+            R       = R_S.take(i) + y*dR.take(i)
+            level  += (np.sqrt(VOC*VOC + 4*R*p) - VOC)/(2*R)*deltaT
+            np.clip(level, 0.0, capacity, out=level) # full when charging, empty when discharging
+            capacity *= loss
+            level   *= loss
+            soc[k]  = level/capacity
+        self.level      = level
+        self.capacity   = capacity
+
+    # ---
+    def apply_power_span (self, power, duration, rtol=1e-9):
+        '''
+        Applies a constant power (W) for 'duration' seconds, with the ageing, by integrating the charge and the capacity
+        with an adaptive ODE solver: the continuous limit of apply_power and apply_age called in turn with small steps.
+        The cost does not depend on the duration. Once the battery is full (empty), it stays full (empty) and only
+        the capacity fade is left. Returns the state of charge at the end.
+        '''
+        self.level, self.capacity, _ = self.integrate(power, duration, rtol=rtol)
+        return self.level/self.capacity
+
+    # ---
+    def apply_power_span_series (self, power, deltaT, soc, voltage=None, rtol=1e-9):
+        '''
+        apply_power_span over len(soc) time steps of deltaT seconds at once, filling the array soc (and voltage, if given)
+        with the state at the end of each step, read from the dense output of the ODE solver. Returns the time (s) since
+        the start at which the battery became full (empty), 0 if it already was, None if it did not.
+        '''
+        t = deltaT*np.arange(1, soc.size+1)
+        levels, capacities, reached = self.integrate(power, t[-1], rtol=rtol, t_eval=t)
+        soc[:] = np.clip(levels/capacities, 0.0, 1.0)
+        if voltage is not None: voltage[:] = self.table.lookup_array(soc, self.temperature)[0]
+        self.level, self.capacity = float(levels[-1]), float(capacities[-1])
+        return reached
+
+    # ---
+    def time_to_soc (self, power, target_soc, max_time=365*86400, rtol=1e-9):
+        '''
+        The time (s) until the state of charge reaches target_soc with a constant power (W) and the ageing,
+        see apply_power_span. The state of the battery is not changed. Returns np.inf if the target is not reached
+        within max_time seconds, or before the battery is full (empty).
+        '''
+        level, capacity, t = self.integrate(power, max_time, target_soc, rtol=rtol)
+        return t if t is not None else np.inf
+
+    # ---
+    def integrate (self, power, duration, target_soc=None, rtol=1e-9, t_eval=None):
+        '''
+        Integrates dQ/dt = I(Q/C) - Q/tau, dC/dt = -C/tau from the current state over 'duration' seconds, stopping
+        when Q/C reaches target_soc if it is given. Returns the charge and the capacity at the end, and the time at
+        which the target was reached (None if it was not). With the increasing times t_eval (within the duration),
+        the charge and the capacity are returned as arrays at those times instead, and the last value is the time
+        at which the battery became full (empty), 0 if it already was, None if it did not.
+        '''
+        from scipy.integrate import solve_ivp # only needed here
+
+        tau     = self.discharge_tau
+        level   = float(self.level)
+        capacity= float(self.capacity)
+        SOC     = level/capacity
+        charge  = power>0
+
+        if target_soc is not None:
+            if SOC == target_soc: return level, capacity, 0.0
+            if (SOC < target_soc) != charge: return level, capacity, None # moving away from the target
+
+        def rhs(t, y):
+            return [self.current(min(max(y[0]/y[1], 0.0), 1.0), power) - y[0]/tau, -y[1]/tau]
+
+        bound = (lambda t, y: y[0]-y[1]) if charge else (lambda t, y: y[0])
+        bound.terminal  = True
+        bound.direction = 1 if charge else -1
+        events = [bound]
+        if target_soc is not None:
+            target = lambda t, y: y[0]/y[1] - target_soc
+            target.terminal = True
+            events.append(target)
+
+        full_or_empty = (level >= capacity) if charge else (level <= 0)
+        t   = 0.0
+        sol = None
+        if not full_or_empty and duration > 0:
+            sol = solve_ivp(rhs, (0.0, duration), [level, capacity], method='RK45', rtol=rtol, atol=rtol*capacity, events=events,
+                            dense_output=t_eval is not None)
+            level, capacity = sol.y[:, -1]
+            t = sol.t[-1]
+            if target_soc is not None and sol.t_events[1].size: return level, capacity, float(t)
+            full_or_empty = sol.t_events[0].size > 0
+            if not full_or_empty and t_eval is None: return level, capacity, None
+
+        # Full or empty for the rest of the duration: only the ageing
+        if t_eval is None:
+            capacity    *= np.exp(-(duration-t)/tau)
+            level       = capacity if charge else 0.0
+            return level, capacity, None
+
+        t_eval      = np.asarray(t_eval, dtype=float)
+        k           = int(np.searchsorted(t_eval, t, side='right')) if full_or_empty else t_eval.size
+        levels      = np.empty(t_eval.size)
+        capacities  = np.empty(t_eval.size)
+        if k: levels[:k], capacities[:k] = sol.sol(t_eval[:k])
+        capacities[k:]  = capacity*np.exp(-(t_eval[k:]-t)/tau)
+        levels[k:]      = capacities[k:] if charge else 0.0
+        levels          = np.clip(levels, 0.0, capacities)
+        return levels, capacities, (float(t) if full_or_empty else None)
+
     # ---
     def apply_age (self, deltaT):
         loss            = np.exp(-deltaT/self.discharge_tau)
@@ -126,3 +308,109 @@ class Battery:
         self.level      *= loss
         
 
+
+
+#####################
+class BatteryTable:
+    '''
+    The open circuit voltage and the internal resistance of the battery on a uniform (SOC, temperature) grid,
+    evaluated together by index arithmetic rather than with two RegularGridInterpolator calls. A table which
+    is already on a uniform grid (like battery_VOC.dat) is used as is, and the bilinear interpolation is done
+    with the same operations as RegularGridInterpolator, so the results are the same. Otherwise the table is
+    resampled onto a uniform grid, as fine as its finest step.
+    '''
+
+    # ---
+    def __init__(self, SOC, VOC_temps, VOC_table, R_temps, R_table):
+        self.SOC    = self.uniform(np.asarray(SOC, dtype=float))
+        self.T      = self.uniform(np.unique(np.concatenate((VOC_temps, R_temps)).astype(float)))
+
+        values = []
+        for temps, table in ((VOC_temps, VOC_table), (R_temps, R_table)):
+            temps, table = np.asarray(temps, dtype=float), np.asarray(table, dtype=float)
+            if np.array_equal(self.SOC, SOC) and np.array_equal(self.T, temps):
+                values.append(table)
+            else:
+                grid = np.meshgrid(self.SOC, self.T, indexing='ij')
+                values.append(RegularGridInterpolator((SOC, temps), table)((grid[0], grid[1])))
+        self.values = np.stack(values, axis=-1) # [SOC, T, (VOC, R)]
+
+        self.nS, self.nT = self.SOC.size, self.T.size
+        self.inv_dS = 1.0/(self.SOC[1]-self.SOC[0])
+        self.inv_dT = 1.0/(self.T[1]-self.T[0]) if self.nT > 1 else 0.0
+
+        # Python floats for the scalar lookup: the grids and, for each cell, the corners of VOC and R
+        self.SOC_list   = self.SOC.tolist()
+        self.T_list     = self.T.tolist()
+        v = self.values
+        if self.nT == 1: v = np.concatenate((v, v), axis=1) # a single temperature: flat along T
+        self.cells = [tuple(np.concatenate((v[i, j], v[i, j+1], v[i+1, j], v[i+1, j+1]))[[0, 2, 4, 6, 1, 3, 5, 7]].tolist())
+                      for i in range(self.nS-1) for j in range(v.shape[1]-1)]
+        self.nT1 = v.shape[1]-1
+
+    # ---
+    @staticmethod
+    def uniform(x):
+        ''' The grid x if it is uniform, otherwise a uniform grid over the same range with the smallest step of x '''
+        if x.size < 2: return x
+        step = np.diff(x)
+        if np.allclose(step, step[0], rtol=1e-9, atol=0): return x
+        return np.linspace(x[0], x[-1], int(np.ceil((x[-1]-x[0])/step.min() - 1e-6))+1)
+
+    # ---
+    @staticmethod
+    def interval(grid, inv_step, n, x):
+        ''' Index i of the grid interval with grid[i] <= x < grid[i+1] (the last one for the upper end) '''
+        i = int((x-grid[0])*inv_step)
+        if i > n-2: i = n-2
+        while i > 0 and x < grid[i]: i -= 1
+        while i < n-2 and x >= grid[i+1]: i += 1
+        return i
+
+    # ---
+    def lookup(self, SOC, T):
+        ''' VOC and R_internal for scalar SOC (fraction) and temperature '''
+        S, Ts = self.SOC_list, self.T_list
+        if not (S[0] <= SOC <= S[-1] and Ts[0] <= T <= Ts[-1]):
+            raise ValueError(f'''SOC {SOC} or temperature {T} out of the range of the battery table''')
+
+        i = self.interval(S, self.inv_dS, self.nS, SOC)
+        y0 = (SOC-S[i])/(S[i+1]-S[i])
+        if self.nT > 1:
+            j = self.interval(Ts, self.inv_dT, self.nT, T)
+            y1 = (T-Ts[j])/(Ts[j+1]-Ts[j])
+        else:
+            j, y1 = 0, 0.0
+
+        a, b, c, d, e, f, g, h = self.cells[i*self.nT1+j]
+        u0, u1 = 1-y0, 1-y1
+        return (a*u0*u1 + b*u0*y1 + c*y0*u1 + d*y0*y1,
+                e*u0*u1 + f*u0*y1 + g*y0*u1 + h*y0*y1)
+
+    # ---
+    def lookup_array(self, SOC, T):
+        ''' VOC and R_internal for arrays of SOC and temperatures (or a scalar temperature) '''
+        SOC, T = np.broadcast_arrays(np.asarray(SOC, dtype=float), np.asarray(T, dtype=float))
+        if np.any((SOC < self.SOC[0]) | (SOC > self.SOC[-1]) | (T < self.T[0]) | (T > self.T[-1])):
+            raise ValueError('SOC or temperature out of the range of the battery table')
+
+        def interval(grid, inv_step, x):
+            i = np.clip(((x-grid[0])*inv_step).astype(int), 0, grid.size-2)
+            i -= (i > 0) & (x < grid[i])
+            i += (i < grid.size-2) & (x >= grid[np.minimum(i+1, grid.size-1)])
+            return i
+
+        i = interval(self.SOC, self.inv_dS, SOC)
+        y0 = (SOC-self.SOC[i])/(self.SOC[i+1]-self.SOC[i])
+        if self.nT > 1:
+            j = interval(self.T, self.inv_dT, T)
+            y1 = (T-self.T[j])/(self.T[j+1]-self.T[j])
+            j1 = j+1
+        else:
+            j = j1 = np.zeros_like(i)
+            y1 = np.zeros_like(y0)
+
+        v = self.values
+        u0, u1 = 1-y0, 1-y1
+        result = [v[i, j, k]*u0*u1 + v[i, j1, k]*u0*y1 + v[i+1, j, k]*y0*u1 + v[i+1, j1, k]*y0*y1 for k in (0, 1)]
+        return result[0], result[1]
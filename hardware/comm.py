@@ -1,17 +1,19 @@
-import lusee
 import numpy as np
 from scipy.interpolate import interp1d
-from scipy.optimize import curve_fit
-import time
-import pickle
+from scipy.optimize import curve_fit # loaded by scipy.interpolate anyway
 
 # copied the functions below from previously defined transfer_rate.ipynb from notebooks_git
 
 class Comm():
-    def __init__(self, max_rate_kbps=None, link_margin_dB=None, fixed_rate=False):
-        if fixed_rate is True:
+    def __init__(self, max_rate_kbps=None, link_margin_dB=None, fixed_rate=False, adaptable_rate=None):
+        '''
+        adaptable_rate selects the adaptive rate of the link budget, or the fixed rate fixed_rate (kB/s) of the
+        UT when False; by default the rate is adaptable unless fixed_rate is True.
+        '''
+        if adaptable_rate is None: adaptable_rate = fixed_rate is not True
+        if not adaptable_rate:
             self.adaptable_rate = False
-            self.fixed_rate = fixed_rate
+            self.fixed_rate = float(fixed_rate)
         else:
             self.adaptable_rate = True
             self.max_rate_kbps = max_rate_kbps # generally set to 1024
@@ -35,6 +37,8 @@ class Comm():
         self.Antenna_gain_intp = np.linspace(0,10,1000) 
         self.SANT_intp = interp1d(self.Antenna_gain,self.SANT,fill_value="extrapolate")
 
+        self.link = LinkBudget(self) if self.adaptable_rate else None
+
     def _ext_gain_func(self, x, a, b, c):
         '''
         A quadratic function with fittable parameters a,b,c with input x and output y.
@@ -44,73 +48,111 @@ class Comm():
     def demodulation(self, dis_range, rate_pw2, extra_ant_gain):
         '''
         Determines signal strength by using minimum link margin to have a higher SNR.
+        The link budget itself is defined in LinkBudget.
         
         input: range of distances (array), rate_pw2 (integer of form 2**N, kbps), extra_ant_gain (float)
 
         output: data demodulation margin and data rate (kbps).
         
         '''
-        
-        Asset_EIRP = 13.0 + extra_ant_gain#dBW # strength of signal assuming radially symmetric
-    
-        Srange = dis_range
-     
-        free_space_path_loss = -20*np.log10(4*np.pi*self.Freq_MHz*1000000*Srange*1000/300000000) # E loss in free space prop to srange and freq
-    
-        
-        Pt_error_main = self.Pt_error_intp(Srange)
-        SANT_main = self.SANT_intp(self.Off_pt_angle+Pt_error_main)
-        Antenna_return_loss = 15 # E loss due to refections
-        Mismatch_loss = 10*np.log10(1-(10**(-Antenna_return_loss/20))**2) # impedance mismatch? 
-        SC_noise_temp = 26.8
-        SCGT = SANT_main + Mismatch_loss - SC_noise_temp 
-        
-        Uplink_CN0 = Asset_EIRP + free_space_path_loss + SCGT - 10*np.log10(1.38e-23) ## system carrier to noise
-        Mod_loss = 0.0  #says calculated but given
-        Implementation_loss = -1.0  #assumed
-        Pll_bw_Hz = 700 #assumed 
-        Pll_bw_dB = 10*np.log10(Pll_bw_Hz)
-        SN_loop = 17.9470058901322 
-    
-        Carrier_margin = Uplink_CN0 + Implementation_loss - Pll_bw_dB - SN_loop 
-
-        #print('Rate power of 2 is',rate_pw2)
-        
-        Coded_symb_rt_input = rate_pw2 # symbols transmitted per second
-        Coded_symb_rt = 2**Coded_symb_rt_input
-    
-        Code_rate = 0.662430862918876   #theory # ratio of useful data bits to total transmitted bits
-        Data_rate = Coded_symb_rt * Code_rate # kbps
-    
-        EbN0 = Uplink_CN0 + Implementation_loss - 10*np.log10(Data_rate*1000) 
-    
-        Threshold_EbN0 = 2.1
-        Data_demod_margin = EbN0 - Threshold_EbN0
-        
-        return Data_demod_margin, Data_rate
+        link = self.link if self.link is not None else LinkBudget(self)
+        return link.margin(link.CN0(dis_range, extra_ant_gain), rate_pw2), 2**rate_pw2 * link.Code_rate
         
 
     def get_rate(self, distance_km, alt_deg, max_rate_kbps, demod_marg, zero_ext_gain=False):
         '''
-        Data transfer rate calculation. Begin with minimum power 2**5, tests out different powers and different 
-        demods and rates. Converges when maximum pw2 reached (12) or minimum demod_marg (3) is acheived.
+        Data transfer rate calculation: the highest power of 2 from 2**5 up, below the maximum rate, for which
+        the demod margin is at least the link margin, solved in closed form by the LinkBudget (the rate and the
+        margin are those of demodulation). The max_rate_kbps and demod_marg arguments are superseded by the
+        attributes max_rate_kbps and link_margin_dB.
         
-        input: distance (array), alt_deg (array), demod_marg (integer), zero_ext_gain (boolean)
-        output: rate (kbps), demod
+        input: distance (float or array), alt_deg (float or array), demod_marg (integer), zero_ext_gain (boolean)
+        output: rate (kbps), demod, 2**pw2; the rate and the power of 2 are zero if even 2**5 does not meet the margin
         
         '''
-        extra_gain = self.ext_gain(alt_deg) if not zero_ext_gain else 0
-        pw2 = 5
-        max_rate_kbps = self.max_rate_kbps
-        demod_marg = self.link_margin_dB
-        while True:
-            try_demod, try_rate = self.demodulation(distance_km, pw2, extra_gain)
-            if (try_demod < demod_marg) or (pw2 == int(np.log10(max_rate_kbps)/np.log10(2))-1):
-                break
-            pw2 += 1
-            rate = try_rate
-            demod = try_demod
-        return rate, demod, (2**(pw2-1))
+        return self.link.solve(distance_km, alt_deg, zero_ext_gain)
 
+    def rate_series(self, distance_km, alt_deg, zero_ext_gain=False):
+        '''
+        get_rate for whole series of distances and altitudes, e.g. the trajectory of a satellite.
+
+        input: distance (array, km), alt_deg (array), zero_ext_gain (boolean)
+        output: rate (kbps), demod, 2**pw2 (arrays), see get_rate
+
+        '''
+        return self.link.solve(np.asarray(distance_km, dtype=float), np.asarray(alt_deg, dtype=float), zero_ext_gain)
+
+
+class LinkBudget():
+    '''
+    The link budget of the UT uplink (see Comm.demodulation), with the terms which do not depend on the distance,
+    the altitude or the rate calculated once. The demod margin drops by 10*log10(2) for each power of 2 of the rate,
+    so the highest rate meeting the link margin is found in closed form rather than by trying the powers
+    of 2 one by one. The closed form is checked against the margins of the neighbouring powers of 2, so the
+    result is the same as trying them.
+    '''
+
+    Asset_EIRP_base = 13.0          # dBW, strength of signal assuming radially symmetric
+    Antenna_return_loss = 15        # E loss due to refections
+    SC_noise_temp = 26.8
+    Implementation_loss = -1.0      # assumed
+    Code_rate = 0.662430862918876   # theory, ratio of useful data bits to total transmitted bits
+    Threshold_EbN0 = 2.1
+    pw2_min = 5
+
+    def __init__(self, comm):
+        self.comm = comm
+        self.link_margin_dB = getattr(comm, 'link_margin_dB', None)
+        max_rate_kbps = getattr(comm, 'max_rate_kbps', None) # neither is set for a fixed rate
+        self.pw2_stop = int(np.log10(max_rate_kbps)/np.log10(2))-1 if max_rate_kbps else 0 # the first power of 2 which is not used
+
+        self.path_loss_factor = 4*np.pi*comm.Freq_MHz*1000000
+        self.Mismatch_loss = 10*np.log10(1-(10**(-self.Antenna_return_loss/20))**2)
+        self.k_dB = 10*np.log10(1.38e-23)
+
+        # Data rate (kbps) and its term of EbN0 for each power of 2, index pw2
+        pw2s = range(self.pw2_stop+1)
+        self.Data_rate = np.array([2**pw2 * self.Code_rate for pw2 in pw2s])
+        self.rate_dB = np.array([self.rate_term(pw2) for pw2 in pw2s])
+        self.step_dB = 10*np.log10(2)
+
+    def CN0(self, distance_km, extra_ant_gain):
+        ''' System carrier to noise of the uplink, see Comm.demodulation '''
+        Asset_EIRP = self.Asset_EIRP_base + extra_ant_gain
+        free_space_path_loss = -20*np.log10(self.path_loss_factor*distance_km*1000/300000000)
+        Pt_error_main = self.comm.Pt_error_intp(distance_km)
+        SANT_main = self.comm.SANT_intp(self.comm.Off_pt_angle+Pt_error_main)
+        SCGT = SANT_main + self.Mismatch_loss - self.SC_noise_temp
+        return Asset_EIRP + free_space_path_loss + SCGT - self.k_dB
+
+    def rate_term(self, pw2):
+        ''' The term of the data rate in EbN0, for the coded symbol rate 2**pw2 kbps '''
+        return 10*np.log10(2**pw2 * self.Code_rate*1000)
+
+    def margin(self, CN0, pw2):
+        ''' The data demod margin at the rate 2**pw2 (pw2 an integer, or an array of integers below pw2_stop) '''
+        EbN0 = CN0 + self.Implementation_loss - (self.rate_dB[pw2] if np.ndim(pw2) else self.rate_term(pw2))
+        return EbN0 - self.Threshold_EbN0
+
+    def solve(self, distance_km, alt_deg, zero_ext_gain=False):
+        ''' The rate (kbps), the demod margin and 2**pw2 for the highest power of 2 meeting the link margin,
+            for scalars or arrays of distances (km) and altitudes (degrees); see Comm.get_rate.
+        '''
+        extra_gain = self.comm.ext_gain(alt_deg) if not zero_ext_gain else 0
+        CN0 = np.asarray(self.CN0(distance_km, extra_gain))
 
+        # Closed form, then corrected against the margins of the neighbouring powers of 2 for the rounding
+        top = self.pw2_stop-1
+        room = CN0 + self.Implementation_loss - self.Threshold_EbN0 - self.link_margin_dB - self.rate_dB[0]
+        pw2 = np.clip(np.floor(room/self.step_dB), self.pw2_min-1, top).astype(int)
+        up = (pw2 < top) & (self.margin(CN0, np.minimum(pw2+1, top)) >= self.link_margin_dB)
+        pw2 = pw2 + up
+        down = (pw2 >= self.pw2_min) & (self.margin(CN0, np.maximum(pw2, 0)) < self.link_margin_dB)
+        pw2 = pw2 - down
 
+        ok = pw2 >= self.pw2_min
+        rate = np.where(ok, self.Data_rate[np.maximum(pw2, 0)], 0.0)
+        demod = self.margin(CN0, np.where(ok, pw2, self.pw2_min))
+        level = np.where(ok, 2**np.maximum(pw2, 0), 0)
+        if rate.ndim == 0: return float(rate), float(demod), int(level)
+        return rate, demod, level
@@ -1,4 +1,5 @@
 from hardware.panels import *
+from scipy.spatial.transform import Rotation as R
 # ---
 class Controller:
     profile = None# If set, represents the time series for the power generated by the panels
@@ -63,14 +64,135 @@ class Controller:
     
     ###
     # An aggregator, to collect power from the panels
-    def calculate_power(self):
-        power = None
-        for p in self.panels:
-    
-            if power is None:
-                power = p.power()
-            else:
-                power = power + p.power()
+    power_block     = 8192      # time steps per block in calculate_power, which bounds the size of the temporary arrays
+    sweep_elements  = 1 << 20   # (time step, attitude, panel) elements per block in attitude_sweep
+
+    def calculate_power(self, breakdown=False):
+        """ The power of all the panels at once: their rotated normals are stacked in a (3 x P) matrix, so the
+            dot products with the Sun vector, the angle correction and the exposure are calculated for the P
+            panels together, with one (block x 3)·(3 x P) product per block of time steps, rather than with
+            full-length arrays for each panel (see panel_blocks). The operations are those of Panel.power, and
+            the results agree with the sum over the panels to the rounding of the matrix product.
+
+            Sets 'power', the total for each time step, and returns it. With breakdown=True, also sets
+            'panel_power', the (N x P) power of each panel (in the order of 'panels'), and returns both.
+        """
+        if not self.panels:
+            self.power = None
+            return (None, None) if breakdown else None
+
+        N, P        = self.sun.N, len(self.panels)
+        normals     = np.stack([p.normal_rot for p in self.panels], axis=1)[:, np.newaxis, :]
+        power       = np.zeros(N)
+        panel_power = np.zeros((N, P)) if breakdown else None
+        for a, b, block in self.panel_blocks(normals, self.power_block):
+            power[a:b] = self.panel_sum(block)[:, 0]
+            if breakdown: panel_power[a:b] = block[:, 0, :]
 
         self.power = power
+        if breakdown:
+            self.panel_power = panel_power
+            return power, panel_power
+        return power
+
+    # ---
+    def attitude_sweep(self, pitch, roll, yaw, series=False, deltaT=None):
+        """ The solar power for a set of lander attitudes at once, e.g. a grid of tolerances around the nominal
+            one. pitch, roll and yaw (degrees, as 'lander' in the configuration) are broadcast together into M
+            attitudes. The rotations are composed as in Panel for all of them in one go, and the power of
+            all the attitudes and panels is calculated block by block of time steps (see panel_blocks),
+            sharing the Sun vector, the condition masks and the PV efficiency.
+
+            Returns a dictionary with, for each attitude (first axis):
+            pitch, roll, yaw    -- the attitudes, flattened
+            sunrise             -- the MJD of the sunrises starting the D complete lunar days in the data
+            energy              -- (M x D) the energy of each lunar day, in Wh
+            mean_energy         -- the mean over the lunar days (NaN if there is no complete one)
+            min_day_power       -- the minimum power with the whole disk of the Sun above the horizon (W)
+            power               -- with series=True only, the (N x M) total power for each time step
+
+            deltaT (s) is the time step for the energy, by default from the time axis of the Sun.
+        """
+        sun     = self.sun
+        N, P    = sun.N, len(self.panels)
+        pitch, roll, yaw = (np.ravel(x).astype(float) for x in np.broadcast_arrays(pitch, roll, yaw))
+        M       = pitch.size
+
+        euler   = lambda axis, angles: R.from_euler(axis, angles[:, np.newaxis], degrees=True) # M rotations
+        r_tot   = euler('x', pitch)*euler('y', roll)*euler('z', yaw)
+        normals = np.stack([r_tot.apply(p.normal) for p in self.panels], axis=-1).transpose(1, 0, 2) # (3, M, P)
+
+        if deltaT is None: deltaT = round(float(sun.mjd[1]-sun.mjd[0])*86400, 6)
+        day     = sun.condition[0]
+        rises   = sun.crossings[sun.day[sun.crossings+1]]
+        first   = rises + 1 # the first time step of each lunar day
+        D       = max(first.size-1, 0)
 
+        energy  = np.zeros((M, D))
+        min_day = np.full(M, np.inf)
+        power   = np.zeros((N, M)) if series else None
+        for a, b, block in self.panel_blocks(normals, max(1, self.sweep_elements//(M*P))):
+            total = self.panel_sum(block)
+            if series: power[a:b] = total
+            if day[a:b].any(): np.minimum(min_day, total[day[a:b]].min(axis=0), out=min_day)
+            lunar = np.searchsorted(first, np.arange(a, b), side='right') - 1
+            for k in np.unique(lunar[(lunar>=0) & (lunar<D)]): energy[:, k] += total[lunar==k].sum(axis=0)
+
+        energy  *= deltaT/3600.
+        result  = {'pitch':         pitch,
+                   'roll':          roll,
+                   'yaw':           yaw,
+                   'sunrise':       np.asarray(sun.mjd_crossings)[np.searchsorted(sun.crossings, rises[:D])],
+                   'energy':        energy,
+                   'mean_energy':   energy.mean(axis=1) if D else np.full(M, np.nan),
+                   'min_day_power': np.where(np.isfinite(min_day), min_day, np.nan)}
+        if series: result['power'] = power
+        return result
+
+    # ---
+    def panel_blocks(self, normals, block):
+        """ Generator of the power of the panels, block by block of time steps: yields (a, b, power) for the
+            time steps [a, b), with power of shape (b-a, M, P) for the rotated normals of shape (3, M, P),
+            i.e. the P panels in M orientations. The operations are those of Panel.power.
+        """
+        sun     = self.sun
+        _, M, P = normals.shape
+        flat    = normals.reshape(3, M*P)
+        units   = flat/np.linalg.norm(flat, axis=0)
+        area    = np.array([float(p.area) for p in self.panels])
+        mult    = np.array([float(p.efficiency_mult) for p in self.panels])
+        corr    = np.array([p.apply_cosine_correction==True for p in self.panels])
+        exposed = sun.condition[0] | sun.condition[1] # the choices of np.select in Panel.exposure
+
+        # The PV efficiency, once per distinct efficiency curve
+        eff = {}
+        for p in self.panels:
+            if id(p.pvEfficiency) not in eff:
+                eff[id(p.pvEfficiency)] = p.pvEfficiency(sun.regolith_temperature) if sun.regolith_temperature is not None else 0.3 # default
+        scale = [Panel.solarConstant*eff[id(p.pvEfficiency)] for p in self.panels]
+
+        for a in range(0, sun.N, block):
+            b       = min(sun.N, a+block)
+            rows    = a + np.flatnonzero(exposed[a:b]) # the power is zero while the Sun is down
+            xyz     = sun.xyz[rows]
+
+            dot = area*(xyz @ flat).reshape(rows.size, M, P)
+            dot[dot<0] = 0.0
+
+            if corr.any(): # see Panel.pv_angle_corr
+                sun_unit    = xyz/np.linalg.norm(xyz, axis=1)[:, np.newaxis]
+                factor      = Panel.angle_corr(np.abs(np.degrees(np.arccos(sun_unit @ units)))).reshape(rows.size, M, P)
+
+            power = np.zeros((b-a, M, P))
+            for k in range(P):
+                s = scale[k][rows, np.newaxis] if np.ndim(scale[k]) else scale[k]
+                power[rows-a, :, k] = s*dot[:, :, k]*factor[:, :, k]*mult[k] if corr[k] else s*dot[:, :, k]*mult[k]
+            yield a, b, power
+
+    # ---
+    @staticmethod
+    def panel_sum(power):
+        """ The sum over the panels (the last axis), in order, as the aggregation of Panel.power """
+        total = power[..., 0].copy()
+        for k in range(1, power.shape[-1]): total += power[..., k]
+        return total
@@ -24,7 +24,7 @@ class Device():
         ## we will only calls this if this is UT. So let's assert this
         assert ('TX' in self.powers)
         power = self.powers['TX'] 
-        if get_heat and self.out_side_heat is not None:
+        if get_heat and self.outside_heat is not None:
             power -= self.outside_heat.get('TX', 0.0)
         return power
 
@@ -1,4 +1,5 @@
 import numpy as np
+from   functools import cached_property
 from   scipy.spatial.transform import Rotation as R
 
 ##################### PANELS ###########################
@@ -8,6 +9,10 @@ class Panel: # base, "abstract"
     verbose         = True
     solarConstant   = 1361   # W/m^2 at Moon 
 
+    #Correction is modeled as high-order polynomial based on measured PV power as a function of angle, see pv_angle_corr
+    angle_corr_poly = np.polynomial.Polynomial([1.0004983419956408e+000, -3.8502838956781440e-003, 1.7502375769223580e-003, -3.5217013489873119e-004, 3.5446614736203286e-005, -2.0316555216327750e-006, \
+                   7.1799275885981016e-008, -1.6233764365292121e-009, 2.3567637664937247e-011, -2.1265570389995531e-013, 1.0858756530544471e-015, -2.3977629606594377e-018])
+
     ###
     def __init__(self, sun, name = '', lander=(0.0 , 0.0, 0.0), normal=(None, None, None), env=None, area=1.0, pvEFF_T=None, pvEFF_P=None, efficiency_mult=1.0, apply_cosine_correction=True):
 
@@ -34,11 +39,21 @@ class Panel: # base, "abstract"
         # The "normal" is specific to each of the three (or more) subclassed panels
         self.normal     = normal
         self.normal_rot = self.r_tot.apply(self.normal)
-        self.dot_sun    = self.dot(sun.xyz)
-        self.dot_sun_corr = self.pv_angle_corr(sun.xyz)
-
-        self.choice_list = [self.dot_sun, self.dot_sun, 0, 0]
         self.temperature = sun.regolith_temperature
+
+    # The full-length arrays of the panel, calculated on first use only: the Controller
+    # calculates the power of all its panels at once without them, see Controller.calculate_power
+    @cached_property
+    def dot_sun(self):
+        return self.dot(self.sun.xyz)
+
+    @cached_property
+    def dot_sun_corr(self):
+        return self.pv_angle_corr(self.sun.xyz)
+
+    @cached_property
+    def choice_list(self):
+        return [self.dot_sun, self.dot_sun, 0, 0]
     
     ### ---
     def dot(self, sun_xyz):
@@ -55,12 +70,20 @@ class Panel: # base, "abstract"
         pv_unit = self.normal_rot / np.linalg.norm(self.normal_rot) #PV normal_rot should already be a unit vector, but hey, safety first!
         sun_angle = np.abs(np.degrees(np.arccos(np.dot(sun_unit, pv_unit)))) #Angle between sun and PV normal vector
 
-        #Correction is modeled as high-order polynomial based on measured PV power as a function of angle
-        poly_coeffs = [1.0004983419956408e+000, -3.8502838956781440e-003, 1.7502375769223580e-003, -3.5217013489873119e-004, 3.5446614736203286e-005, -2.0316555216327750e-006, \
-                   7.1799275885981016e-008, -1.6233764365292121e-009, 2.3567637664937247e-011, -2.1265570389995531e-013, 1.0858756530544471e-015, -2.3977629606594377e-018]
-        poly_fit = np.polynomial.Polynomial(poly_coeffs)
+        return self.angle_corr(sun_angle)
 
-        return poly_fit(sun_angle)  
+    ### ---
+    @classmethod
+    def angle_corr(cls, sun_angle):
+        """ The angle correction polynomial at the angles (degrees), evaluated in place with the
+            Horner scheme of numpy's polyval (the same results, fewer temporary arrays)
+        """
+        coef    = cls.angle_corr_poly.coef
+        result  = np.full(np.shape(sun_angle), coef[-1])
+        for c in coef[-2::-1]:
+            result *= sun_angle
+            result += c
+        return result
     
     ### ---
     def set_condition(self, condition_list):
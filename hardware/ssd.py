@@ -1,17 +1,89 @@
-from simpy import Container as C
+import numpy as np
 
 #################################################################################
 
-class SSD(C):
+class SSD:
+    ''' The storage device as a plain level in [0, capacity], without SimPy events (the SimPy
+        environment is accepted for compatibility, and not used). Data put into a full SSD is
+        dropped, and data taken out of an empty one, i.e. link capacity which could not be
+        used, is wasted; the totals are kept in 'dropped' and 'wasted'.
+    '''
+
+    span_window = 64 # time steps summed at a time in change_span, doubled while no bound is reached
+
     def __init__(self, env, config):
-        initial = float(config['initial'])
-        capacity = float(config['capacity'])
-        C.__init__(self, env, init=initial, capacity=capacity)
+        self.level      = float(config['initial'])
+        self.capacity   = float(config['capacity'])
+        self.dropped    = 0.0
+        self.wasted     = 0.0
 
     def change (self, delta):
+        ''' Add delta (negative to take data out), clipped to [0, capacity].
+            Returns the amounts dropped and wasted in this step.
+        '''
+        level   = self.level + delta
+        dropped = wasted = 0.0
+        if level > self.capacity:
+            dropped = level - self.capacity
+            level   = self.capacity
+        elif level < 0.0:
+            wasted  = -level
+            level   = 0.0
+        self.level      = level
+        self.dropped    += dropped
+        self.wasted     += wasted
+        return dropped, wasted
+
+    def change_span (self, delta):
+        ''' change for each of the values of the array delta, in order. Returns the arrays of the level
+            after each step and of the amounts dropped and wasted, the same as step by step: the changes
+            are summed cumulatively until the level leaves [0, capacity], and while the SSD is full and
+            data keeps coming in (or empty and data keeps going out) all of it is dropped (or wasted).
+        '''
+        delta   = np.asarray(delta, dtype=float)
+        n       = delta.size
+        level   = np.empty(n)
+        dropped = np.zeros(n)
+        wasted  = np.zeros(n)
+        cap     = self.capacity
+        current = self.level
+        window  = self.span_window
+        k = 0
+        while k < n:
+            full    = current == cap and delta[k] >= 0
+            empty   = current == 0.0 and delta[k] <= 0
+            if full or empty:
+                regime  = delta[k:] >= 0 if full else delta[k:] <= 0
+                end     = k + (int(np.argmin(regime)) if not regime.all() else regime.size)
+                level[k:end] = current
+                if full:    dropped[k:end] = (cap + delta[k:end]) - cap
+                else:       wasted[k:end] = -delta[k:end]
+                k = end
+                continue
+
+            end = min(n, k + window)
+            seq = np.cumsum(np.concatenate(([current], delta[k:end])))[1:] # the sequential sums, as in change
+            out = (seq > cap) | (seq < 0.0)
+            if not out.any():
+                level[k:end] = seq
+                current = seq[-1]
+                window *= 2
+                k = end
+                continue
+
+            f = int(np.argmax(out))
+            level[k:k+f] = seq[:f]
+            if seq[f] > cap:
+                dropped[k+f]    = seq[f] - cap
+                current         = cap
+            else:
+                wasted[k+f]     = -seq[f]
+                current         = 0.0
+            level[k+f] = current
+            window = self.span_window
+            k += f+1
 
-        if delta>=0:
-            self.put(delta)
-        else:
-            if self.level>0.0: self.get(min(-delta, self.level))
-            
\ No newline at end of file
+        self.level      = current
+        self.dropped    += float(dropped.sum())
+        self.wasted     += float(wasted.sum())
+        return level, dropped, wasted
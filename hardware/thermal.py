@@ -1,10 +1,14 @@
 from scipy.interpolate import RegularGridInterpolator
+from bisect import bisect_right
 import numpy as np
 import sys
 
 class Thermal:
+    span_block = 64     # time steps per block of the scan in evolve_span
+    span_floor = 1e-12  # the smallest decay d**k within a block, far above the underflow of d**k and 1/d**k
+
     def __init__ (self, env, config, verbose = False, ):
-        self.verbose = verbose  
+        self.verbose = verbose
         self.temperature = config['Tstart']
         self.tau = config['tau']
         # look up table
@@ -18,13 +22,138 @@ class Thermal:
             print ("Arrays in thermal sections do not match in size.")
             print (len(alt_list),'x',len(power_list),'!=',temp_list.shape)
             sys.exit(1)
-        
+
         self.Teq = RegularGridInterpolator((alt_list, power_list), temp_list)
 
+        # The same table for the fast lookups of equilibrium: the grids, and the corners of each cell as Python floats
+        self.alt_grid, self.power_grid, self.temp_table = alt_list, power_list, temp_list
+        self.alt_list, self.power_list = alt_list.tolist(), power_list.tolist()
+        t = temp_list.tolist()
+        self.cells = [[(t[i][j], t[i][j+1], t[i+1][j], t[i+1][j+1]) for j in range(len(power_list)-1)]
+                      for i in range(len(alt_list)-1)]
+
+        self.decays = {} # exp(-dt/tau) for each dt
+
+    # ---
+    def decay(self, dt):
+        """ The factor exp(-dt/tau) of the relaxation over dt, calculated once per dt """
+        d = self.decays.get(dt)
+        if d is None: d = self.decays[dt] = np.exp(-dt/self.tau)
+        return d
+
+    # ---
+    def equilibrium(self, alt_deg, heat):
+        """ The equilibrium temperature for the Sun altitude (negative altitudes count as 0) and the heat,
+            scalars or arrays. This is the bilinear interpolation of Teq, with the same operations,
+            without the overhead of RegularGridInterpolator for single points.
+        """
+        if np.ndim(alt_deg) or np.ndim(heat): return self.equilibrium_array(alt_deg, heat)
+
+        A, P = self.alt_list, self.power_list
+        if alt_deg < 0: alt_deg = 0
+        if not (A[0] <= alt_deg <= A[-1] and P[0] <= heat <= P[-1]):
+            raise ValueError(f'''Altitude {alt_deg} or heat {heat} out of the range of the thermal table''')
+
+        i = min(bisect_right(A, alt_deg)-1, len(A)-2)
+        j = min(bisect_right(P, heat)-1, len(P)-2)
+        y0 = (alt_deg-A[i])/(A[i+1]-A[i])
+        y1 = (heat-P[j])/(P[j+1]-P[j])
+        a, b, c, d = self.cells[i][j]
+        u0, u1 = 1-y0, 1-y1
+        return a*u0*u1 + b*u0*y1 + c*y0*u1 + d*y0*y1
+
+    # ---
+    def equilibrium_array(self, alt_deg, heat):
+        """ equilibrium for arrays of altitudes and heat, broadcast together """
+        alt_deg, heat = np.broadcast_arrays(np.maximum(np.asarray(alt_deg, dtype=float), 0), np.asarray(heat, dtype=float))
+        A, P = self.alt_grid, self.power_grid
+        if np.any((alt_deg > A[-1]) | (alt_deg < A[0]) | (heat < P[0]) | (heat > P[-1])):
+            raise ValueError('Altitude or heat out of the range of the thermal table')
+
+        i = np.minimum(np.searchsorted(A, alt_deg, side='right')-1, A.size-2)
+        j = np.minimum(np.searchsorted(P, heat, side='right')-1, P.size-2)
+        y0 = (alt_deg-A[i])/(A[i+1]-A[i])
+        y1 = (heat-P[j])/(P[j+1]-P[j])
+        u0, u1 = 1-y0, 1-y1
+        v = self.temp_table
+        return v[i, j]*u0*u1 + v[i, j+1]*u0*y1 + v[i+1, j]*y0*u1 + v[i+1, j+1]*y0*y1
+
+    # ---
+    def equilibrium_modes(self, alt_deg, heat_table, mode_ids):
+        """ equilibrium for the heat heat_table[mode_ids] at the altitudes alt_deg (arrays along the time), where
+            heat_table holds the heat of each mode, possibly with further axes (e.g. the members of an ensemble).
+            The interpolation along the heat is done once per mode, then along the altitude for each time step,
+            which agrees with equilibrium_array to the rounding.
+        """
+        heat_table = np.asarray(heat_table, dtype=float)
+        alt_deg = np.maximum(np.asarray(alt_deg, dtype=float), 0)
+        A, P = self.alt_grid, self.power_grid
+        if np.any((alt_deg > A[-1]) | (alt_deg < A[0])) or np.any((heat_table < P[0]) | (heat_table > P[-1])):
+            raise ValueError('Altitude or heat out of the range of the thermal table')
+
+        j = np.minimum(np.searchsorted(P, heat_table, side='right')-1, P.size-2)
+        y1 = (heat_table-P[j])/(P[j+1]-P[j])
+        lines = self.temp_table[:, j]*(1-y1) + self.temp_table[:, j+1]*y1 # [altitude, mode, ...]
+
+        i = np.minimum(np.searchsorted(A, alt_deg, side='right')-1, A.size-2)
+        y0 = (alt_deg-A[i])/(A[i+1]-A[i])
+        y0 = y0.reshape(y0.shape + (1,)*(lines.ndim-2))
+        return lines[i, mode_ids]*(1-y0) + lines[i+1, mode_ids]*y0
+
+    # ---
     def evolve(self, heat, alt_deg, dt):
-        if (alt_deg<0):
-            alt_deg = 0
-        Teq = self.Teq((alt_deg, heat))
+        """ Relax the temperature towards the equilibrium for the given heat and Sun altitude over dt.
+            The temperature and the heat may be arrays, for an ensemble of models.
+        """
+        Teq = self.equilibrium(alt_deg, heat)
         # exponential decay towards Teq over timescales tau
-        self.temperature = Teq + (self.temperature-Teq)*np.exp(-dt/self.tau)
-        return self.temperature
\ No newline at end of file
+        self.temperature = Teq + (self.temperature-Teq)*self.decay(dt)
+        return self.temperature
+
+    # ---
+    def evolve_span(self, heat, alt_deg, dt):
+        """ evolve over a series of time steps at once: heat and alt_deg are arrays along the first axis
+            (time), possibly with further axes for an ensemble of models (e.g. heat of shape (n, K) and
+            alt_deg of shape (n,)). Returns the temperature after each step, the last of which becomes
+            the current temperature.
+
+            The recurrence T[k] = Teq[k] + (T[k-1]-Teq[k])*d is solved by a scan over blocks of span_block
+            steps: within a block, T[s+k] = d**k*T[s] + (1-d)*d**k*cumsum(Teq[s+j]/d**j), and the blocks
+            are chained by their last temperature. This agrees with evolve step by step to the rounding
+            (relative differences of the order of 1e-13), not bit for bit. The block is shortened so that
+            d**k stays above span_floor, and for steps so long (dt/tau above about 14) that not even two
+            steps fit, the recurrence is applied step by step, as evolve does.
+        """
+        heat, alt_deg = np.asarray(heat, dtype=float), np.asarray(alt_deg, dtype=float)
+        if alt_deg.ndim < heat.ndim:    alt_deg = alt_deg.reshape(alt_deg.shape + (1,)*(heat.ndim-alt_deg.ndim))
+        elif heat.ndim < alt_deg.ndim:  heat    = heat.reshape(heat.shape + (1,)*(alt_deg.ndim-heat.ndim))
+        return self.relax_span(self.equilibrium(alt_deg, heat), dt)
+
+    # ---
+    def relax_span(self, Teq, dt):
+        """ evolve_span for the equilibrium temperatures Teq, e.g. calculated beforehand for the whole run """
+        Teq = np.asarray(Teq, dtype=float)
+        n = Teq.shape[0] if Teq.ndim else 0
+        if n == 0: return np.zeros(np.shape(Teq))
+
+        d = self.decay(dt)
+        B = min(self.span_block, int(np.log(self.span_floor)*self.tau/-dt)) if dt > 0 else self.span_block
+
+        T = np.empty(np.broadcast_shapes(Teq.shape, (1,) + np.shape(self.temperature)))
+        last = self.temperature
+        if B < 2: # d**2 would be below span_floor
+            for k in range(n):
+                last = T[k] = Teq[k] + (last-Teq[k])*d
+            self.temperature = T[n-1].copy() if T.ndim > 1 else float(T[n-1])
+            return T
+
+        powers = d**np.arange(1, B+1, dtype=float)
+        powers = powers.reshape((B,) + (1,)*(Teq.ndim-1))
+        for s in range(0, n, B):
+            m = min(B, n-s)
+            p = powers[:m]
+            T[s:s+m] = p*last + (1-d)*p*np.cumsum(Teq[s:s+m]/p, axis=0)
+            last = T[s+m-1]
+
+        self.temperature = last.copy() if np.ndim(last) else float(last)
+        return T
@@ -1,7 +1,7 @@
 import numpy as np
 
-import lusee
-from lusee import Observation as O
+# luseepy is only needed to calculate the trajectories, and is imported on first use (see O),
+# so that the simulation from precalculated orbitals does not depend on it
 
 ### Keep these simple defaults for now:
 horizon = 0.0
@@ -12,6 +12,12 @@ sun_rad = 0.265*to_rad
 hrs_per_lunar_day = 2551443/3600
 t_inc = 0.25
 
+# ---
+def O(*args, **kwargs):
+    """ The Observation class of luseepy """
+    from lusee import Observation
+    return Observation(*args, **kwargs)
+
 ############################################################################
 class Sun:
     # Class variables defined here:
@@ -43,8 +49,11 @@ class Sun:
         ]])
     
 
+    # The quantities calculated by finalize from (mjd, alt), which can be cached, see 'derived'
+    derived_names = ('xyz', 'mjd_crossings', 'clocks', 'regolith_temperature')
+
     ### ---
-    def __init__(self, mjd=None, alt=None, az=None):
+    def __init__(self, mjd=None, alt=None, az=None, derived=None):
         """ Without valid arguments in the contructor, it constructor only creates a stub, and the object will
             be completed later based on how the data are obtained (e.g. calculated, read from file etc).
 
@@ -55,6 +64,8 @@ class Sun:
             Keyword arguments:
             alt -- altitude (array)
             az  -- azimuth  (array)
+            derived -- dictionary with the arrays named in Sun.derived_names, previously calculated for
+                       the same (mjd, alt, az), e.g. read from the orbitals cache; see finalize
         """        
         self.mjd        = mjd
         self.alt        = alt
@@ -66,10 +77,10 @@ class Sun:
         self.day        = None
         self.clocks     = None
     
-        if mjd is not None and alt is not None and az is not None: self.finalize()
+        if mjd is not None and alt is not None and az is not None: self.finalize(derived)
 
     ### ---
-    def finalize(self):
+    def finalize(self, derived=None):
         """ That's a method that finishes the creation of the object.
             It is called from the constructor (assuming the input data are given are arguments),
             or alternatively from either the "calculate" or "read_trajectory" methods (below).
@@ -77,16 +88,22 @@ class Sun:
             The crossings are first calculated as indices in the "alt" array where the alt value
             changes its sign, and then more precisely using linear interpolation between
             two adjacent points, before and after the crossing.
+
+            If the dictionary 'derived' is given, the Sun vector, the precise crossings, the lunar clock
+            and the regolith temperature are taken from it rather than calculated.
         """
                 
         if self.az is not None and self.alt is not None and self.mjd is not None:
             self.N = self.az.size
             self.alt_top = np.asarray(self.alt) + self.radius
-            sun = np.zeros((len(self.alt),3))
-            sun[:,0] = np.cos(self.alt) * np.sin(self.az)
-            sun[:,1] = np.cos(self.alt) * np.cos(self.az)
-            sun[:,2] = np.sin(self.alt)
-            self.xyz = sun
+            if derived is not None:
+                self.xyz = derived['xyz']
+            else:
+                sun = np.zeros((len(self.alt),3))
+                sun[:,0] = np.cos(self.alt) * np.sin(self.az)
+                sun[:,1] = np.cos(self.alt) * np.cos(self.az)
+                sun[:,2] = np.sin(self.alt)
+                self.xyz = sun
             self.condition =  [self.alt>horizon+self.radius, self.alt>horizon, self.alt>horizon-self.radius, self.alt<=horizon-self.radius]
 
             # Sunrise calculations -- FIXME -- working on multiple sinrises
@@ -98,64 +115,89 @@ class Sun:
             # self.sunrise    = self.mjd[self.iSunrise]
 
             detect          = np.signbit(self.alt)
-            self.crossings  = np.where(np.diff(detect))[0]
+            self.crossings  = np.flatnonzero(np.diff(detect)) # as in horizon_crossings
             self.day        = ~detect
 
+        if derived is not None:
+            self.mjd_crossings          = derived['mjd_crossings']
+            self.clocks                 = derived['clocks']
+            self.regolith_temperature   = derived['regolith_temperature']
+            return
 
-        self.mjd_crossings = np.fromiter(self.precise_crossings(), float)
-        self.clocks = np.array([self.clock(x) for x in self.mjd])
+        self.mjd_crossings = interpolate_crossing(self.mjd, self.alt, self.crossings)
+        self.clocks = self.clock_array(self.mjd)
         self.set_regolith_temperature()
 
+    ### ---
+    def derived(self):
+        """ The arrays calculated by finalize, as a dictionary which can be given back to the constructor """
+        return {name: getattr(self, name) for name in self.derived_names}
+
     ### ---
     def clock(self, mjd):
         """ This method calculates the "lunar clock" e.g. the time according
-            to 24-hour subdividion of the Lunar day.
+            to 24-hour subdividion of the Lunar day. See clock_array.
         """
 
         if mjd>self.mjd[self.N-1] or mjd<self.mjd[0]: raise ValueError
+        return self.clock_array(mjd)[()]
 
-        if mjd<self.mjd_crossings[0]: # only one endpoint at the start, use the next cycle as estimate
-            estimate = self.mjd_crossings[1] - self.mjd_crossings[0]
-            if self.day[self.crossings[0]]:
-                return 6.0 + 12.0*(1.0-(self.mjd_crossings[0] - mjd)/estimate)
-            else:
-                return 6.0*(1.0-(self.mjd_crossings[0] - mjd)/estimate)
+    ### ---
+    def clock_array(self, mjd):
+        """ The lunar clock for an array of times (or a scalar), all at once: each time is placed between
+            the precise crossings with a binary search. Before the first crossing and after the last one,
+            the length of the adjacent cycle is used as the estimate of the current one.
+        """
 
-        if mjd>self.mjd_crossings[-1]: # only one endpoint at the end, use the previous cycle as estimate
-            estimate = self.mjd_crossings[-1] - self.mjd_crossings[-2] # print(estimate)
-            if self.day[~self.crossings[-1]]: # print('day')
-                return 6.0 + 12.0*(1.0-(mjd - self.mjd_crossings[-1])/estimate)
-            else: # print('night')
-                return 6.0*(1.0-(mjd - self.mjd_crossings[0])/estimate)
+        mjd = np.asarray(mjd, dtype=float)
+        if np.any((mjd>self.mjd[self.N-1]) | (mjd<self.mjd[0])): raise ValueError
 
+        c       = self.mjd_crossings
+        clocks  = np.full(mjd.shape, np.nan)
 
         # Main use case -- we have sunrise/sunset points on either side of the point of interest
-        indices = list(range(len(self.mjd_crossings)))
-        _ = indices.reverse()
-    
-        for i in indices:
-            if mjd>self.mjd_crossings[i]:
-                estimate = self.mjd_crossings[i+1] - self.mjd_crossings[i]
-                if (~self.day[self.crossings[i]]): # day, since crossing is one off by design
-                    return 6.0+12.0*(mjd-self.mjd_crossings[i])/estimate
-                else:
-                    result = 18.0 + 12.0*(mjd-self.mjd_crossings[i])/estimate
-                    if result >24.0: result-=24.0
-                    return result
-
+        i       = np.searchsorted(c, mjd, side='left') - 1 # the last crossing before mjd
+        main    = (i >= 0) & (mjd <= c[-1])
+        i       = i[main]
+        estimate= c[i+1] - c[i]
+        elapsed = 12.0*(mjd[main]-c[i])/estimate
+        day     = ~self.day[self.crossings[i]] # day, since crossing is one off by design
+        result  = np.where(day, 6.0 + elapsed, 18.0 + elapsed)
+        clocks[main] = np.where(result > 24.0, result - 24.0, result)
+
+        # only one endpoint at the start, use the next cycle as estimate
+        head    = mjd < c[0]
+        estimate= c[1] - c[0]
+        if self.day[self.crossings[0]]:
+            clocks[head] = 6.0 + 12.0*(1.0-(c[0] - mjd[head])/estimate)
+        else:
+            clocks[head] = 6.0*(1.0-(c[0] - mjd[head])/estimate)
+
+        # only one endpoint at the end, use the previous cycle as estimate
+        tail    = mjd > c[-1]
+        estimate= c[-1] - c[-2]
+        if self.day[~self.crossings[-1]]:
+            clocks[tail] = 6.0 + 12.0*(1.0-(mjd[tail] - c[-1])/estimate)
+        else:
+            clocks[tail] = 6.0*(1.0-(mjd[tail] - c[0])/estimate)
+
+        return clocks
 
     ### ---
     def precise_crossings(self):
         """ A more precise calculation of crossings based on linear interpolation of alt sign switches.
-            Linear interpolation is used to find the intercept of "alt".
+            Linear interpolation is used to find the intercept of "alt", see interpolate_crossing.
         """
 
-        for crs in self.crossings:
-            (x1, x2) = (self.mjd[crs], self.mjd[crs+1])
-            (y1, y2) = (self.alt[crs], self.alt[crs+1])
-            a = (y2-y1)/(x2-x1)
-            b = y2 -((y2-y1)/(x2-x1))*x2
-            yield (-b)/a
+        yield from interpolate_crossing(self.mjd, self.alt, self.crossings)
+
+    ### ---
+    def crossings_at(self, horizon=horizon):
+        """ The crossings of an altitude other than the horizon, see horizon_crossings. For the limb
+            of the Sun, the transitions of the condition masks: the upper limb rises (the Sun starts to
+            rise) at horizon-radius, and the lower limb (the whole disk is up) at horizon+radius.
+        """
+        return horizon_crossings(self.mjd, self.alt, horizon)
 
     ### ---
     def calculate(self, interval):
@@ -220,7 +262,9 @@ class Sun:
 # ---
 class Sat:
     """ A simple container for the "orbitals" type of data for satellites.
-        Adds the crossings and "up" condition calculation, quntized to the deltaT time step.
+        Adds the crossings and "up" condition calculation: the crossings are the time steps before
+        the rise and set (quantized to the deltaT time step), mjd_crossings their precise MJD and
+        rising their direction, see horizon_crossings.
     """
     def __init__(self, mjd=None, alt=None, az=None, dist=None):
         self.mjd        = mjd
@@ -229,9 +273,94 @@ class Sat:
         self.dist       = dist ## in km
         self.N          = self.az.size
 
-        detect          = np.signbit(self.alt)
-        self.crossings  = np.where(np.diff(detect))[0]
-        self.up         = ~detect
+        self.up         = ~np.signbit(self.alt)
+        self.crossings, self.mjd_crossings, self.rising = horizon_crossings(self.mjd, self.alt)
+
+    def crossings_at(self, horizon=horizon):
+        """ The crossings of an altitude other than the horizon, see horizon_crossings """
+        return horizon_crossings(self.mjd, self.alt, horizon)
+
+    def passes(self, min_alt=0.0, rate=None, deltaT=None):
+        """ The index of the passes of the satellite above the altitude min_alt (radians), see Passes """
+        return Passes(self, min_alt, rate, deltaT)
+
+# ---
+class Passes:
+    """ Index of the passes of a satellite: the intervals of consecutive time steps where its altitude
+        is above min_alt, as arrays with one element per pass, sorted in time:
+
+        start, stop -- the time indices of the first step in the pass and of the first one after it
+        rise, set   -- the MJD of the rise and set, interpolated between the time steps, or the first
+                       (last) time step of the data if the pass is already in progress there
+        duration    -- set - rise, in hours
+        max_alt     -- the highest altitude in the pass (radians), reached at the time index i_max
+        volume      -- if the achievable data rate is given for each time step, its sum over the pass
+                       times deltaT (e.g. kb for a rate in kbps)
+
+        Lookups by MJD or time index (scalars or arrays) are binary searches over the passes.
+    """
+
+    def __init__(self, sat, min_alt=0.0, rate=None, deltaT=None):
+        self.sat        = sat
+        self.min_alt    = min_alt
+
+        above           = np.concatenate(([False], sat.alt>min_alt, [False]))
+        edges           = np.flatnonzero(np.diff(above.astype(np.int8)))
+        self.start      = edges[0::2]
+        self.stop       = edges[1::2]
+        self.N          = self.start.size
+
+        self.rise       = np.asarray(sat.mjd, dtype=float)[self.start]
+        self.set        = np.asarray(sat.mjd, dtype=float)[self.stop-1]
+        inner           = self.start>0
+        self.rise[inner]= self.crossing(self.start[inner]-1)
+        inner           = self.stop<sat.N
+        self.set[inner] = self.crossing(self.stop[inner]-1)
+        self.duration   = (self.set - self.rise)*24.0
+
+        if self.N > 0:
+            self.max_alt    = np.maximum.reduceat(sat.alt, self.start)
+            self.i_max      = np.array([s + np.argmax(sat.alt[s:e]) for s, e in zip(self.start, self.stop)], dtype=int)
+        else:
+            self.max_alt    = np.zeros(0)
+            self.i_max      = np.zeros(0, dtype=int)
+
+        self.volume = None
+        if rate is not None and self.N > 0:
+            # sums over [start, stop): reduceat over the interleaved bounds, with a zero appended for stop == N
+            bounds      = np.column_stack((self.start, self.stop)).ravel()
+            self.volume = np.add.reduceat(np.append(np.asarray(rate, dtype=float), 0.0), bounds)[0::2]*deltaT
+        elif rate is not None:
+            self.volume = np.zeros(0)
+
+    def crossing(self, i):
+        """ MJD of the crossing of min_alt between the time indices i and i+1, see interpolate_crossing """
+        return interpolate_crossing(self.sat.mjd, self.sat.alt, i, self.min_alt)
+
+    def find(self, mjd):
+        """ The index of the pass in progress at the MJD, -1 if the satellite is not up """
+        k = np.searchsorted(self.rise, mjd, side='right') - 1
+        inside = (k>=0) & (mjd <= self.set[np.maximum(k, 0)])
+        return np.where(inside, k, -1) if self.N > 0 else np.full(np.shape(mjd), -1)
+
+    def at(self, time_index):
+        """ The index of the pass including the time index, -1 if the satellite is not up """
+        k = np.searchsorted(self.start, time_index, side='right') - 1
+        inside = (k>=0) & (time_index < self.stop[np.maximum(k, 0)])
+        return np.where(inside, k, -1) if self.N > 0 else np.full(np.shape(time_index), -1)
+
+    def next(self, mjd):
+        """ The index of the first pass rising after the MJD, N if there is none """
+        return np.searchsorted(self.rise, mjd, side='right')
+
+    def summary(self):
+        """ Statistics over all the passes """
+        result = {'passes':         self.N,
+                  'total_hours':    float(self.duration.sum()),
+                  'mean_hours':     float(self.duration.mean()) if self.N else 0.0,
+                  'max_alt':        float(self.max_alt.max()) if self.N else 0.0}
+        if self.volume is not None: result['total_volume'] = float(self.volume.sum())
+        return result
 
 
 ########################################################################################################################
@@ -273,6 +402,32 @@ def hrsFromSunrise(alt, mjd):
     iSunrise = np.argmin(np.abs(alt[iMidnight:])) + iMidnight
     return (mjd - mjd[iSunrise])*24
 
+###
+def interpolate_crossing(mjd, alt, i, horizon=horizon):
+    """ MJD at which alt crosses the horizon between the time indices i and i+1 (scalar or array),
+        by linear interpolation.
+    """
+    mjd, alt = np.asarray(mjd, dtype=float), np.asarray(alt)
+    (x1, x2) = (mjd[i], mjd[i+1])
+    (y1, y2) = (alt[i]-horizon, alt[i+1]-horizon)
+    a = (y2-y1)/(x2-x1)
+    b = y2 - a*x2
+    return (-b)/a
+
+###
+def horizon_crossings(mjd, alt, horizon=horizon):
+    """ All the crossings of the horizon (radians) by the altitude series alt, in one pass.
+        Below the horizon is alt-horizon with the sign bit set, as for Sun.day and Sat.up.
+        For the limb of the Sun, use horizon-sun_rad (rise of the upper limb) or horizon+sun_rad
+        (lower limb), the thresholds of sun_condition.
+
+        Returns three arrays with one element per crossing: the time index before the crossing,
+        the MJD of the crossing (see interpolate_crossing) and whether it is a rise.
+    """
+    below = np.signbit(np.asarray(alt) - horizon)
+    index = np.flatnonzero(np.diff(below))
+    return index, interpolate_crossing(mjd, alt, index, horizon), below[index]
+
 ###
 def sun_condition(alt):
     return [alt>horizon+sun_rad, alt>horizon, alt>horizon-sun_rad, alt<=horizon-sun_rad]
@@ -0,0 +1,79 @@
+#! /usr/bin/env python
+#######################################################################
+# Parameter sweep: run the simulator for every point of a grid of
+# configuration overrides, in parallel, and save the summary metrics
+# (min SOC, time below threshold, data volume, max SSD fill) to HDF5.
+#######################################################################
+#
+# Example:
+# ./scripts/sweep.py -j 8 -o sweep.hdf5 -p battery.capacity=200,220,240.99 -p solar_panels.config.efficiency_all=0.9,1.0
+
+import  os, sys
+from    sys import exit
+import  argparse
+import  yaml
+
+try:
+    luseeopsim_path=os.environ['LUSEEOPSIM_PATH']
+    sys.path.append(luseeopsim_path)
+except:
+    luseeopsim_path = '../'
+    sys.path.append(luseeopsim_path)  # Add parent to path, to enable running locally (also for data)
+
+from sim import sweep
+
+# ----------------------------------------------------------------------------------
+parser = argparse.ArgumentParser()
+
+parser.add_argument("-v", "--verbose",      action='store_true', help="Verbose mode")
+parser.add_argument("-O", "--orbitals",     type=str,   help="Orbitals file (HDF5)",    default=luseeopsim_path+'/data/orbitals/20260110-20270116.hdf5')
+parser.add_argument("-m", "--modes",        type=str,   help="Modes file (YAML)",       default=luseeopsim_path+'/config/modes.yml')
+parser.add_argument("-d", "--devices",      type=str,   help="Devices file (YAML)",     default=luseeopsim_path+'/config/devices.yml')
+parser.add_argument("-c", "--comtable",     type=str,   help="Command table (YAML); if not set, the schedule is generated", default='')
+parser.add_argument("-i", "--initial",      type=int,   help="Initial time (ticks)",    default=None)
+parser.add_argument("-u", "--until",        type=int,   help="End time (ticks)",        default=None)
+parser.add_argument("-e", "--engine",       type=str,   help="Simulation engine",       default='vector')
+parser.add_argument("-t", "--threshold",    type=float, help="SOC threshold for the time below it", default=0.2)
+parser.add_argument("-j", "--jobs",         type=int,   help="Number of worker processes", default=os.cpu_count())
+parser.add_argument("-p", "--parameter",    type=str,   help="Grid axis: dotted.path=value1,value2,... (repeatable)", action='append', default=[])
+parser.add_argument("-C", "--cache",        type=str,   help="Orbitals cache directory, shared by the workers", default='')
+parser.add_argument("-o", "--outputfile",   type=str,   help="Output file (HDF5)",      default='')
+
+args = parser.parse_args()
+
+if len(args.parameter)==0:
+    print('No parameters to sweep, exiting...')
+    exit(-2)
+
+grid = {}
+for p in args.parameter:
+    path, values = p.split('=', 1)
+    grid[path] = [yaml.safe_load(v) for v in values.split(',')]
+
+base_config = {'orbitals_f':    args.orbitals,
+               'modes_f':       args.modes,
+               'devices_f':     args.devices,
+               'comtable_f':    args.comtable if args.comtable!='' else None,
+               'create_command_table': args.comtable=='',
+               'initial_time':  args.initial,
+               'until':         args.until,
+               'engine':        args.engine,
+               'orbitals_cache': args.cache if args.cache!='' else None}
+
+if args.until is None:
+    print('The end time (-u) is required')
+    exit(-2)
+
+if args.verbose:
+    print(f'''*** Grid: {grid} ***''')
+    print(f'''*** Workers: {args.jobs} ***''')
+
+result = sweep(base_config, grid, jobs=args.jobs, output=args.outputfile if args.outputfile!='' else None, soc_threshold=args.threshold)
+
+if args.verbose or args.outputfile=='':
+    names = list(result.keys())
+    print('\t'.join(names))
+    for i in range(len(result[names[0]])):
+        print('\t'.join([str(result[n][i]) for n in names]))
+
+exit(0)
@@ -1,7 +1,12 @@
 __version__="0.1"
 from .sim import *
+from .monitor import *
+from .profiler import *
+from .cache import *
+from .sweep import *
+from .ensemble import *
 
 # from nav.coordinates import *
 
 # hardware modules
-# from hardware.parts import *; from hardware.panels import *;from hardware.controller import *; from hardware.battery import *
\ No newline at end of file
+# from hardware.parts import *; from hardware.panels import *;from hardware.controller import *; from hardware.battery import *
@@ -0,0 +1,139 @@
+import  os
+import  shutil
+import  hashlib
+import  tempfile
+
+import  h5py
+import  numpy as np
+import  yaml
+
+from    nav     import Sun
+
+#################################################################################
+# Cache of the orbitals: the data array of an orbitals file, decompressed, and the
+# quantities the Sun calculates from it, saved as .npy files which are memory-mapped
+# when read back. Runs and worker processes using the same orbitals then attach to
+# the cached arrays instead of inflating the HDF5 file and finalizing the Sun, and
+# share the pages through the OS cache. An entry is a directory named after the
+# content hash of the orbitals file and its time step:
+#
+#   <cache>/<sha1>-<deltaT>/orbitals.npy, xyz.npy, mjd_crossings.npy, clocks.npy,
+#                           regolith_temperature.npy, meta.yml
+#
+# The entries are found through an index keyed on the path, size and modification
+# time of the orbitals file, so that the file is only hashed (and its metadata read)
+# when it is new or has changed:
+#
+#   <cache>/index/<sha1 of the stat key>.yml
+
+CACHE_HASH_BLOCK = 1 << 20  # bytes read at a time to hash the orbitals file
+CACHE_INDEX      = 'index'  # the subdirectory of the index of the cache
+
+# ---
+def orbitals_hash(filename):
+    """ SHA-1 of the content of the orbitals file """
+    sha = hashlib.sha1()
+    with open(filename, 'rb') as f:
+        for block in iter(lambda: f.read(CACHE_HASH_BLOCK), b''): sha.update(block)
+    return sha.hexdigest()
+
+# ---
+def orbitals_stat_key(filename):
+    """ The key of the orbitals file in the index of the cache: its absolute path, size and modification time (ns) """
+    st = os.stat(filename)
+    return {'source': os.path.abspath(filename), 'size': st.st_size, 'mtime_ns': st.st_mtime_ns}
+
+# ---
+def orbitals_index_file(cache, key):
+    """ The file of the index of the cache for the stat key """
+    name = hashlib.sha1(f'''{key['source']}:{key['size']}:{key['mtime_ns']}'''.encode()).hexdigest()
+    return os.path.join(cache, CACHE_INDEX, f'''{name}.yml''')
+
+# ---
+def lookup_orbitals_cache(filename, cache):
+    """ The cache entry of the orbitals file found through the index, without reading the file,
+        None if the file is not indexed with its current stat key or the entry is gone.
+    """
+    key = orbitals_stat_key(filename)
+    try:
+        with open(orbitals_index_file(cache, key), 'r') as f: indexed = yaml.safe_load(f)
+        entry = os.path.join(cache, indexed['entry'])
+    except (OSError, yaml.YAMLError, TypeError, KeyError):
+        return None
+    if any(indexed.get(k) != v for k, v in key.items()) or not os.path.isdir(entry): return None
+    return entry
+
+# ---
+def index_orbitals_cache(cache, key, entry):
+    """ Record the entry for the stat key in the index, replacing the file atomically """
+    index = orbitals_index_file(cache, key)
+    os.makedirs(os.path.dirname(index), exist_ok=True)
+    fd, tmp = tempfile.mkstemp(dir=os.path.dirname(index), prefix='.tmp-')
+    with os.fdopen(fd, 'w') as f: yaml.dump(dict(key, entry=os.path.basename(entry)), f)
+    os.replace(tmp, index)
+
+# ---
+def orbitals_cache_entry(filename, cache):
+    """ The cache directory, the time step, the metadata and the content hash of the orbitals file """
+    with h5py.File(filename, 'r') as f: conf = yaml.safe_load(f['/meta/configuration'][0,])
+    deltaT = conf['period']['deltaT']
+    sha1 = orbitals_hash(filename)
+    return os.path.join(cache, f'''{sha1}-{deltaT}'''), deltaT, conf, sha1
+
+# ---
+def write_orbitals_cache(filename, cache, verbose=False):
+    """ Create the cache entry of the orbitals file, if it does not exist yet, and return its directory.
+        The entry is looked up in the index first; the file is only hashed when its stat key is not
+        indexed, and the entry is then indexed for that key. The entry is written to a temporary
+        directory which is then renamed, so that concurrent writers (e.g. the workers of a sweep)
+        and readers only ever see complete entries.
+    """
+    entry = lookup_orbitals_cache(filename, cache)
+    if entry is not None: return entry
+
+    key = orbitals_stat_key(filename) # before hashing: a file changed meanwhile is hashed again next time
+    entry, deltaT, conf, sha1 = orbitals_cache_entry(filename, cache)
+    if not os.path.isdir(entry): make_orbitals_cache(filename, cache, entry, deltaT, conf, sha1, verbose)
+    index_orbitals_cache(cache, key, entry)
+    return entry
+
+# ---
+def make_orbitals_cache(filename, cache, entry, deltaT, conf, sha1, verbose=False):
+    """ Write the cache entry of the orbitals file, see write_orbitals_cache """
+    with h5py.File(filename, 'r') as f: da = np.array(f['/data/orbitals'])
+    sun = Sun(da[:,0], da[:,1], da[:,2])
+
+    os.makedirs(cache, exist_ok=True)
+    tmp = tempfile.mkdtemp(dir=cache, prefix='.tmp-')
+    try:
+        np.save(os.path.join(tmp, 'orbitals.npy'), da)
+        for name, data in sun.derived().items(): np.save(os.path.join(tmp, f'''{name}.npy'''), np.asarray(data))
+        with open(os.path.join(tmp, 'meta.yml'), 'w') as f:
+            yaml.dump({'source': os.path.abspath(filename), 'sha1': sha1, 'deltaT': deltaT, 'shape': list(da.shape),
+                       'configuration': conf}, f)
+        os.rename(tmp, entry)
+        if verbose: print(f'''Cached the orbitals {filename} in {entry}''')
+    except OSError:
+        shutil.rmtree(tmp, ignore_errors=True)
+        if not os.path.isdir(entry): raise # otherwise, another process created it first
+
+# ---
+def read_orbitals_cache(filename, cache, verbose=False):
+    """ The time step, the orbitals array and the derived Sun arrays (see Sun.derived_names)
+        of the orbitals file, as read-only memory maps of its cache entry, created if needed.
+    """
+    entry   = write_orbitals_cache(filename, cache, verbose)
+    load    = lambda name: np.load(os.path.join(entry, f'''{name}.npy'''), mmap_mode='r')
+    with open(os.path.join(entry, 'meta.yml'), 'r') as f: deltaT = yaml.safe_load(f)['deltaT']
+    return deltaT, load('orbitals'), {name: load(name) for name in Sun.derived_names}
+
+# ---
+def window_orbitals_cache(da, derived, lo, hi):
+    """ The rows [lo, hi) of the cached orbitals array and derived Sun arrays, still memory-mapped.
+        The crossings are those between two of these rows, as the Sun finds them in the rows.
+    """
+    crossings   = np.flatnonzero(np.diff(np.signbit(da[:,1]))) # as in Sun.finalize
+    inside      = (crossings >= lo) & (crossings < hi-1)
+    window      = {name: derived[name][lo:hi] for name in ('xyz', 'clocks', 'regolith_temperature')}
+    window['mjd_crossings'] = np.asarray(derived['mjd_crossings'])[inside]
+    return da[lo:hi], window
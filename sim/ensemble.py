@@ -0,0 +1,142 @@
+import  copy
+
+import  numpy as np
+
+from    .sim import SCHEDULE_STATE
+
+#################################################################################
+class Ensemble:
+    """ K members of the same simulation stepped together, for Monte Carlo studies.
+        The battery and thermal state of the members are length-K arrays held by copies of the
+        hardware models of the Simulator, which itself is left as it was. The run goes block by
+        block of time steps: the battery is stepped with apply_power_series_array, the only loop
+        over the time steps, and the thermal model, the SSD and the summaries are whole-block array
+        operations.
+
+        The members share the orbitals, the schedule and the conditions of the Simulator;
+        they differ in the per-member parameters given to the constructor. The SSD, which only
+        depends on the schedule, is the same for all members, with the level clipped to
+        [0, capacity] as in the Simulator.
+    """
+
+    run_block = 1024 # time steps per block of run, which bounds the size of the (time step, member) arrays
+
+    def __init__(self, smltr, size, power_tolerance=1.0, initial_soc=None, capacity=None, soc_threshold=0.2, keep_series=False):
+        """ Keyword arguments:
+            smltr -- the Simulator, defining the time window, the schedule and the hardware
+            size -- the number of members, K
+            power_tolerance -- relative factor on the power drawn (and heat dissipated) by the devices,
+                               a scalar, an array of K values or an array of shape (K, number of devices)
+                               ordered as smltr.device_names; the CUSTOM power of the PFPS follows the
+                               scaled powers of the devices it supplies, times its own factor
+            initial_soc -- array of K initial states of charge (default: the current state of the battery of smltr)
+            capacity -- array of K battery capacities, in the charge unit of the battery configuration,
+                        before the capacity fade (default: the current capacity of the battery of smltr)
+            soc_threshold -- the SOC level for the 'hours_below' summary
+            keep_series -- keep the full (time, member) arrays of SOC, voltage, SSD fill and temperature
+        """
+
+        self.smltr          = smltr
+        self.size           = size
+        self.soc_threshold  = soc_threshold
+        self.keep_series    = keep_series
+
+        tolerance = np.asarray(power_tolerance, dtype=float)
+        if tolerance.ndim < 2: tolerance = np.broadcast_to(tolerance, (size,))[:, np.newaxis]*np.ones(len(smltr.device_names))
+        self.power_tolerance = np.broadcast_to(tolerance, (size, len(smltr.device_names)))
+
+        # Per-member load and heat tables: [mode, TX, member]. The CUSTOM power of the PFPS (also its heat, see
+        # Simulator.device_powers) is recalculated from the scaled powers of the devices it supplies, then scaled by its own factor
+        power   = smltr.device_power_table[..., np.newaxis]*self.power_tolerance.T # [mode, TX, device, member]
+        heat    = smltr.device_heat_table[..., np.newaxis]*self.power_tolerance.T
+        for mid, (Pq, fact, supplied) in smltr.PFPS_custom_modes.items():
+            p       = smltr.device_names.index('PFPS')
+            loads   = power[mid][:, [smltr.device_names.index(dk) for dk in supplied]].sum(axis=1)
+            power[mid, :, p] = heat[mid, :, p] = (Pq + fact*loads)*self.power_tolerance[:, p]
+        self.power_table    = power.sum(axis=2)
+        self.heat_table     = heat.sum(axis=2)
+
+        # The models of the members: copies of those of the Simulator, with length-K state
+        config  = smltr.battery_config
+        unit    = 3600 if config['charge_unit'] == 'Ah' else 1
+        self.battery    = battery = copy.copy(smltr.battery)
+        self.thermal    = copy.copy(smltr.thermal)
+        if capacity is not None:
+            battery.capacity = np.asarray(capacity, dtype=float)*(1-float(config['capacity_fade']))*unit*np.ones(size)
+        else:
+            battery.capacity = np.full(size, float(smltr.battery.capacity))
+        if initial_soc is not None:
+            battery.level = np.asarray(initial_soc, dtype=float)*battery.capacity
+        else:
+            battery.level = np.full(size, float(smltr.battery.level))
+
+        self.thermal.temperature = np.full(size, float(smltr.thermal.temperature))
+        self.ssd_level = np.full(size, float(smltr.ssd.level))
+
+    # ---
+    def run(self):
+        """ Step all members over the time window of the Simulator. Returns the per-member summary:
+            min and final SOC, hours below the SOC threshold, max SSD fill, min and max box temperature.
+        """
+
+        smltr   = self.smltr
+        start   = int(smltr.env.now)
+        stop    = smltr.until if smltr.until is not None else smltr.sun.N
+        ticks   = np.arange(start, stop)
+        n       = ticks.size
+        K       = self.size
+        deltaT  = smltr.deltaT
+
+        # The series of the Simulator, keeping its schedule bookkeeping as it was
+        schedule    = {k: smltr.__dict__[k] for k in SCHEDULE_STATE if k in smltr.__dict__}
+        series      = smltr.prepare_series(ticks)
+        for k in SCHEDULE_STATE: smltr.__dict__.pop(k, None)
+        smltr.__dict__.update(schedule)
+
+        mode_ids    = series['mode_ids']
+        power_in    = np.where(series['charging'], smltr.controller.power[ticks], 0.0)
+        alt_deg     = smltr.sun.alt[ticks]/np.pi*180.0
+
+        battery     = self.battery
+        thermal     = self.thermal
+        ssd         = copy.copy(smltr.ssd)
+        ssd.level   = float(self.ssd_level[0]) if K else ssd.level
+        ssd_fill    = ssd.change_span(series['data_rate']*deltaT)[0]/ssd.capacity
+        self.ssd_level = np.full(K, ssd.level)
+
+        min_soc     = np.full(K, np.inf)
+        below       = np.zeros(K, dtype=int)
+        min_temp    = np.full(K, np.inf)
+        max_temp    = np.full(K, -np.inf)
+
+        if self.keep_series:
+            self.battery_SOC    = np.zeros((n, K))
+            self.battery_V      = np.zeros((n, K))
+            self.ssd            = np.broadcast_to(ssd_fill[:, np.newaxis], (n, K))
+            self.boxtemp        = np.zeros((n, K))
+
+        battery.set_temperature(20) ## fix once we have thermal
+        for a in range(0, n, self.run_block):
+            b   = min(n, a+self.run_block)
+            mid = mode_ids[a:b]
+            soc = np.empty((b-a, K))
+            battery.apply_power_series_array(power_in[a:b, np.newaxis] - self.power_table[mid, 0], deltaT, soc)
+            temperature = thermal.relax_span(thermal.equilibrium_modes(alt_deg[a:b], self.heat_table[:, 0], mid), deltaT)
+
+            np.minimum(min_soc, soc.min(axis=0), out=min_soc)
+            below += np.count_nonzero(soc<self.soc_threshold, axis=0)
+            np.minimum(min_temp, temperature.min(axis=0), out=min_temp)
+            np.maximum(max_temp, temperature.max(axis=0), out=max_temp)
+
+            if self.keep_series:
+                self.battery_SOC[a:b]   = soc
+                self.battery_V[a:b]     = battery.table.lookup_array(soc, battery.temperature)[0]
+                self.boxtemp[a:b]       = temperature
+
+        self.summary = {'min_soc':      min_soc,
+                        'final_soc':    battery.level/battery.capacity,
+                        'hours_below':  below*deltaT/3600.,
+                        'max_ssd_fill': np.full(K, ssd_fill.max() if n else -np.inf),
+                        'min_boxtemp':  min_temp,
+                        'max_boxtemp':  max_temp}
+        return self.summary
@@ -0,0 +1,241 @@
+import  yaml
+import  h5py
+import  numpy as np
+
+#################################################################################
+# The channels a Monitor can record: name -> (default dtype, description)
+CHANNELS = {
+    'power':        (float,     'Total power drawn by the electronics'),
+    'battery_SOC':  (float,     'Battery charge'),
+    'battery_V':    (float,     'Battery voltage'),
+    'data_rate':    (float,     'data rate in/out of the system'),
+    'ssd':          (float,     'Amount of data in the storage device'),
+    'boxtemp':      (float,     'temperature from thermal'),
+    'mode':         (np.int8,   'Mode id, i.e. the index in Simulator.mode_names'),
+    'solar_power':  (float,     'Power delivered by the solar panels'),
+    'comm_rate':    (float,     'Adaptive data rate of the UT link, zero when not transmitting'),
+    'ssd_dropped':  (float,     'Data dropped because the storage device was full'),
+    'ssd_wasted':   (float,     'Link capacity wasted because the storage device was empty'),
+    'device_power': (float,     'Power drawn by each device, one column per device'),
+    'device_heat':  (float,     'Internal heat of each device, one column per device'),
+}
+
+STATE_CHANNELS  = ('power', 'battery_SOC', 'battery_V', 'data_rate', 'ssd', 'boxtemp') # see Monitor.tick
+DEVICE_CHANNELS = ('device_power', 'device_heat')
+
+#################################################################################
+class Monitor():
+    ''' The Monitor class is used to record the time series of the parameters of choice,
+        as the simulation is progressing through time steps. Each channel is an array,
+        an attribute of the Monitor named as the channel; element 0 is the time index 'start'.
+    '''
+
+    channels = STATE_CHANNELS # the default
+
+    def __init__(self, size=0, channels=None, dtype=None, start=0, columns=None):
+        ''' Initialize arrays for time series type of data
+
+            Keyword arguments:
+            size -- the number of time steps
+            channels -- the names of the channels to record, from CHANNELS (default: Monitor.channels)
+            dtype -- the dtype of the floating point channels, e.g. np.float32 for large runs (default: float)
+            start -- the time index of the first element of the arrays
+            columns -- the device names, for the per-device channels
+        '''
+
+        self.size       = size
+        self.start      = start
+        self.columns    = list(columns) if columns is not None else []
+
+        if channels is not None: self.channels = tuple(channels)
+        unknown = [ch for ch in self.channels if ch not in CHANNELS]
+        if unknown:
+            print(f'''Unknown Monitor channels: {unknown}, the available channels are: {list(CHANNELS.keys())}''')
+            raise KeyError
+
+        for ch in self.channels:
+            ch_dtype = CHANNELS[ch][0]
+            if dtype is not None and ch_dtype is float: ch_dtype = dtype
+            shape = (size, len(self.columns)) if ch in DEVICE_CHANNELS else (size,)
+            setattr(self, ch, np.zeros(shape, dtype=ch_dtype))
+
+        self.state  = [(getattr(self, ch), k) for k, ch in enumerate(STATE_CHANNELS) if ch in self.channels]
+        self.extras = tuple(ch for ch in self.channels if ch not in STATE_CHANNELS)
+
+    # ---
+    def __getitem__(self, channel):
+        return getattr(self, channel)
+
+    # ---
+    def tick(self, myT, power, battery_SOC, battery_V, data_rate, ssd, boxtemp):
+        ''' Record the values of one time step, for the channels which are enabled '''
+        i = myT - self.start
+        values = (power, battery_SOC, battery_V, data_rate, ssd, boxtemp)
+        for a, k in self.state: a[i] = values[k]
+
+    # ---
+    def extra(self, myT, **values):
+        ''' Record the values of the channels other than those of 'tick', for one time step '''
+        i = myT - self.start
+        for ch, value in values.items(): getattr(self, ch)[i] = value
+
+    # ---
+    def store(self, start, **series):
+        ''' Record the arrays of consecutive values, starting at the time index 'start'.
+            Arrays of channels which are not enabled are ignored.
+        '''
+        i = start - self.start
+        for ch, data in series.items():
+            if ch in self.channels: getattr(self, ch)[i:i+len(data)] = data
+
+    # ---
+    def snapshot(self, stop):
+        ''' Copies of the channels up to the time index 'stop', e.g. for a checkpoint '''
+        return {ch: getattr(self, ch)[:stop-self.start].copy() for ch in self.channels}
+
+    # ---
+    def flush(self):
+        pass
+
+#################################################################################
+class StreamMonitor(Monitor):
+    ''' Monitor writing to an HDF5 file instead of keeping the time series in memory.
+        A buffer of 'chunk' time steps is appended to the file whenever it is full, so the memory
+        footprint does not depend on the length of the run. The file has one resizable dataset
+        per channel and the MJD axis in the 'monitor' group, and the run metadata (YAML) in the
+        'meta' group, as in the orbitals files. Read it back with MonitorReader.
+    '''
+
+    def __init__(self, filename, mjd, start=0, chunk=4096, meta=None, channels=None, dtype=None, columns=None, resume=False):
+        ''' Keyword arguments:
+            filename -- the output HDF5 file, overwritten if it exists when the first steps are written
+            mjd -- the time axis of the simulation, i.e. sun.mjd
+            start -- the time index of the first step to be recorded
+            chunk -- the number of time steps buffered in memory, also the HDF5 chunk size
+            meta -- dictionary with the run metadata
+            channels, dtype, columns -- see Monitor
+            resume -- continue the existing file instead: its rows from the time index 'start' on are
+                      discarded, and the steps are appended from there (see Simulator.restore)
+        '''
+
+        Monitor.__init__(self, chunk, channels=channels, dtype=dtype, start=start, columns=columns) # the arrays are the buffer
+
+        self.filename   = filename
+        self.mjd        = mjd
+        self.chunk      = chunk
+        self.meta       = meta if meta is not None else {}
+        self.first      = start # the time index of the first row of the file
+        self.filled     = 0 # the number of steps in the buffer, which starts at the time index self.start
+        self.created    = resume
+
+        if resume:
+            with h5py.File(filename, 'a') as f:
+                grp         = f['monitor']
+                self.first  = int(grp.attrs['start'])
+                rows        = start - self.first
+                missing     = [ch for ch in self.channels if ch not in grp]
+                if missing or not 0 <= rows <= grp['mjd'].shape[0]:
+                    print(f'''Cannot resume {filename} at the time index {start}: it starts at {self.first} with {grp['mjd'].shape[0]} rows, missing channels: {missing}''')
+                    raise ValueError
+                for ds in grp.values(): ds.resize(rows, axis=0)
+
+    # ---
+    def create(self):
+        ''' Create the file, with the metadata and empty datasets '''
+        with h5py.File(self.filename, 'w') as f:
+            grp_meta = f.create_group('meta')
+            dt = h5py.string_dtype(encoding='utf-8')
+            ds_meta = grp_meta.create_dataset('configuration', (1,), dtype=dt)
+            ds_meta[0,] = yaml.dump(self.meta)
+
+            grp = f.create_group('monitor')
+            grp.attrs['start'] = self.first
+            grp.create_dataset('mjd', (0,), maxshape=(None,), chunks=(self.chunk,), dtype=float)
+            for ch in self.channels:
+                a = getattr(self, ch)
+                ds = grp.create_dataset(ch, (0,)+a.shape[1:], maxshape=(None,)+a.shape[1:], chunks=(self.chunk,)+a.shape[1:], dtype=a.dtype)
+                if ch in DEVICE_CHANNELS: ds.attrs['columns'] = self.columns
+        self.created = True
+
+    # ---
+    def tick(self, myT, power, battery_SOC, battery_V, data_rate, ssd, boxtemp):
+        ''' Record the values of one time step, appending the buffer to the file when it is full '''
+        if myT - self.start == self.chunk: self.flush()
+        Monitor.tick(self, myT, power, battery_SOC, battery_V, data_rate, ssd, boxtemp)
+        self.filled = myT - self.start + 1
+
+    # ---
+    def store(self, start, **series):
+        ''' Append the arrays of consecutive values, starting at the time index 'start' '''
+        self.flush()
+        self.start = start
+        n = len(next(iter(series.values())))
+        self.append({ch: np.asarray(data) for ch, data in series.items() if ch in self.channels}, n)
+        self.start += n
+
+    # ---
+    def snapshot(self, stop):
+        ''' The content is in the file: flush it, and keep nothing in the checkpoint (which records
+            the position in the file instead, see Simulator.checkpoint)
+        '''
+        self.flush()
+        return {}
+
+    # ---
+    def flush(self):
+        ''' Append the buffered steps to the file, creating it if needed '''
+        if not self.created: self.create()
+        if self.filled == 0: return
+        self.append({ch: getattr(self, ch)[:self.filled] for ch in self.channels}, self.filled)
+        self.start += self.filled
+        self.filled = 0
+
+    # ---
+    def append(self, series, n):
+        if not self.created: self.create()
+        with h5py.File(self.filename, 'a') as f:
+            grp = f['monitor']
+            size = grp['mjd'].shape[0]
+            for ch, data in (('mjd', self.mjd[self.start:self.start+n]),) + tuple(series.items()):
+                grp[ch].resize(size+n, axis=0)
+                grp[ch][size:] = data
+
+#################################################################################
+class MonitorReader():
+    ''' Read access to the output of StreamMonitor. The channels and 'mjd' are h5py datasets,
+        which read from the file only the slices that are asked for; 'chunks' iterates over
+        a channel piece by piece. To be used as a context manager, or closed explicitly.
+    '''
+
+    def __init__(self, filename):
+        self.file       = h5py.File(filename, 'r')
+        self.meta       = yaml.safe_load(self.file['/meta/configuration'][0,])
+        grp             = self.file['monitor']
+        self.start      = int(grp.attrs['start'])
+        self.channels   = tuple(ch for ch in grp.keys() if ch != 'mjd')
+        self.columns    = []
+        self.mjd        = grp['mjd']
+        for ch in self.channels:
+            setattr(self, ch, grp[ch])
+            if 'columns' in grp[ch].attrs: self.columns = list(grp[ch].attrs['columns'])
+
+    def __len__(self):
+        return self.mjd.shape[0]
+
+    def __getitem__(self, channel):
+        return getattr(self, channel)
+
+    def chunks(self, channel, size=None):
+        ''' Iterate over the channel in pieces of 'size' steps (default: the HDF5 chunk size) '''
+        ds = getattr(self, channel)
+        size = size if size is not None else ds.chunks[0]
+        for i in range(0, ds.shape[0], size): yield ds[i:i+size]
+
+    def close(self):
+        self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
@@ -0,0 +1,90 @@
+import  time
+import  numpy as np
+
+#################################################################################
+class Counted():
+    ''' Wrapper of a callable (e.g. a RegularGridInterpolator) counting the calls and,
+        for interpolators, the number of points evaluated.
+    '''
+
+    def __init__(self, func):
+        self.func   = func
+        self.calls  = 0
+        self.points = 0
+
+    def __call__(self, *args, **kwargs):
+        self.calls += 1
+        if args:
+            xi = args[0]
+            if isinstance(xi, tuple):   self.points += np.broadcast(*xi).size
+            elif np.ndim(xi) > 1:       self.points += np.shape(xi)[0]
+            elif np.ndim(xi) == 1:      self.points += np.size(xi)
+            else:                       self.points += 1
+        return self.func(*args, **kwargs)
+
+#################################################################################
+class Profiler():
+    ''' Wall time and number of passes of the sections of the simulation loop, and counters
+        of the interpolator evaluations, the link budget calculations and the SimPy events.
+        Enabled with Simulator(profile=True); the report is available with 'report' or 'table'
+        once the simulation has run. When the profiler is disabled, the cost is one test per section.
+    '''
+
+    def __init__(self):
+        self.times      = {}
+        self.passes     = {}
+        self.counted    = {}
+        self.total      = 0.0
+
+    # ---
+    def attach(self, smltr):
+        ''' Install the counters on the hardware models and the SimPy environment of the Simulator '''
+        battery, thermal, comm = smltr.battery, smltr.thermal, smltr.comm
+        for name, owner, attr in (('Battery.lookup', battery.table, 'lookup'),
+                                  ('Thermal.equilibrium', thermal, 'equilibrium'), ('Comm.rate_series', comm, 'rate_series')):
+            func = getattr(owner, attr)
+            if not isinstance(func, Counted):
+                func = Counted(func)
+                setattr(owner, attr, func)
+            self.counted[name] = func
+        self.count_events(smltr.env)
+
+    # ---
+    def count_events(self, env):
+        ''' Count the events processed by the SimPy environment '''
+        step = Counted(env.step)
+        env.step = step
+        self.counted['simpy.events'] = step
+
+    # ---
+    def lap(self, section, t):
+        ''' Add the time since 't' to the section, return the current time '''
+        now = time.perf_counter()
+        self.times[section]     = self.times.get(section, 0.0) + now - t
+        self.passes[section]    = self.passes.get(section, 0) + 1
+        return now
+
+    # ---
+    def report(self):
+        ''' Dictionary with the sections {'time': seconds, 'passes': number} and the counters {'calls', 'points'}.
+            The time of the whole simulation is in 'total', and 'other' is the time outside of the sections,
+            e.g. the SimPy event machinery for the SimPy engine.
+        '''
+        sections = {s: {'time': self.times[s], 'passes': self.passes[s]} for s in self.times}
+        sections['other'] = {'time': self.total - sum(self.times.values()), 'passes': 1}
+        counters = {name: {'calls': c.calls, 'points': c.points} for name, c in self.counted.items()}
+        return {'total': self.total, 'sections': sections, 'counters': counters}
+
+    # ---
+    def table(self):
+        ''' The report as text '''
+        rep     = self.report()
+        total   = rep['total'] if rep['total'] > 0 else 1.0
+        lines   = [f'''{'Section':20} {'Time (s)':>10} {'Share':>7} {'Passes':>10}''']
+        for s, v in rep['sections'].items():
+            lines.append(f'''{s:20} {v['time']:10.3f} {100*v['time']/total:6.1f}% {v['passes']:10d}''')
+        lines.append(f'''{'total':20} {rep['total']:10.3f}''')
+        lines.append(f'''{'Counter':20} {'Calls':>10} {'Points':>10}''')
+        for name, v in rep['counters'].items():
+            lines.append(f'''{name:20} {v['calls']:10d} {v['points']:10d}''')
+        return '\n'.join(lines)
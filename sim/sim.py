@@ -8,26 +8,41 @@ from    hardware        import *
 from    utils.timeconv  import *
 from    nav             import *  # Astro/observation wrapper classes
 
-#################################################################################
-class Monitor():
-    ''' The Monitor class is used to record the time series of the parameters of choice,
-        as the simulation is progressing through time steps.
-    '''
-
-    def __init__(self, size=0):
-        ''' Initialize arrays for time series type of data
-        '''
-
-        self.power      = np.zeros(size, dtype=float) # Total power drawn by the electronics
-        self.battery_SOC= np.zeros(size, dtype=float) # Battery charge
-        self.battery_V  = np.zeros(size, dtype=float) # Battery voltage
-        self.data_rate  = np.zeros(size, dtype=float) # data rate in/out of the system
-        self.ssd        = np.zeros(size, dtype=float) # Amount of data in the storage device
-        self.boxtemp    = np.zeros(size, dtype=float) # temperature from thermal 
+from    .monitor        import *
+from    .profiler       import *
+from    .cache          import *
 
-# ---
+import  os
+import  copy
+import  heapq
+import  time
+
+#################################################################################
 class Simulator:
-    def __init__(self, orbitals_f=None, modes_f=None, devices_f=None, comtable_f=None, initial_time=None, until=None, verbose=False):
+    def __init__(self, orbitals_f=None, modes_f=None, devices_f=None, comtable_f=None, initial_time=None, until=None, verbose=False,
+                 overrides=None, orbitals_data=None, monitor_f=None, monitor_chunk=4096,
+                 monitor_channels=None, monitor_dtype=None, monitor_window=False, profile=False, orbitals_window=False,
+                 orbitals_cache=None):
+        """ The modes and devices can be given as file names, or as dictionaries with the same content.
+
+            Keyword arguments:
+            overrides -- a dictionary of values replacing those read from the devices or modes configuration,
+                         with keys as dotted paths, e.g. {'battery.capacity': 200.0, 'command_generation.night.duty': '0.3 0.7'}
+            orbitals_data -- the pair (deltaT, data array) to be used instead of reading orbitals_f
+            monitor_f -- stream the Monitor output to this HDF5 file (see StreamMonitor) instead of keeping it in memory
+            monitor_chunk -- the number of time steps buffered by the streaming Monitor
+            monitor_channels -- the names of the Monitor channels to record, see CHANNELS in monitor.py (default: Monitor.channels)
+            monitor_dtype -- the dtype of the floating point Monitor channels, e.g. np.float32 (default: float)
+            monitor_window -- allocate the Monitor arrays for the simulated window only, rather than the whole orbitals
+                              time axis; element 0 is then the time index monitor.start
+            profile -- measure the time spent in the sections of the simulation and count the interpolator
+                       evaluations and the SimPy events, see Profiler; the report is in self.profiler
+            orbitals_window -- read only the rows of the orbitals file around [initial_time, until), see read_orbitals.
+                               The time indices, including initial_time and until, then count from the first row
+                               read, which is the row orbitals_offset of the file
+            orbitals_cache -- directory of the orbitals cache (see cache.py): the orbitals and the derived Sun
+                              quantities are memory-mapped from there, and cached first if needed
+        """
     
         # Will be read from the "devices" file later, create placeholders:
         self.battery_config = None
@@ -46,8 +61,11 @@ class Simulator:
 
         # Stubs for the Orbitals data
         self.sun        = None
-        self.lpf        = None
-        self.bge        = None
+        self.sats       = {} # the satellites, see the 'lpf' and 'bge' properties
+        self.comm_series= {} # the adaptive data rates, see comm_rates
+        self.pass_index = {} # see passes
+        self.orbitals   = None
+        self.orbitals_offset = 0
         
         # Stubs for other stuff
         self.modes      = None
@@ -58,6 +76,22 @@ class Simulator:
         # Metadata to be read with orbitals; can add more if needed
         self.deltaT     = None
 
+        self.overrides      = overrides if overrides is not None else {}
+        self.orbitals_data  = orbitals_data
+        self.orbitals_window= orbitals_window
+        self.orbitals_cache = orbitals_cache
+        self.overridden     = set()
+
+        self.initial_time   = initial_time
+        self.until          = until
+
+        self.monitor_f      = monitor_f
+        self.monitor_chunk  = monitor_chunk
+        self.monitor_channels = monitor_channels
+        self.monitor_dtype  = monitor_dtype
+        self.monitor_window = monitor_window
+        self.forks          = 0 # the number of branches made by fork, for the names of their Monitor files
+
         # ---
         # Read all inputs
         self.read_orbitals()
@@ -66,23 +100,37 @@ class Simulator:
 
         if comtable_f is not None: self.read_comtable()
 
-        self.initial_time   = initial_time
-        self.until          = until
+        unknown = set(self.overrides) - self.overridden
+        if unknown:
+            print(f'''Overrides not found in the devices or modes configuration: {sorted(unknown)}''')
+            raise KeyError
 
-        if initial_time is not None:
-            self.env = simpy.Environment(initial_time=initial_time)
+        if self.initial_time is not None:
+            self.env = simpy.Environment(initial_time=self.initial_time)
         else:
             self.env = simpy.Environment()
 
         self.populate()
 
         self.create_command_table = False
+        self.resumed = False # the simulation continues from an earlier state: a checkpoint, or a previous call of simulate
+
+        self.profiler = Profiler() if profile else None
+        if self.profiler: self.profiler.attach(self)
 
         self.env.process(self.run()) # Set the callback to this class, for simpy
 
     # ---
     def populate(self): # Add hardware and the monitor to keep track of the sim
-        self.monitor    = Monitor(self.sun.N) # 'sun' is used to define the discrete time axis
+        start   = int(self.env.now)
+        options = {'channels': self.monitor_channels, 'dtype': self.monitor_dtype, 'columns': self.device_names}
+        if self.monitor_f is not None:
+            self.monitor = StreamMonitor(self.monitor_f, self.sun.mjd, start=start, chunk=self.monitor_chunk, meta=self.run_meta(), **options)
+        elif self.monitor_window:
+            stop = self.until if self.until is not None else self.sun.N
+            self.monitor = Monitor(stop-start, start=start, **options)
+        else:
+            self.monitor = Monitor(self.sun.N, **options) # 'sun' is used to define the discrete time axis
 
         self.battery    = Battery(self.battery_config)
         if self.verbose: print(f'''Created a Battery with initial charge: {self.battery.level}, capacity: {self.battery.capacity}''')
@@ -100,37 +148,71 @@ class Simulator:
         """ Read previously calculated data on the coordinates of the Sun and the Satellites.
             The file name is expected to be provides in the attribute orbitals_f.
             The format is HDF5, and it contains two section, metadata and payload (orbitals).
+
+            Only the Sun and LPF columns are read here, the BGE columns are read when first needed.
+            With orbitals_window, only the rows around the simulated window are read: the margin
+            on either side includes a sunrise or sunset (unless the file ends before), so that the
+            lunar clock and the quantities derived from it are the same as with the whole file.
+            With orbitals_cache, the whole array and the derived Sun quantities are memory-mapped from the cache,
+            and with orbitals_window as well, the same rows of both are used.
         """        
 
-        f = h5py.File(self.orbitals_f, "r")
+        derived = None
+        if self.orbitals_data is not None: # already loaded, e.g. shared between processes
+            self.deltaT, da = self.orbitals_data
+        elif self.orbitals_cache is not None:
+            self.deltaT, da, derived = read_orbitals_cache(self.orbitals_f, self.orbitals_cache, self.verbose)
+            if self.orbitals_window and self.initial_time is not None:
+                lo, hi = orbitals_window_bounds(da[:,1], self.deltaT, self.initial_time, self.until)
+                da, derived = window_orbitals_cache(da, derived, lo, hi)
+                self.orbitals_offset = lo
+                self.initial_time -= self.orbitals_offset
+                if self.until is not None: self.until -= self.orbitals_offset
+        elif self.orbitals_window and self.initial_time is not None:
+            self.deltaT, self.orbitals_offset, da = read_orbitals_window(self.orbitals_f, self.initial_time, self.until, SUN_LPF_COLUMNS)
+            self.initial_time -= self.orbitals_offset
+            if self.until is not None: self.until -= self.orbitals_offset
+        else:
+            self.deltaT, da = read_orbitals_file(self.orbitals_f, SUN_LPF_COLUMNS)
+        if self.verbose: print(f'''Shape of the data payload: {da.shape}, first row: {self.orbitals_offset}''')
 
-        ds_meta = f["/meta/configuration"] # Expect YAML payload, saved in the configuraiton section
-        conf    = yaml.safe_load(ds_meta[0,])
-        self.deltaT  = conf['period']['deltaT']
+        # Inflate objects based on this array data:
+        self.orbitals = da
+        self.sun = Sun(da[:,0], da[:,1] , da[:,2], derived)
+        self.sats = {}
+        self.comm_series = {}
+        self.pass_index = {}
 
-        ds_data = f["/data/orbitals"]
-        da = np.array(ds_data[:]) # data array
-        if self.verbose: print(f'''Shape of the data payload: {da.shape}''')
+    # ---
+    def sat(self, name):
+        """ The Sat object for 'lpf' or 'bge', built on first use from the orbitals columns,
+            which are read from the file if they were not loaded with the Sun.
+        """
+        if name not in self.sats:
+            c = SAT_COLUMNS[name]
+            if self.orbitals.shape[1] >= c+3:
+                da = self.orbitals[:, c:c+3]
+            else:
+                da = read_orbitals_file(self.orbitals_f, slice(c, c+3), self.orbitals_offset, self.orbitals_offset+self.sun.N)[1]
+            self.sats[name] = Sat(self.sun.mjd, da[:,0], da[:,1], da[:,2])
+        return self.sats[name]
 
-        # Inflate objects based on this array data:
-        self.sun = Sun(da[:,0], da[:,1] , da[:,2])
-        
-        self.lpf = Sat(da[:,0], da[:,3] , da[:,4],da[:,5])
-        self.bge = Sat(da[:,0], da[:,6] , da[:,7],da[:,8])
+    lpf = property(lambda self: self.sat('lpf'))
+    bge = property(lambda self: self.sat('bge'))
 
     # ---
     def read_modes(self):
-        f = open(self.modes_f, 'r')
-        modes = yaml.safe_load(f)
+        modes = self.apply_overrides(load_yaml(self.modes_f))
         self.modes = modes['modes']
         self.comgen = modes['command_generation']
+        self.mode_names = list(self.modes.keys()) # a mode id is the index in this list
+        if self.devices: self.compile_tables()
 
     # ---
     def read_devices(self):
         """ Initialize devices using data read from the 'devices file' (YAML)
         """
-        f                       = open(self.devices_f, 'r')
-        profiles                = yaml.safe_load(f)  # "hold all" dictionary
+        profiles                = self.apply_overrides(load_yaml(self.devices_f))  # "hold all" dictionary
 
 
 
@@ -139,9 +221,11 @@ class Simulator:
             raise NotImplementedError
         
         comm_config = profiles['comm']  
+        # Without the adaptable rate, the UT runs at if_fixed.fixed_rate, which needs no satellite distance
         self.comm = Comm(max_rate_kbps=comm_config.get('if_adaptable', {}).get('max_rate_kbps'),
                          link_margin_dB=comm_config.get('if_adaptable', {}).get('link_margin_dB'),
-                         fixed_rate=comm_config.get('if_fixed', {}).get('fixed_rate'))  
+                         fixed_rate=comm_config.get('if_fixed', {}).get('fixed_rate'),
+                         adaptable_rate=comm_config.get('adaptable_rate', True))  
 
             
         power_consumer_devices  = profiles['power_consumers'].keys()
@@ -171,31 +255,71 @@ class Simulator:
         self.ssd_config     = profiles['ssd']
         self.thermal_config = profiles['thermal']
         self.panel_config   = profiles['solar_panels']
+
+        if self.modes is not None: self.compile_tables()
     
+    # ---
+    def apply_overrides(self, config):
+        """ Replace the values in the configuration dictionary for the overrides whose path
+            starts with one of its top-level keys.
+        """
+        for path, value in self.overrides.items():
+            keys = path.split('.')
+            if keys[0] not in config: continue
+            node = config
+            for k in keys[:-1]: node = node[k]
+            if keys[-1] not in node:
+                print(f'''Cannot override {path}: no such item in the configuration''')
+                raise KeyError
+            node[keys[-1]] = value
+            self.overridden.add(path)
+        return config
+
     # ---
     def read_comtable(self):
+        """ Read the command table and build its interval index: the start times sorted in
+            a NumPy array, with the matching entries and mode ids, see find_schedule and schedule_at.
+        """
         f = open(self.comtable_f, 'r')
         self.comtable = yaml.safe_load(f)
 
         for k in self.comtable.keys(): self.schedule[self.comtable[k]['start']] = k
         self.times = list(self.schedule.keys())
 
+        order                   = np.argsort(np.array(self.times, dtype=float), kind='stable')
+        self.schedule_mjd       = np.array(self.times, dtype=float)[order]
+        self.schedule_entries   = [self.comtable[self.schedule[self.times[i]]] for i in order]
+        self.schedule_modes     = np.array([self.mode_ids[e['mode']] for e in self.schedule_entries], dtype=int)
+        self.schedule_cursor    = 0
+
     # ---
     def find_schedule(self, clock):
-        l = len(self.times) - 1 
-        tmax = self.times[l]
-        if clock>=tmax:
-            return self.comtable[self.schedule[tmax]]
-
-        ndx = 0
-        for t in self.times:
-            if clock>=t:
-                ndx+=1
-            else:
-                theTime = self.times[ndx-1]
-                return self.comtable[self.schedule[theTime]]
-   
-        return None
+        """ The comtable entry in effect at the time 'clock' (MJD). The cursor remembers the
+            interval found last time, so that the monotonic clock of the simulation costs O(1)
+            per call; anything else is a binary search in the sorted start times.
+            Before the first entry, the last one applies.
+        """
+        mjd = self.schedule_mjd
+        ndx = self.schedule_cursor
+        if mjd[ndx]<=clock and (ndx+1==mjd.size or clock<mjd[ndx+1]):
+            return self.schedule_entries[ndx]
+
+        if ndx+2<mjd.size and mjd[ndx+1]<=clock<mjd[ndx+2]: # moved on to the next interval
+            ndx += 1
+        else:
+            ndx = int(np.searchsorted(mjd, clock, side='right')) - 1
+            if ndx<0: return self.schedule_entries[-1]
+
+        self.schedule_cursor = ndx
+        return self.schedule_entries[ndx]
+
+    # ---
+    def schedule_at(self, mjd):
+        """ Vectorized lookup in the command table: the mode ids (indices in mode_names)
+            in effect at each of the times in the array 'mjd'.
+        """
+        ndx = np.searchsorted(self.schedule_mjd, mjd, side='right') - 1 # -1 wraps to the last entry, like find_schedule
+        return self.schedule_modes[ndx]
 
     # ---
     def init_generate_schedule(self, myT):
@@ -269,25 +393,85 @@ class Simulator:
         self.last_state_day = day
         return sched
 
+    # --
+    def generate_schedule_array(self, ticks):
+        """ Vectorized equivalent of calling generate_schedule for each of the consecutive
+            time indices in 'ticks'. Returns the array of mode names and leaves the day/night
+            bookkeeping in the same state as the tick-by-tick calls would.
+        """
+
+        cfg = self.comgen
+        assert (cfg['algorithm'] == 'simple')
+        day_modes = cfg['day']['modes'].split()
+        day_duty = np.array([float(x) for x in cfg['day']['duty'].split()])
+        day_cycle = cfg['day']['cycle_hours']
+        assert(len(day_modes)==len(day_duty))
+        assert(day_duty.sum()==1.0)
+        assert(day_cycle>0)
+
+        night_modes = cfg['night']['modes'].split()
+        night_duty = np.array([float(x) for x in cfg['night']['duty'].split()])
+        night_cycle = cfg['night']['cycle_hours']
+        assert(len(night_modes)==len(night_duty))
+        assert(night_duty.sum()==1.0)
+        assert(night_cycle>0)
+
+        day     = self.sun.alt[ticks] > 0
+        mjd_now = self.sun.mjd[ticks]
+        n       = len(ticks)
+
+        # Each tick refers to the start of its own uninterrupted day or night period.
+        # The first tick is forced to be a transition unless a previous run left the bookkeeping.
+        switch      = np.empty(n, dtype=bool)
+        switch[0]   = ('last_state_day' not in self.__dict__) or (self.last_state_day != day[0])
+        switch[1:]  = day[1:] != day[:-1]
+        start       = np.maximum.accumulate(np.where(switch, np.arange(n), 0))
+        ref         = mjd_now[start]
+        if not switch[0]:
+            ref[start==0] = self.last_sunrise_mjd if day[0] else self.last_sunset_mjd
+
+        tick = np.where(day, (mjd_now - ref) / (day_cycle/24), (mjd_now - ref) / (night_cycle/24))
+        assert((tick>=0).all())
+        tick -= np.floor(tick)
+
+        # Same comparisons as in generate_schedule: 'cp>=tick' for the day, 'cp>tick' for the night
+        day_ndx     = np.searchsorted(np.cumsum(day_duty), tick, side='left')
+        night_ndx   = np.searchsorted(np.cumsum(night_duty), tick, side='right')
+        assert((day_ndx[day]<len(day_modes)).all() and (night_ndx[~day]<len(night_modes)).all())
+
+        modes = np.where(day, np.array(day_modes)[np.minimum(day_ndx, len(day_modes)-1)],
+                              np.array(night_modes)[np.minimum(night_ndx, len(night_modes)-1)])
+
+        self.last_state_day = day[-1]
+        if day.any():       self.last_sunrise_mjd   = ref[day][-1]
+        if (~day).any():    self.last_sunset_mjd    = ref[~day][-1]
+        return modes
+
      # ---
     def PFPS_custom(self, pwr):
         Pq = float(pwr[0])
         fact = float(pwr[1])
         pow = sum([self.devices[k].power() for k in pwr[2].strip().split('+')])
         return Pq + fact*pow
+
+    # ---
+    def PFPS_custom_terms(self):
+        """ The terms of the CUSTOM power of the PFPS in its current state: the constant power, the factor and
+            the names of the devices whose power it multiplies (see PFPS_custom), None if its power is fixed.
+        """
+        pwr_str = self.devices['PFPS'].power()
+        if type(pwr_str)==float: return None
+        pwr_str = pwr_str.split(',')
+        assert(pwr_str[0].strip()=='CUSTOM')
+        return float(pwr_str[1]), float(pwr_str[2]), pwr_str[3].strip().split('+')
     
     
     # ---
-    def power_out(self, verbose = False, conditions = [], mode = None, return_dict = False, get_heat = False):
-        pwr = 0.0
+    def device_powers(self, tx = False, get_heat = False):
+        """ Power (or internal heat) of each device in its current state, evaluated from the
+            device profiles. This is used to compile the lookup tables, see compile_tables.
+        """
         dct = {}
-        mode_save = self.current_mode
-
-        if mode is not None:
-            # temporarily change mode
-            self.set_mode(mode)
-
-        if verbose: print ("Mode: ", self.current_mode)
         for dk in self.devices.keys():
             # handle special cases first:
             # #1 If PFPS is under load and has custom mode
@@ -300,19 +484,90 @@ class Simulator:
                     assert(pwr_str[0].strip()=='CUSTOM')
                     cpower = self.PFPS_custom(pwr_str[1:])
             # #2 If UT is transmitting....
-            elif (dk=='UT') and ('TX' in conditions):
+            elif (dk=='UT') and tx:
                 cpower = self.devices[dk].power_tx(get_heat = get_heat)
             # the actual default case 
             else: 
                 cpower = self.devices[dk].power(get_heat = get_heat)
-            if verbose: print (f'     Device: {dk:12} : {cpower:4.2f} W')
-            if return_dict:
-                dct[dk] = cpower
-            else:
-                pwr += cpower
+            dct[dk] = cpower
+        return dct
+
+    # ---
+    def compile_tables(self):
+        """ Tabulate the power, the internal heat and the data rate for every mode, with the UT transmitting
+            or not (the second index of the tables, 0 or 1). The other conditions, i.e. day/night and charging,
+            only affect the power input. In the data rate table, the adaptive rate of the UT is not included
+            since it depends on the position of the satellite.
+
+            Per-device tables:  device_power_table, device_heat_table, device_rate_table  [mode, TX, device]
+            Totals:             power_table, heat_table, data_rate_table                  [mode, TX]
+            PFPS_custom_modes:  the terms of the CUSTOM power of the PFPS, by mode id, see PFPS_custom_terms
+        """
+
+        self.mode_ids       = {mode: i for i, mode in enumerate(self.mode_names)}
+        self.device_names   = list(self.devices.keys())
+
+        shape = (len(self.mode_names), 2, len(self.device_names))
+        self.device_power_table = np.zeros(shape)
+        self.device_heat_table  = np.zeros(shape)
+        self.device_rate_table  = np.zeros(shape)
+
+        self.power_table        = np.zeros(shape[:2])
+        self.heat_table         = np.zeros(shape[:2])
+        self.data_rate_table    = np.zeros(shape[:2])
+
+        self.mode_ut_on         = np.array([self.modes[mode]['UT'] == 'ON' for mode in self.mode_names])
+        self.mode_pcdu_on       = np.array([self.modes[mode]['PCDU'] == 'ON' for mode in self.mode_names])
+
+        self.PFPS_custom_modes  = {}
+
+        states = {dk: self.devices[dk].state for dk in self.device_names}
+
+        for mid, mode in enumerate(self.mode_names):
+            self.set_state(self.modes[mode])
+            custom = self.PFPS_custom_terms() if 'PFPS' in self.devices else None
+            if custom is not None: self.PFPS_custom_modes[mid] = custom
+            for tx in (0, 1):
+                powers  = self.device_powers(tx=tx)
+                heats   = self.device_powers(tx=tx, get_heat=True)
+                rates   = {dk: self.devices[dk].data_rate() for dk in self.device_names}
+                if tx: rates['UT'] = 0.0 if self.comm.adaptable_rate else self.comm.fixed_rate
+
+                # The totals are summed in the order of the devices, like the per-device loops used to
+                pwr, heat, dr = 0.0, 0.0, 0.0
+                for i, dk in enumerate(self.device_names):
+                    self.device_power_table[mid, tx, i] = powers[dk]
+                    self.device_heat_table[mid, tx, i]  = heats[dk]
+                    self.device_rate_table[mid, tx, i]  = rates[dk]
+                    pwr     += powers[dk]
+                    heat    += heats[dk]
+                    dr      += rates[dk]
+
+                self.power_table[mid, tx]       = pwr
+                self.heat_table[mid, tx]        = heat
+                self.data_rate_table[mid, tx]   = dr
+
+        for dk in self.device_names: self.devices[dk].state = states[dk]
+
+    # ---
+    def power_out(self, verbose = False, conditions = [], mode = None, return_dict = False, get_heat = False):
+        """ Total power (or internal heat) drawn in the current mode or the mode given as the argument,
+            looked up in the precompiled tables. With return_dict, the per-device breakdown is returned.
+        """
+        if mode is None: mode = self.current_mode
+        mid = self.mode_ids[mode]
+        tx  = int('TX' in conditions)
+
+        if verbose: print ("Mode: ", mode)
+        if verbose or return_dict:
+            table = self.device_heat_table if get_heat else self.device_power_table
+            dct = {dk: float(table[mid, tx, i]) for i, dk in enumerate(self.device_names)}
+            if verbose:
+                for dk, cpower in dct.items(): print (f'     Device: {dk:12} : {cpower:4.2f} W')
+
+        pwr = float((self.heat_table if get_heat else self.power_table)[mid, tx])
         if verbose: print (f'   Total power: {pwr:4.1f} W\n')
-        
-        self.set_mode(mode_save)
+
         return dct if return_dict else pwr
     
     # ---
@@ -328,25 +583,71 @@ class Simulator:
     
      # ---
     def data_rate(self,time_index,conditions=[]):
-        """ Calculate the total data rate, traversing over the device collection. """
-        dr = 0.0
-        for dk in self.devices.keys():
-            if dk=='UT' and 'TX' in conditions:
-                if not self.comm.adaptable_rate: 
-                    dr += self.comm.fixed_rate
-                else:                     
-                    zero_ext_gain = False
-                    
-                    adapt_rate, demo,pw = self.comm.get_rate(self.lpf.dist[time_index],(180/np.pi)*self.lpf.alt[time_index],max_rate_kbps= 
-                                                             self.comm.max_rate_kbps, demod_marg= self.comm.link_margin_dB, 
-                                                             zero_ext_gain=False)
-
-                    dr += adapt_rate 
-            else:
-                dr+=self.devices[dk].data_rate()
+        """ Calculate the total data rate: the tabulated rate for the current mode,
+            plus the adaptive rate of the UT if it is transmitting. """
+        tx = 'TX' in conditions
+        dr = self.data_rate_table[self.mode_ids[self.current_mode], int(tx)]
+
+        if tx and self.comm.adaptable_rate:
+            dr += self.comm_rate(time_index)
         
         return dr
 
+    # ---
+    def comm_rate(self, time_index):
+        """ The adaptive data rate of the UT link to LPF while transmitting, zero if the rate is fixed. """
+        if not self.comm.adaptable_rate: return 0.0
+        return self.comm_rates('lpf')[time_index]
+
+    # ---
+    def comm_rates(self, name):
+        """ The data rate of the link to the satellite 'name' over its whole trajectory, calculated on first use
+            with Comm.rate_series (adaptive rate) where the satellite is above COMM_MIN_ALT, zero elsewhere.
+        """
+        if name not in self.comm_series:
+            sat     = self.sat(name)
+            rates   = np.zeros(sat.N)
+            up      = sat.alt>COMM_MIN_ALT
+            if not self.comm.adaptable_rate:
+                rates[up] = self.comm.fixed_rate
+            elif np.any(up):
+                rates[up] = self.comm.rate_series(sat.dist[up], (180/np.pi)*sat.alt[up])[0]
+            self.comm_series[name] = rates
+        return self.comm_series[name]
+
+    # ---
+    def passes(self, name):
+        """ The index of the passes of the satellite 'name' above COMM_MIN_ALT (see Passes), with the data
+            volume which could be transmitted in each of them at the rate given by comm_rates. This is for the
+            analysis of the passes only: the TX condition is decided from the altitude at each tick (get_conditions,
+            prepare_series), which selects the same time steps as the passes of LPF.
+        """
+        if name not in self.pass_index:
+            self.pass_index[name] = self.sat(name).passes(COMM_MIN_ALT, self.comm_rates(name), self.deltaT)
+        return self.pass_index[name]
+
+    # ---
+    def contacts(self, time_index):
+        """ The satellites in view at the time index, with their data rate: {name: rate} """
+        result = {}
+        for name in SAT_COLUMNS:
+            if self.passes(name).at(time_index) >= 0: result[name] = float(self.comm_rates(name)[time_index])
+        return result
+
+    # ---
+    def monitor_extras(self, myT, mid, tx, comm_rate, ssd_dropped, ssd_wasted):
+        """ The values of the Monitor channels other than the state (see Monitor.tick) which are enabled,
+            for the time index myT (or an array of time indices) in the mode mid with the TX condition tx.
+        """
+        values = {'mode':           mid,
+                  'solar_power':    self.controller.power[myT],
+                  'comm_rate':      comm_rate,
+                  'ssd_dropped':    ssd_dropped,
+                  'ssd_wasted':     ssd_wasted,
+                  'device_power':   self.device_power_table[mid, tx],
+                  'device_heat':    self.device_heat_table[mid, 0]}
+        return {ch: values[ch] for ch in self.monitor.extras}
+
     # ---
     def set_mode (self,mode):
         self.current_mode = mode
@@ -385,6 +686,13 @@ class Simulator:
         print('------------------')
         print(f'''Day condition at start and end of the simulation: {self.sun.day[self.initial_time]}, {self.sun.day[self.until]}''')
 
+    def run_meta(self):
+        """ Description of the run, stored with the streamed Monitor output. """
+        source = lambda f: f if isinstance(f, (str, type(None))) else 'dictionary'
+        return {'orbitals': source(self.orbitals_f), 'modes': source(self.modes_f), 'devices': source(self.devices_f),
+                'comtable': source(self.comtable_f), 'initial_time': self.initial_time, 'until': self.until,
+                'deltaT': self.deltaT, 'overrides': self.overrides}
+
     def save_record(self, filename='simulator_log.yml'):
         """ Capture the generated state transition record.
             It's in the same format as the main command table.
@@ -397,7 +705,7 @@ class Simulator:
     def get_conditions(self, myT):
         conditions = []
         mode = self.current_mode
-        if (self.lpf.alt[myT]>0.1) and (self.modes[mode]['UT'] == 'ON'):
+        if (self.lpf.alt[myT]>COMM_MIN_ALT) and (self.modes[mode]['UT'] == 'ON'):
             conditions.append('TX')
 
         if (self.sun.alt[myT]>=0.0):
@@ -408,27 +716,183 @@ class Simulator:
             conditions.append('night')
         return conditions
 
+    ############################## Checkpoints #################################
+    # ---
+    def checkpoint(self, filename=None):
+        """ Capture the state of the simulation at the current time: the clock, the battery,
+            SSD and thermal state, the current mode, the bookkeeping of the schedule generator,
+            the record and the Monitor content so far. For a streamed Monitor, the content is in
+            its file, and the checkpoint holds the name of the file instead: the position in it is
+            the time of the checkpoint. Returns a dictionary which can be given to restore or fork,
+            and also writes it to the HDF5 file 'filename' if one is given.
+        """
+        now     = int(self.env.now)
+        stream  = isinstance(self.monitor, StreamMonitor)
+
+        cp = {'now':                    now,
+              'battery_level':          float(self.battery.level),
+              'battery_capacity':       float(self.battery.capacity),
+              'battery_temperature':    self.battery.temperature,
+              'ssd_level':              float(self.ssd.level),
+              'ssd_dropped':            float(self.ssd.dropped),
+              'ssd_wasted':             float(self.ssd.wasted),
+              'thermal_temperature':    float(self.thermal.temperature),
+              'current_mode':           self.__dict__.get('current_mode'),
+              'create_command_table':   bool(self.create_command_table),
+              'schedule_cursor':        int(self.__dict__.get('schedule_cursor', 0)),
+              'record':                 copy.deepcopy(self.record),
+              'monitor_start':          int(self.monitor.first if stream else self.monitor.start),
+              'monitor_channels':       list(self.monitor.channels),
+              'monitor_file':           os.path.abspath(self.monitor.filename) if stream else None,
+              'monitor':                self.monitor.snapshot(now)}
+
+        for k in SCHEDULE_STATE:
+            if k in self.__dict__: cp[k] = self.__dict__[k].item() if isinstance(self.__dict__[k], np.generic) else self.__dict__[k]
+
+        if filename is not None: write_checkpoint(filename, cp)
+        return cp
+
+    # ---
+    def restore(self, checkpoint):
+        """ Continue the simulation from a checkpoint (a dictionary made by 'checkpoint', or the name of
+            the file it was written to). The SimPy environment and the SSD are recreated at the time of the
+            checkpoint, and the next call of simulate() runs from there to 'until'.
+        """
+        cp  = read_checkpoint(checkpoint) if isinstance(checkpoint, str) else checkpoint
+        now = cp['now']
+
+        self.set_clock(now)
+
+        self.battery.level      = cp['battery_level']
+        self.battery.capacity   = cp['battery_capacity']
+        self.battery.set_temperature(cp['battery_temperature'])
+
+        self.ssd = SSD(self.env, dict(self.ssd_config, initial=cp['ssd_level']))
+        self.ssd.dropped, self.ssd.wasted = cp.get('ssd_dropped', 0.0), cp.get('ssd_wasted', 0.0)
+
+        self.thermal.temperature = cp['thermal_temperature']
+
+        if cp['current_mode'] is not None: self.set_mode(cp['current_mode'])
+        self.create_command_table   = cp['create_command_table']
+        self.schedule_cursor        = cp['schedule_cursor']
+        for k in SCHEDULE_STATE:
+            if k in cp: self.__dict__[k] = cp[k]
+            else:       self.__dict__.pop(k, None)
+
+        self.record  = copy.deepcopy(cp['record'])
+        self.monitor = self.restore_monitor(cp)
+
+        self.resumed = cp['current_mode'] is not None
+
+    # ---
+    def restore_monitor(self, cp):
+        """ The Monitor continuing from the checkpoint, of the kind populate makes for this Simulator (streamed
+            to monitor_f, or in memory over the whole time axis or the window), with the content up to the time
+            of the checkpoint. A stream to the file of the checkpoint is truncated there and continued; otherwise
+            the content is copied from the checkpoint, or from the file it was streamed to.
+        """
+        now     = cp['now']
+        start   = cp.get('monitor_start', 0)
+        source  = cp.get('monitor_file')
+        channels= self.monitor_channels if self.monitor_channels is not None else cp.get('monitor_channels')
+        options = {'channels': channels, 'dtype': self.monitor_dtype, 'columns': self.device_names}
+
+        if self.monitor_f is not None and source is not None and os.path.abspath(self.monitor_f) == source:
+            return StreamMonitor(self.monitor_f, self.sun.mjd, start=now, chunk=self.monitor_chunk, resume=True, **options)
+
+        if source is None:
+            prefix = cp['monitor']
+        else:
+            with MonitorReader(source) as reader: prefix = {ch: reader[ch][:now-start] for ch in reader.channels}
+
+        if self.monitor_f is not None:
+            monitor = StreamMonitor(self.monitor_f, self.sun.mjd, start=start, chunk=self.monitor_chunk, meta=self.run_meta(), **options)
+        elif self.monitor_window:
+            stop    = self.until if self.until is not None else self.sun.N
+            monitor = Monitor(stop-start, start=start, **options)
+        else:
+            monitor = Monitor(self.sun.N, **options)
+
+        rows = now - start
+        monitor.store(start, **{ch: prefix[ch][:rows] if ch in prefix else np.zeros((rows,)+getattr(monitor, ch).shape[1:])
+                                for ch in monitor.channels})
+        return monitor
+
+    # ---
+    def fork(self, checkpoint=None, monitor_f=None):
+        """ A new Simulator continuing from the checkpoint (by default, the current state), e.g. for
+            what-if branches sharing the prefix of a run. The orbitals, the configuration, the lookup tables
+            and the solar power are shared with this Simulator; the devices and the state are copied.
+            The branch streams its Monitor to the file monitor_f, starting with a copy of the prefix;
+            by default, the branches of a streamed run stream to '<name>-fork<k><ext>' next to its file.
+        """
+        if checkpoint is None: checkpoint = self.checkpoint()
+        if monitor_f is None and self.monitor_f is not None:
+            self.forks  += 1
+            root, ext   = os.path.splitext(self.monitor_f)
+            monitor_f   = f'''{root}-fork{self.forks}{ext}'''
+
+        branch          = copy.copy(self)
+        branch.monitor_f= monitor_f
+        branch.forks    = 0
+        branch.devices  = copy.deepcopy(self.devices)
+        branch.battery  = copy.copy(self.battery)
+        branch.thermal  = copy.copy(self.thermal)
+        branch.restore(checkpoint)
+        return branch
+
+    # ---
+    def set_clock(self, now):
+        """ Recreate the SimPy environment at the time index 'now', with the SimPy process, e.g. after
+            an engine which does not use SimPy events, so that the next call of simulate() starts there.
+        """
+        self.env = simpy.Environment(initial_time=now)
+        if self.profiler: self.profiler.count_events(self.env)
+        self.env.process(self.run())
+
     ############################## Simulation code #############################
     # ---
-    def simulate(self, create_command_table = False):
+    def simulate(self, create_command_table = False, engine = 'simpy'):
         """ Steeting of the SimPy simulation process, relying on
-            the 'run' method previous set in the SimPy environment"""
+            the 'run' method previous set in the SimPy environment.
+
+            Keyword arguments:
+            create_command_table -- generate the schedule on the fly instead of using the comtable
+            engine -- 'simpy' (default, one SimPy event per tick), 'vector' (see run_vector) or 'event' (see run_event)
+        """
         
+        t0 = time.perf_counter()
         self.create_command_table = create_command_table
-        if create_command_table:
+        if create_command_table and not self.resumed:
             myT     = int(self.env.now)
             self.init_generate_schedule(myT)
 
-        if self.until is not None:
+        if engine == 'vector':
+            self.run_vector()
+        elif engine == 'event':
+            self.run_event()
+        elif engine != 'simpy':
+            print(f'''Unknown simulation engine: {engine}''')
+            raise NotImplementedError
+        elif self.until is not None:
             self.env.run(until=self.until) # 17760
         else:
             self.env.run()
+
+        self.resumed = 'current_mode' in self.__dict__ # a further call of simulate continues from here
+        self.monitor.flush()
+        if self.profiler: self.profiler.total += time.perf_counter() - t0
     # ---
     def run(self): # SimPy machinery: print(f'''Clock: {self.sun.mjd[myT]}, power: {Panel.profile[myT]}''')
-        mode = None
-        cnt = 0
+        mode = self.current_mode if self.resumed else None # no transition is recorded when resuming in the same mode
+        mid  = self.mode_ids[mode] if mode is not None else None
+        cnt  = len(self.record)
+        monitor = self.monitor
+        voltage = 'battery_V' in monitor.channels # the voltage is only needed for the Monitor
+        prof    = self.profiler
 
         while True:
+            if prof: t = time.perf_counter()
             myT     = int(self.env.now)
             clock   = self.sun.mjd[myT]
             self.myT = myT
@@ -443,6 +907,7 @@ class Simulator:
             if md!=mode:
                 mode = md
                 self.set_mode(mode)
+                mid = self.mode_ids[mode]
 
                 if self.verbose:
                     print(f'''Clock:{clock}, mode: {mode}''')
@@ -452,16 +917,19 @@ class Simulator:
                 cnt+=1
                 
                 battery_fill = float(self.battery.level/self.battery.capacity)
-                ssd_fill = self.ssd.level/self.ssd.capacity
+                ssd_fill = float(self.ssd.level/self.ssd.capacity)
                 self.record[cnt] = {'start': float(clock), 
                                     'mode': mode,
                                     'battery_expected_fill': battery_fill,
                                     'ssd_expected_fill': ssd_fill}
 
+            if prof: t = prof.lap('schedule', t)
             conditions = self.get_conditions(myT)                
 
+            tx = int('TX' in conditions)
+
             # Electrical section:
-            self.monitor.power[myT] = self.power_out(conditions=conditions)
+            power = self.power_table[mid, tx]
 
             # put charge into battery if BMS is enabled
             if ('charging' in conditions): 
@@ -469,24 +937,386 @@ class Simulator:
             else:
                 power_in = 0.0
             # Draw charge from battery
-            power_out = self.power_out()
+            power_out = self.power_table[mid, 0]
             self.battery.set_temperature(20) ## fix once we have thermal
             self.battery.apply_power(power_in - power_out, self.deltaT)
             self.battery.apply_age(self.deltaT)
-            self.monitor.battery_SOC[myT]   = self.battery.level/self.battery.capacity
-            self.monitor.battery_V[myT]     = self.battery.Voltage()
+            battery_SOC = self.battery.level/self.battery.capacity
+            battery_V   = self.battery.Voltage() if voltage else 0.0
+            if prof: t = prof.lap('electrical', t)
 
             # Data section
             ## first are we communicating:
-            data_rate = self.data_rate(conditions=conditions, time_index=myT)    
-            self.monitor.data_rate[myT] = data_rate
-            self.ssd.change(data_rate*self.deltaT)
-            self.monitor.ssd[myT]       = self.ssd.level/self.ssd.capacity
+            comm_rate = self.comm_rate(myT) if tx else 0.0
+            data_rate = self.data_rate_table[mid, tx] + comm_rate
+            dropped, wasted = self.ssd.change(data_rate*self.deltaT)
+            ssd_fill    = self.ssd.level/self.ssd.capacity
+            if prof: t = prof.lap('data', t)
 
             # Thermal section
-            heat = self.power_out(get_heat=True)
+            heat = self.heat_table[mid, 0]
             self.thermal.evolve (heat, self.sun.alt[myT]/np.pi*180.0, self.deltaT)
-            self.monitor.boxtemp[myT]   = self.thermal.temperature
+            if prof: t = prof.lap('thermal', t)
+
+            monitor.tick(myT, power, battery_SOC, battery_V, data_rate, ssd_fill, self.thermal.temperature)
+            if monitor.extras: monitor.extra(myT, **self.monitor_extras(myT, mid, tx, comm_rate, dropped, wasted))
+            if prof: prof.lap('bookkeeping', t)
 
             yield self.env.timeout(1)
 
+    # ---
+    def mode_timeline(self, ticks):
+        """ Mode ids (indices in self.mode_names) for the array of time indices 'ticks',
+            taken either from the command table or from the schedule generator.
+        """
+
+        if not self.create_command_table: return self.schedule_at(self.sun.mjd[ticks])
+
+        names = self.generate_schedule_array(ticks)
+        unique, inverse = np.unique(names, return_inverse=True)
+        return np.array([self.mode_ids[m] for m in unique], dtype=int)[inverse]
+
+    # ---
+    def prepare_series(self, ticks):
+        """ Everything that does not depend on the state of the battery, SSD and thermal model,
+            calculated as whole arrays over the time indices 'ticks' for the vector and event engines:
+            mode ids, TX and charging masks, load power, net battery power, data rate and the
+            equilibrium temperature of the thermal model.
+        """
+
+        mode_ids = self.mode_timeline(ticks)
+
+        # Condition masks, see get_conditions
+        tx          = (self.lpf.alt[ticks]>COMM_MIN_ALT) & self.mode_ut_on[mode_ids]
+        charging    = (self.sun.alt[ticks]>=0.0) & self.mode_pcdu_on[mode_ids]
+        txi         = tx.astype(int)
+
+        # Electrical section
+        power       = self.power_table[mode_ids, txi]
+        power_net   = np.where(charging, self.controller.power[ticks], 0.0) - self.power_table[mode_ids, 0]
+
+        # Data section
+        data_rate   = self.data_rate_table[mode_ids, txi]
+        comm_rate   = np.zeros(ticks.size)
+        if self.comm.adaptable_rate:
+            comm_rate[tx] = self.comm_rates('lpf')[ticks[tx]]
+            data_rate += comm_rate
+
+        # Thermal section: equilibrium temperature for the whole window in one interpolation
+        Teq         = self.thermal.equilibrium(self.sun.alt[ticks]/np.pi*180.0, self.heat_table[mode_ids, 0])
+
+        return {'mode_ids': mode_ids, 'tx': tx, 'charging': charging, 'power': power,
+                'power_net': power_net, 'data_rate': data_rate, 'comm_rate': comm_rate, 'Teq': Teq}
+
+    # ---
+    def record_mode(self, myT, mode_id, ssd_level):
+        """ Add a mode transition to the record, like the SimPy process does. """
+        clock = self.sun.mjd[myT]
+        mode  = self.mode_names[mode_id]
+        if self.verbose: print(f'''Clock:{clock}, mode: {mode}''')
+        self.record[len(self.record)+1] = {'start': float(clock),
+                                           'mode': mode,
+                                           'battery_expected_fill': float(self.battery.level/self.battery.capacity),
+                                           'ssd_expected_fill': float(ssd_level/self.ssd.capacity)}
+
+    # ---
+    def run_vector(self):
+        """ Alternative to the SimPy process in 'run'. The mode timeline, the conditions and the
+            load power, heat and data rate series are calculated as whole arrays over the time window,
+            and only the stateful recurrences (battery, thermal) are stepped in a scalar loop; the SSD
+            is updated over the whole window at once (SSD.change_span).
+
+            The Monitor content and the record of state transitions are the same as with the SimPy engine:
+            the series are read from the same lookup tables, and the recurrences are stepped in the same
+            order. The start of the window counts as a mode transition, unless the simulation continues
+            in the same mode. At the end, the SimPy clock is moved to the end of the window.
+        """
+
+        start   = int(self.env.now)
+        stop    = self.until if self.until is not None else self.sun.N
+        ticks   = np.arange(start, stop)
+        n       = ticks.size
+        if n == 0: return
+
+        prof        = self.profiler
+        if prof: t  = time.perf_counter()
+        series      = self.prepare_series(ticks)
+        if prof: t  = prof.lap('series', t)
+        mode_ids    = series['mode_ids']
+        power_net   = series['power_net']
+        data_delta  = series['data_rate']*self.deltaT
+        Teq         = series['Teq']
+        decay       = self.thermal.decay(self.deltaT)
+
+        change      = np.ones(n, dtype=bool)
+        change[1:]  = mode_ids[1:] != mode_ids[:-1]
+        change[0]   = not self.resumed or self.current_mode != self.mode_names[mode_ids[0]]
+
+        # The stateful part
+        battery     = self.battery
+        soc         = np.zeros(n)
+        voltage     = np.zeros(n)
+        boxtemp     = np.zeros(n)
+
+        temperature = self.thermal.temperature
+        record_V    = 'battery_V' in self.monitor.channels # the voltage is only needed for the Monitor
+
+        ssd_before  = self.ssd.level
+        ssd_level, dropped, wasted = self.ssd.change_span(data_delta)
+        fill        = ssd_level/self.ssd.capacity
+        ssd_at      = {i: (ssd_level[i-1] if i > 0 else ssd_before) for i in np.flatnonzero(change).tolist()} # for the record
+
+        for i in range(n):
+            temperature = Teq[i] + (temperature-Teq[i])*decay
+            boxtemp[i]  = temperature
+
+        # The battery, in spans between the mode transitions
+        battery.set_temperature(20) ## fix once we have thermal
+        bounds = np.flatnonzero(change).tolist()
+        if not bounds or bounds[0] > 0: bounds.insert(0, 0)
+        for a, b in zip(bounds, bounds[1:] + [n]):
+            if change[a]: self.record_mode(ticks[a], mode_ids[a], ssd_at[a])
+            battery.apply_power_series(power_net[a:b], self.deltaT, soc[a:b], voltage[a:b] if record_V else None)
+        if prof: t = prof.lap('state', t)
+
+        self.monitor.store(start, power=series['power'], battery_SOC=soc, battery_V=voltage,
+                           data_rate=series['data_rate'], ssd=fill, boxtemp=boxtemp,
+                           **self.monitor_extras(ticks, mode_ids, series['tx'].astype(int), series['comm_rate'], dropped, wasted))
+        if prof: prof.lap('bookkeeping', t)
+
+        self.thermal.temperature    = temperature
+        self.myT = ticks[-1]
+        self.set_mode(self.mode_names[mode_ids[-1]])
+        self.set_clock(stop)
+
+    # ---
+    def run_event(self):
+        """ Event-driven engine. The event queue holds the mode transitions and the changes of the
+            day/night, TX and charging conditions, as well as the rise and set of LPF and BGE.
+            Between two events the discrete state is constant, and the battery and the SSD are
+            advanced over the whole span, see advance_battery and advance_ssd: without the solar
+            input, the battery is integrated over the span at once, so that the cost of the night
+            scales with the number of events rather than time steps. Reaching a threshold (battery
+            full or empty, SSD full or empty) is also logged as an event. The thermal model is
+            relaxed over the whole window at once (Thermal.relax_span).
+
+            This is a span-batched tick engine rather than a purely event-driven one: the Monitor holds
+            one value per tick, so the series of prepare_series and the output arrays are O(N) in the
+            number of ticks, the SSD is advanced by SSD.change_span (array operations over each span,
+            which return the level at every tick), and with the solar input the battery is stepped
+            tick by tick. Only the spans of constant battery power cost less than their length.
+
+            Events are logged in 'event_log' as (MJD, kind) pairs, the day/night changes and the rise and
+            set of the satellites at the MJD of the crossing of the horizon. The output agrees with the
+            SimPy engine to the tolerances of the integration of the battery (see Battery.integrate) and
+            of Thermal.relax_span, see test/engine_test.py; the rest is the same.
+        """
+
+        start   = int(self.env.now)
+        stop    = self.until if self.until is not None else self.sun.N
+        ticks   = np.arange(start, stop)
+        n       = ticks.size
+        if n == 0: return
+
+        prof        = self.profiler
+        if prof: t  = time.perf_counter()
+        series      = self.prepare_series(ticks)
+        if prof: t  = prof.lap('series', t)
+        mode_ids    = series['mode_ids']
+        charging    = series['charging']
+
+        # The event queue: (index in the window, kind, MJD). The sunrise and sunset and the rise and set of
+        # the satellites are logged at their precise MJD (see horizon_crossings), the others at the time step
+        mjd   = lambda i: float(self.sun.mjd[ticks[i]])
+        queue = [(0, 'mode', mjd(0))] if not self.resumed or self.current_mode != self.mode_names[mode_ids[0]] else []
+        for kind, mask in (('mode', mode_ids), ('tx', series['tx']), ('charging', charging)):
+            queue += [(int(i), kind, mjd(i)) for i in np.flatnonzero(mask[1:] != mask[:-1]) + 1]
+        for kind, body in (('sun', self.sun), ('lpf', self.lpf), ('bge', self.bge)):
+            inside = (body.crossings>=start) & (body.crossings<stop-1)
+            queue += [(int(i), kind, float(m)) for i, m in zip(body.crossings[inside] - start + 1, body.mjd_crossings[inside])]
+        heapq.heapify(queue)
+
+        self.event_log = []
+        soc         = np.zeros(n)
+        voltage     = np.zeros(n)
+        fill        = np.zeros(n)
+        dropped     = np.zeros(n)
+        wasted      = np.zeros(n)
+        ssd_state   = [False, False] # dropping, wasting
+
+        # The net power of the battery only changes with the mode and the charging condition: the battery
+        # is advanced in the spans between these events, up to the index b
+        b = 0
+        battery_span = lambda i, j: self.advance_battery(series['power_net'][i:j], soc[i:j], voltage[i:j], ticks[i:j], constant=not charging[i])
+
+        self.battery.set_temperature(20) ## fix once we have thermal
+        if not queue or queue[0][0] > 0: heapq.heappush(queue, (0, 'start', mjd(0))) # the first span has to start at 0
+        while queue:
+            i = queue[0][0]
+            events = []
+            while queue and queue[0][0] == i: events.append(heapq.heappop(queue))
+            if b < i and any(kind in ('mode', 'charging') for _, kind, _ in events):
+                battery_span(b, i)
+                b = i
+            for _, kind, when in events:
+                if kind != 'start': self.event_log.append((when, kind))
+                if kind == 'mode': self.record_mode(ticks[i], mode_ids[i], self.ssd.level)
+
+            j = queue[0][0] if queue else n
+            self.advance_ssd(ssd_state, series['data_rate'][i:j]*self.deltaT, fill[i:j], dropped[i:j], wasted[i:j], ticks[i:j])
+        battery_span(b, n)
+        if prof: t = prof.lap('events', t)
+
+        boxtemp = self.thermal.relax_span(series['Teq'], self.deltaT)
+        if prof: t = prof.lap('thermal', t)
+
+        self.monitor.store(start, power=series['power'], battery_SOC=soc, battery_V=voltage,
+                           data_rate=series['data_rate'], ssd=fill, boxtemp=boxtemp,
+                           **self.monitor_extras(ticks, mode_ids, series['tx'].astype(int), series['comm_rate'], dropped, wasted))
+        if prof: prof.lap('bookkeeping', t)
+
+        self.event_log.sort()
+        self.myT = ticks[-1]
+        self.set_mode(self.mode_names[mode_ids[-1]])
+        self.set_clock(stop)
+
+    # ---
+    def advance_battery(self, power_net, soc, voltage, ticks, constant=False):
+        """ Apply the net power to the battery over a span of ticks, filling the SOC and voltage arrays.
+            If the net power is constant over the span (no solar input) and the span is at least EVENT_SPAN ticks
+            long, the charge is integrated over the whole span at once (Battery.apply_power_span_series), the
+            continuous limit of the steps of the other engines. Otherwise the ticks are stepped one by one, which
+            costs less for short spans, except once the battery is full and
+            keeps being charged, or is empty and keeps being discharged: the level then follows the capacity
+            (or stays at zero) and only the ageing remains, which is applied in bulk. Reaching either
+            threshold is logged as an event.
+        """
+        battery = self.battery
+        record_V= 'battery_V' in self.monitor.channels
+        if constant and power_net.size >= EVENT_SPAN:
+            reached = battery.apply_power_span_series(power_net[0], self.deltaT, soc, voltage if record_V else None, rtol=EVENT_RTOL)
+            if reached:
+                kind = 'battery_full' if power_net[0] > 0 else 'battery_empty'
+                self.event_log.append((float(self.sun.mjd[ticks[0]]) + reached/86400.0, kind))
+            return
+
+        loss    = np.exp(-self.deltaT/battery.discharge_tau)
+        m       = power_net.size
+        k       = 0
+        while k < m:
+            full    = battery.level == battery.capacity and power_net[k] > 0
+            empty   = battery.level == 0 and power_net[k] <= 0
+            if full or empty:
+                regime      = power_net[k:] > 0 if full else power_net[k:] <= 0
+                end         = k + (int(np.argmin(regime)) if not regime.all() else regime.size)
+                capacity    = np.cumprod(np.concatenate(([battery.capacity], np.full(end-k, loss))))
+                battery.capacity = capacity[-1]
+                battery.level    = capacity[-1] if full else 0.0
+                soc[k:end]       = 1.0 if full else 0.0
+                if record_V: voltage[k:end] = battery.Voltage()
+                k = end
+                continue
+
+            battery.apply_power(power_net[k], self.deltaT)
+            battery.apply_age(self.deltaT)
+            soc[k]      = battery.level/battery.capacity
+            if record_V: voltage[k] = battery.Voltage()
+            if battery.level == battery.capacity:   self.event_log.append((float(self.sun.mjd[ticks[k]]), 'battery_full'))
+            elif battery.level == 0:                self.event_log.append((float(self.sun.mjd[ticks[k]]), 'battery_empty'))
+            k += 1
+
+    # ---
+    def advance_ssd(self, state, delta, fill, dropped, wasted, ticks):
+        """ Apply the data volume changes 'delta' to the SSD over a span of ticks in one call (see
+            SSD.change_span), filling the arrays of the fill and of the data dropped and wasted.
+            The state is the pair [dropping, wasting] at the end of the previous span: the ticks at
+            which data starts being dropped (SSD full) or wasted (SSD empty) are logged as events.
+        """
+        level, dropped[:], wasted[:] = self.ssd.change_span(delta)
+        fill[:] = level/self.ssd.capacity
+        for k, (kind, amounts) in enumerate((('ssd_full', dropped), ('ssd_empty', wasted))):
+            on      = amounts > 0
+            starts  = np.flatnonzero(on & ~np.concatenate(([state[k]], on[:-1])))
+            self.event_log += [(float(self.sun.mjd[ticks[f]]), kind) for f in starts]
+            state[k] = bool(on[-1])
+
+#################################################################################
+SCHEDULE_STATE = ('last_state_day', 'last_day_state', 'last_sunrise_mjd', 'last_sunset_mjd', 'last_comm') # see generate_schedule
+
+# ---
+def load_yaml(source):
+    """ Configuration from a YAML file, or a copy of a dictionary that was already loaded. """
+    if isinstance(source, dict): return copy.deepcopy(source)
+    with open(source, 'r') as f: return yaml.safe_load(f)
+
+# ---
+SUN_LPF_COLUMNS = slice(0, 6)                   # mjd, Sun alt/az, LPF alt/az/dist
+SAT_COLUMNS     = {'lpf': 3, 'bge': 6}          # the first of the alt/az/dist columns
+WINDOW_MARGIN   = 16                            # days, a little over half of the lunar day
+COMM_MIN_ALT    = 0.1                           # radians, the altitude of the satellite needed to transmit
+EVENT_SPAN      = 128                           # time steps, the shortest span of constant battery power integrated at once by run_event
+EVENT_RTOL      = 1e-7                          # the relative tolerance of that integration, below its difference with the steps
+
+# ---
+def read_orbitals_file(filename, columns=slice(None), start=0, stop=None):
+    """ Read the orbitals HDF5 file, returning the time step and the data array.
+        Optionally, only the given columns and rows [start, stop) are read (a hyperslab).
+    """
+    with h5py.File(filename, "r") as f:
+        ds_meta = f["/meta/configuration"] # Expect YAML payload, saved in the configuraiton section
+        conf    = yaml.safe_load(ds_meta[0,])
+        ds_data = f["/data/orbitals"]
+        return conf['period']['deltaT'], np.array(ds_data[start:stop, columns]) # data array
+
+# ---
+def read_orbitals_window(filename, start, stop=None, columns=slice(None)):
+    """ Read the rows of the orbitals file covering the time indices [start, stop) and a margin on
+        either side, which is extended until it includes a crossing of the horizon by the Sun, or
+        reaches the end of the file. Returns the time step, the index of the first row read and the array.
+    """
+    with h5py.File(filename, "r") as f:
+        conf    = yaml.safe_load(f["/meta/configuration"][0,])
+        deltaT  = conf['period']['deltaT']
+        ds_data = f["/data/orbitals"]
+        lo, hi  = orbitals_window_bounds(ds_data, deltaT, start, stop, 1)
+        return deltaT, lo, np.array(ds_data[lo:hi, columns])
+
+# ---
+def orbitals_window_bounds(alt, deltaT, start, stop=None, column=None):
+    """ The rows [lo, hi) read by read_orbitals_window: the time indices [start, stop) and a margin on
+        either side, extended until it includes a crossing of the horizon by the Sun. The altitude of
+        the Sun is the array alt, or its given column (e.g. of the HDF5 dataset, read in slices).
+    """
+    N       = alt.shape[0]
+    stop    = N if stop is None else min(stop, N)
+    margin  = int(WINDOW_MARGIN*86400/deltaT)
+    rows    = (lambda a, b: alt[a:b]) if column is None else (lambda a, b: alt[a:b, column])
+    crosses = lambda a, b: np.count_nonzero(np.diff(np.signbit(rows(a, b)))) > 0
+
+    lo = max(0, start - margin)
+    while lo > 0 and not crosses(lo, start+1): lo = max(0, lo - margin)
+    hi = min(N, stop + margin)
+    while hi < N and not crosses(stop-1, hi): hi = min(N, hi + margin)
+    return lo, hi
+
+# ---
+def write_checkpoint(filename, cp):
+    """ Write a checkpoint to HDF5: the scalar state and the record as YAML in the 'meta' group,
+        the Monitor channels up to the time of the checkpoint in the 'monitor' group.
+    """
+    with h5py.File(filename, 'w') as f:
+        grp_meta = f.create_group('meta')
+        dt = h5py.string_dtype(encoding='utf-8')
+        ds_meta = grp_meta.create_dataset('state', (1,), dtype=dt)
+        ds_meta[0,] = yaml.dump({k: v for k, v in cp.items() if k != 'monitor'})
+
+        grp = f.create_group('monitor')
+        for ch, data in cp['monitor'].items(): grp.create_dataset(ch, data=data, compression="gzip")
+
+# ---
+def read_checkpoint(filename):
+    """ Read a checkpoint written by write_checkpoint. """
+    with h5py.File(filename, 'r') as f:
+        cp = yaml.safe_load(f['/meta/state'][0,])
+        cp['monitor'] = {ch: ds[:] for ch, ds in f['monitor'].items()}
+    return cp
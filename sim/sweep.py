@@ -0,0 +1,136 @@
+import  itertools
+import  multiprocessing as mp
+from    multiprocessing import shared_memory
+
+import  h5py
+import  numpy as np
+import  yaml
+
+from    .sim import Simulator, load_yaml, read_orbitals_file
+from    .cache import write_orbitals_cache
+
+#################################################################################
+# Parameter sweeps: many Simulator runs sharing the same orbitals, fanned out over
+# a pool of processes. The orbitals array is loaded once and placed in shared memory,
+# or, with an orbitals cache, memory-mapped by each worker from the cache (see cache.py);
+# the YAML configuration is parsed once and handed to the workers as dictionaries.
+
+_worker = {} # per-process state, set up by _attach
+
+# ---
+def scenarios(grid):
+    """ The Cartesian product of the grid, {path: [values]}, as a list of override dictionaries. """
+    paths = list(grid.keys())
+    return [dict(zip(paths, values)) for values in itertools.product(*[grid[p] for p in paths])]
+
+# ---
+def scenario_metrics(smltr, soc_threshold=0.2):
+    """ Summary of a finished run over its time window: minimum battery SOC, time spent below
+        the SOC threshold (hours), data volume (kB, the integral of the data rate), maximum SSD fill
+        and the final SOC.
+    """
+    start   = int(smltr.initial_time) if smltr.initial_time is not None else 0
+    stop    = smltr.until if smltr.until is not None else smltr.sun.N
+    m       = smltr.monitor
+    window  = slice(start-m.start, stop-m.start)
+    soc     = m.battery_SOC[window]
+    return {'min_soc':          float(soc.min()),
+            'hours_below':      float((soc<soc_threshold).sum()*smltr.deltaT/3600.),
+            'data_volume':      float(m.data_rate[window].sum()*smltr.deltaT),
+            'max_ssd_fill':     float(m.ssd[window].max()),
+            'final_soc':        float(soc[-1])}
+
+# ---
+def _attach(shm_name, shape, dtype, deltaT, base_config, soc_threshold):
+    _worker['orbitals_data']    = None # read from the orbitals cache
+    if shm_name is not None:
+        shm = shared_memory.SharedMemory(name=shm_name)
+        _worker['shm']              = shm # keep the mapping alive
+        _worker['orbitals_data']    = (deltaT, np.ndarray(shape, dtype=dtype, buffer=shm.buf))
+    _worker['base_config']      = base_config
+    _worker['soc_threshold']    = soc_threshold
+
+# ---
+def _run(overrides):
+    cfg     = _worker['base_config']
+    smltr   = Simulator(cfg['orbitals_f'], cfg['modes_f'], cfg['devices_f'], cfg.get('comtable_f'),
+                        initial_time=cfg.get('initial_time'), until=cfg.get('until'),
+                        overrides=overrides, orbitals_data=_worker['orbitals_data'], orbitals_cache=cfg.get('orbitals_cache'))
+    smltr.simulate(create_command_table=cfg.get('create_command_table', False), engine=cfg.get('engine', 'vector'))
+    return scenario_metrics(smltr, _worker['soc_threshold'])
+
+# ---
+def _map(jobs, points, initargs):
+    if jobs > 1:
+        with mp.Pool(jobs, initializer=_attach, initargs=initargs) as pool:
+            return pool.map(_run, points, chunksize=1)
+    _attach(*initargs)
+    metrics = [_run(p) for p in points]
+    _worker.clear()
+    return metrics
+
+# ---
+def sweep(base_config, grid, jobs=1, output=None, soc_threshold=0.2):
+    """ Run the simulation for every point of the parameter grid and collect the summary metrics.
+
+        Arguments:
+        base_config -- dictionary with the Simulator inputs: orbitals_f, modes_f, devices_f, and optionally
+                       comtable_f, initial_time, until, engine (default 'vector'), create_command_table
+                       and orbitals_cache, the directory of the orbitals cache to be used by the workers
+                       instead of shared memory
+        grid -- dictionary {dotted path: list of values}, see the 'overrides' of the Simulator
+        jobs -- number of worker processes
+        output -- optional name of the HDF5 file to write the result to
+        soc_threshold -- the SOC level for the 'hours_below' metric
+
+        Returns a dictionary of columns (NumPy arrays): one per grid parameter, then the metrics.
+    """
+
+    cfg = dict(base_config)
+    cfg['modes_f']      = load_yaml(cfg['modes_f'])
+    cfg['devices_f']    = load_yaml(cfg['devices_f'])
+    points              = scenarios(grid)
+
+    if cfg.get('orbitals_cache') is not None: # created once here, then memory-mapped by the workers
+        write_orbitals_cache(cfg['orbitals_f'], cfg['orbitals_cache'])
+        metrics = _map(jobs, points, (None, None, None, None, cfg, soc_threshold))
+    else:
+        deltaT, da = read_orbitals_file(cfg['orbitals_f'])
+        shm = shared_memory.SharedMemory(create=True, size=da.nbytes)
+        try:
+            np.ndarray(da.shape, dtype=da.dtype, buffer=shm.buf)[:] = da
+            metrics = _map(jobs, points, (shm.name, da.shape, da.dtype.str, deltaT, cfg, soc_threshold))
+        finally:
+            shm.close()
+            shm.unlink()
+
+    result = {}
+    for path in grid.keys():
+        values = [p[path] for p in points]
+        result[path] = np.array(values) if not isinstance(values[0], str) else np.array(values, dtype=object)
+    for name in (metrics[0].keys() if metrics else []):
+        result[name] = np.array([m[name] for m in metrics])
+
+    if output is not None: write_sweep(output, result, base_config)
+    return result
+
+# ---
+def write_sweep(filename, result, base_config):
+    """ Columnar HDF5 output: one dataset per column in the 'sweep' group,
+        and the base configuration (YAML) in the 'meta' group, as in the orbitals files.
+    """
+    with h5py.File(filename, 'w') as f:
+        grp_meta = f.create_group('meta')
+        dt = h5py.string_dtype(encoding='utf-8')
+        ds_meta = grp_meta.create_dataset('configuration', (1,), dtype=dt)
+        ds_meta[0,] = yaml.dump({k: v for k, v in base_config.items() if not isinstance(v, dict)})
+
+        grp = f.create_group('sweep')
+        for name, column in result.items():
+            grp.create_dataset(name, data=column.astype(dt) if column.dtype==object else column)
+
+# ---
+def read_sweep(filename):
+    """ Read back the columns written by write_sweep. """
+    with h5py.File(filename, 'r') as f:
+        return {name: (ds.asstr()[:] if h5py.check_string_dtype(ds.dtype) else ds[:]) for name, ds in f['sweep'].items()}
@@ -120,20 +120,36 @@ for T in [0, 20, 40]:
     result.extend([init_capacity, final_capacity, energy/3600])
 
 
-N1 = len(reference_data)
-N2 = len(result)
+# The same runs, integrating the charge over the whole discharge with time_to_soc and apply_power_span
+result_span = []
+
+for T in [0, 20, 40]:
+    B = Battery(config, verbose=verbose)
+    B.set_temperature(T)
+    for run in (0, 1):
+        B.level = init_level
+        init_capacity = B.capacity
+        duration = B.time_to_soc(-power, threshold)
+        B.apply_power_span(-power, duration)
+        if verbose: print (f'''Run {run} (span): temperature {T:2}C, init capacity {init_capacity:10.3f}, final capacity {B.capacity:10.3f}, total energy {(duration*power/3600):8.3f}Wh''')
+
+        result_span.extend([init_capacity, B.capacity, duration*power/3600])
 
-if N1!=N2:
-    if verbose: print(f'''Mismatch between reference data and result, N1={N1}, N2={N2}''')
-    exit(-3)
 
+N1 = len(reference_data)
 
-for i in range(N1):
-    # print(result[i], reference_data[i])
-    if (abs(result[i] - reference_data[i])/reference_data[i])>0.001:
-        if verbose: print('Mismatch between reference data and result')
+for res in (result, result_span):
+    N2 = len(res)
+    if N1!=N2:
+        if verbose: print(f'''Mismatch between reference data and result, N1={N1}, N2={N2}''')
         exit(-3)
 
+    for i in range(N1):
+        # print(res[i], reference_data[i])
+        if (abs(res[i] - reference_data[i])/reference_data[i])>0.001:
+            if verbose: print('Mismatch between reference data and result')
+            exit(-3)
+
 if verbose: print('Success!')
 
 exit(0)
@@ -0,0 +1,258 @@
+#! /usr/bin/env python
+#######################################################################
+# Benchmarks of the simulator and of the hardware models: the time
+# and peak memory at several input sizes, saved as JSON and compared
+# with a previously saved baseline to flag regressions
+#######################################################################
+
+import os
+import sys
+from sys import exit
+import argparse
+import json
+import time
+import platform
+import datetime
+import tracemalloc
+import tempfile
+import shutil
+import subprocess
+
+import numpy as np
+
+##############################################
+parser = argparse.ArgumentParser()
+
+parser.add_argument("-v", "--verbose",      action='store_true', help="Verbose mode")
+parser.add_argument("-o", "--output",       type=str,   default='',             help="Save the results to this JSON file")
+parser.add_argument("-b", "--baseline",     type=str,   default='',             help="JSON file with the baseline results to compare with")
+parser.add_argument("-t", "--tolerance",    type=float, default=0.25,           help="Relative slowdown flagged as a regression")
+parser.add_argument("-s", "--sizes",        type=str,   default='5000,15000,35000', help="Comma-separated input sizes for the hardware models")
+parser.add_argument("-e", "--engines",      type=str,   default='simpy,vector,event', help="Comma-separated simulation engines")
+parser.add_argument("-r", "--repeat",       type=int,   default=3,              help="Repetitions of the fast benchmarks, the best time is kept")
+parser.add_argument("-q", "--quick",        action='store_true', help="Simulate the first 4600 time steps of each orbitals file only")
+parser.add_argument("-k", "--only",         type=str,   default='',             help="Run only the benchmarks whose name contains this string")
+args    = parser.parse_args()
+
+verbose = args.verbose
+sizes   = [int(s) for s in args.sizes.split(',')]
+engines = args.engines.split(',')
+
+# ---
+try:
+    luseepy_path=os.environ['LUSEEPY_PATH']
+    if verbose: print(f'''The LUSEEPY_PATH is defined in the environment: {luseepy_path}, will be added to sys.path''')
+    sys.path.append(luseepy_path)
+except:
+    if verbose: print('The variable LUSEEPY_PATH is undefined, will rely on PYTHONPATH')
+
+# ---
+luseeopsim_path=''
+try:
+    luseeopsim_path=os.environ['LUSEEOPSIM_PATH']
+    if verbose: print(f'''The LUSEEOPSIM_PATH is defined in the environment: {luseeopsim_path}, will be added to sys.path''')
+    sys.path.append(luseeopsim_path)
+except:
+    if verbose: print('The variable LUSEEOPSIM_PATH is undefined, will rely on PYTHONPATH')
+    luseeopsim_path = '../'
+    sys.path.append(luseeopsim_path)  # Add parent to path, to enable running locally (also for data)
+
+from    sim         import Simulator, load_yaml, read_orbitals_file, write_orbitals_cache
+from    hardware    import Battery, Thermal, Comm, Controller, SSD
+from    nav         import Sun, Sat, horizon_crossings
+
+
+# -------------------------------------------------------------
+orbitals_dir    = luseeopsim_path + "/data/orbitals/"
+modes           = luseeopsim_path + "/config/modes.yml"
+devices         = luseeopsim_path + "/config/devices.yml"
+comtables       = {'20260110-20270116.hdf5': luseeopsim_path + "/config/comtable-20260110-20270115.yml"}
+orbitals_files  = sorted(f for f in os.listdir(orbitals_dir) if f.endswith('.hdf5'))
+
+profiles        = load_yaml(devices)
+deltaT, largest = max((read_orbitals_file(orbitals_dir + f) for f in orbitals_files), key=lambda x: x[1].shape[::-1]) # most columns, then rows
+
+results = []
+
+# ---
+def bench(name, size, func, setup=lambda: None, repeat=1):
+    """ Time func(state) with state=setup(), keeping the best of 'repeat' runs,
+        then measure the peak memory of one more run with tracemalloc.
+    """
+    if args.only and args.only not in name: return
+
+    best = None
+    for _ in range(repeat):
+        state = setup()
+        t = time.perf_counter()
+        func(state)
+        elapsed = time.perf_counter() - t
+        best = elapsed if best is None else min(best, elapsed)
+
+    state = setup()
+    tracemalloc.start()
+    func(state)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    result = {'name': name, 'size': size, 'time': best, 'ticks_per_s': size/best if best > 0 else float('inf'), 'peak_mb': peak/2**20}
+    results.append(result)
+    if verbose: print(f'''{name:48} {size:8d} {best:10.4f} s {result['ticks_per_s']:14.1f} /s {result['peak_mb']:10.2f} MB''')
+
+# ---
+def loop(n, step):
+    for i in range(n): step(i)
+
+# ---
+IMPORT_PROBE = '''
+import sys, time
+t = time.perf_counter()
+import sim
+print(time.perf_counter() - t, ' '.join(m for m in ('lusee', 'astropy', 'dateutil') if m in sys.modules))
+'''
+
+def bench_import(repeat):
+    """ Time 'import sim' in a fresh interpreter, keeping the best of 'repeat' runs, and check that
+        the packages which are only needed to calculate the orbitals are not loaded by the simulator.
+    """
+    if args.only and args.only not in 'import sim': return
+
+    best, heavy = None, ''
+    for _ in range(repeat):
+        out = subprocess.run([sys.executable, '-c', IMPORT_PROBE], capture_output=True, text=True, check=True,
+                             env=dict(os.environ, PYTHONPATH=os.pathsep.join(sys.path))).stdout.split()
+        elapsed, heavy = float(out[0]), ' '.join(out[1:])
+        best = elapsed if best is None else min(best, elapsed)
+
+    if heavy:
+        print(f'''ERROR: importing the simulator loads {heavy}''')
+        exit(-3)
+
+    results.append({'name': 'import sim', 'size': 1, 'time': best, 'ticks_per_s': 1/best, 'peak_mb': 0.0})
+    if verbose: print(f'''{'import sim':48} {1:8d} {best:10.4f} s''')
+
+# -------------------------------------------------------------
+# The start-up time of the package
+bench_import(args.repeat)
+
+# -------------------------------------------------------------
+# The simulator, over each of the bundled orbitals files
+for f in orbitals_files:
+    orbitals    = orbitals_dir + f
+    comtable    = comtables.get(f)
+    N, columns  = read_orbitals_file(orbitals)[1].shape
+    until       = min(N-1, 4600) if args.quick else N-1
+
+    # The older files have the altitude and azimuth of the satellites only, without their distance and the BGE
+    # columns: the UT runs at the fixed rate of the configuration there, and the event engine is skipped
+    overrides   = {} if columns >= 9 else {'comm.adaptable_rate': False}
+
+    bench(f'''Simulator.__init__ {f}''', N, lambda s: Simulator(orbitals, modes, devices, comtable, initial_time=2, until=until, overrides=overrides))
+
+    cache = tempfile.mkdtemp()
+    write_orbitals_cache(orbitals, cache)
+    bench(f'''Simulator.__init__ (orbitals cache) {f}''', N, lambda s: Simulator(orbitals, modes, devices, comtable, initial_time=2, until=until, overrides=overrides, orbitals_cache=cache))
+    shutil.rmtree(cache)
+
+    for engine in engines:
+        if engine == 'event' and columns < 9:
+            if verbose: print(f'''Skipping simulate[event] {f}: {columns} columns, the event engine needs the BGE''')
+            continue
+        make = lambda: Simulator(orbitals, modes, devices, comtable, initial_time=2, until=until, overrides=overrides)
+        bench(f'''simulate[{engine}] {f}''', until-2, lambda s: s.simulate(create_command_table=comtable is None, engine=engine), setup=make)
+
+# -------------------------------------------------------------
+# The hardware models, at several sizes
+for n in sizes:
+    n = min(n, largest.shape[0])
+    da = largest[:n]
+    if np.count_nonzero(np.diff(np.signbit(da[:,1]))) < 2: # the lunar clock needs a sunrise and a sunset
+        if verbose: print(f'''Skipping the size {n}: the Sun needs at least two horizon crossings''')
+        continue
+
+    bench('Sun.finalize', n, lambda s: Sun(da[:,0], da[:,1], da[:,2]), repeat=args.repeat)
+
+    sun = Sun(da[:,0], da[:,1], da[:,2])
+    def make_controller():
+        controller = Controller(sun=sun)
+        controller.add_panels_from_config(profiles['solar_panels'])
+        return controller
+    bench('Controller', n, lambda s: make_controller().calculate_power(), repeat=args.repeat) # with the construction of the panels
+    bench('Controller.calculate_power', n, lambda c: c.calculate_power(), setup=make_controller, repeat=args.repeat)
+    bench('Controller.calculate_power (breakdown)', n, lambda c: c.calculate_power(breakdown=True), setup=make_controller, repeat=args.repeat)
+    grid = np.meshgrid(np.linspace(-5, 5, 5), np.linspace(-5, 5, 5), np.linspace(-180, 180, 4)) # 100 attitudes
+    bench('Controller.attitude_sweep (100 attitudes)', n, lambda c: c.attitude_sweep(*grid), setup=make_controller, repeat=args.repeat)
+
+    comm_config = profiles['comm']
+    comm = Comm(max_rate_kbps=comm_config.get('if_adaptable', {}).get('max_rate_kbps'),
+                link_margin_dB=comm_config.get('if_adaptable', {}).get('link_margin_dB'),
+                fixed_rate=comm_config.get('if_fixed', {}).get('fixed_rate'))
+    up = np.flatnonzero(largest[:,3]>0.1)
+    up = up[np.arange(n) % up.size]
+    dist, alt_deg = largest[up,5], largest[up,3]*180/np.pi
+    bench('Comm.get_rate', n, lambda s: loop(n, lambda i: comm.get_rate(dist[i], alt_deg[i], comm.max_rate_kbps, comm.link_margin_dB)), repeat=args.repeat)
+    bench('Comm.rate_series', n, lambda s: comm.rate_series(dist, alt_deg), repeat=args.repeat)
+
+    lpf = Sat(da[:,0], da[:,3], da[:,4], da[:,5])
+    bench('Sat.passes', n, lambda s: lpf.passes(0.1), repeat=args.repeat)
+    bench('horizon_crossings', n, lambda s: horizon_crossings(da[:,0], da[:,3], 0.1), repeat=args.repeat)
+
+    power = 40*np.sin(np.arange(n)*2*np.pi/2880) # charge and discharge, one cycle per month at 15 min
+    def make_battery():
+        battery = Battery(profiles['battery'])
+        battery.set_temperature(20)
+        return battery
+    bench('Battery.apply_power', n, lambda b: loop(n, lambda i: b.apply_power(power[i], deltaT)), setup=make_battery, repeat=args.repeat)
+    bench('Battery.apply_power_series', n, lambda b: b.apply_power_series(power, deltaT, np.zeros(n)), setup=make_battery, repeat=args.repeat)
+    bench('Battery.apply_power_span', n, lambda b: b.apply_power_span(-20, n*deltaT), setup=make_battery, repeat=args.repeat)
+
+    def make_ensemble():
+        battery = make_battery()
+        battery.level = np.full(n, battery.level)
+        return battery
+    bench('Battery.apply_power (ensemble of n)', n, lambda b: b.apply_power(power, deltaT), setup=make_ensemble, repeat=args.repeat)
+
+    data    = 1e5*np.sin(np.arange(n)*2*np.pi/2880) # fills up and empties once a month, as the power above
+    make_ssd= lambda: SSD(None, profiles['ssd'])
+    bench('SSD.change', n, lambda s: loop(n, lambda i: s.change(data[i])), setup=make_ssd, repeat=args.repeat)
+    bench('SSD.change_span', n, lambda s: s.change_span(data), setup=make_ssd, repeat=args.repeat)
+
+    heat    = 10 + 5*np.cos(np.arange(n)*2*np.pi/96)
+    alt     = da[:,1]*180/np.pi
+    bench('Thermal.evolve', n, lambda t: loop(n, lambda i: t.evolve(heat[i], alt[i], deltaT)), setup=lambda: Thermal(None, profiles['thermal']), repeat=args.repeat)
+    bench('Thermal.evolve_span', n, lambda t: t.evolve_span(heat, alt, deltaT), setup=lambda: Thermal(None, profiles['thermal']), repeat=args.repeat)
+
+# -------------------------------------------------------------
+report = {'meta': {'date':      datetime.datetime.now().isoformat(timespec='seconds'),
+                   'python':    platform.python_version(),
+                   'numpy':     np.__version__,
+                   'machine':   platform.machine(),
+                   'quick':     args.quick},
+          'results': results}
+
+if args.output != '':
+    with open(args.output, 'w') as f: json.dump(report, f, indent=2)
+    if verbose: print(f'''Results saved to {args.output}''')
+
+if args.baseline == '': exit(0)
+
+with open(args.baseline, 'r') as f: baseline = {(r['name'], r['size']): r for r in json.load(f)['results']}
+
+regressions = 0
+for r in results:
+    b = baseline.get((r['name'], r['size']))
+    if b is None: continue
+    ratio = r['time']/b['time'] if b['time'] > 0 else 1.0
+    if ratio > 1 + args.tolerance:
+        regressions += 1
+        print(f'''REGRESSION {r['name']} [{r['size']}]: {r['time']:.4f} s vs {b['time']:.4f} s in the baseline ({ratio:.2f}x)''')
+    elif verbose:
+        print(f'''{r['name']} [{r['size']}]: {ratio:.2f}x the baseline''')
+
+if regressions:
+    if verbose: print(f'''{regressions} regression(s) against the baseline''')
+    exit(-3)
+
+if verbose: print('No regressions')
+
+exit(0)
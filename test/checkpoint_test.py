@@ -0,0 +1,133 @@
+#! /usr/bin/env python
+#######################################################################
+# The script for the test of checkpoint, restore and fork:
+# a run continued from a checkpoint, or by a further call of simulate,
+# must reproduce the uninterrupted run
+#######################################################################
+
+import os
+import sys
+from sys import exit
+import argparse
+
+import numpy as np
+
+
+##############################################
+parser = argparse.ArgumentParser()
+
+parser.add_argument("-v", "--verbose", action='store_true', help="Verbose mode")
+parser.add_argument("-e", "--engines", type=str, default='simpy,vector,event', help="Comma-separated engines to test")
+args    = parser.parse_args()
+
+verbose = args.verbose
+engines = args.engines.split(',')
+
+
+# ---
+try:
+    luseepy_path=os.environ['LUSEEPY_PATH']
+    if verbose: print(f'''The LUSEEPY_PATH is defined in the environment: {luseepy_path}, will be added to sys.path''')
+    sys.path.append(luseepy_path)
+except:
+    if verbose: print('The variable LUSEEPY_PATH is undefined, will rely on PYTHONPATH')
+
+# ---
+luseeopsim_path=''
+try:
+    luseeopsim_path=os.environ['LUSEEOPSIM_PATH']
+    if verbose: print(f'''The LUSEEOPSIM_PATH is defined in the environment: {luseeopsim_path}, will be added to sys.path''')
+    sys.path.append(luseeopsim_path)
+except:
+    if verbose: print('The variable LUSEEOPSIM_PATH is undefined, will rely on PYTHONPATH')
+    luseeopsim_path = '../'
+    sys.path.append(luseeopsim_path)  # Add parent to path, to enable running locally (also for data)
+
+import  sim # Main simulation module, which contains the Simulator class
+from    sim import Simulator, Monitor, MonitorReader
+
+
+# -------------------------------------------------------------
+orbitals    = luseeopsim_path + "/data/orbitals/20260110-20270116.hdf5"
+modes       = luseeopsim_path + "/config/modes.yml"
+devices     = luseeopsim_path + "/config/devices.yml"
+comtable    = luseeopsim_path + "/config/comtable-20260110-20270115.yml"
+
+initial_time    = 2
+split           = 2400
+until           = 4600
+checkpoint_f    = 'checkpoint_test.hdf5'
+
+# The event engine integrates the battery over the long spans of constant power, and steps it over the short ones:
+# where the checkpoint splits a span, the continued run agrees to the tolerance of engine_test.py (relative).
+# The other engines are exact
+tolerance       = {'event': 1e-4}
+
+for create_command_table in (False, True):
+    ct = None if create_command_table else comtable
+    for engine in engines:
+        reference = Simulator(orbitals, modes, devices, ct, initial_time=initial_time, until=until)
+        reference.simulate(create_command_table=create_command_table, engine=engine)
+
+        prefix = Simulator(orbitals, modes, devices, ct, initial_time=initial_time, until=split)
+        prefix.simulate(create_command_table=create_command_table, engine=engine)
+        prefix.checkpoint(checkpoint_f)
+
+        restored = Simulator(orbitals, modes, devices, ct, initial_time=initial_time)
+        restored.restore(checkpoint_f)
+        branch = prefix.fork()
+
+        for name, candidate in (('restore', restored), ('fork', branch), ('continue', prefix)):
+            candidate.until = until
+            candidate.simulate(create_command_table=create_command_table, engine=engine)
+
+            for channel in Monitor.channels:
+                c, r = getattr(candidate.monitor, channel), getattr(reference.monitor, channel)
+                diff = np.max(np.abs(c - r)/np.maximum(np.abs(r), 1e-12))
+                if verbose: print(f'''Engine {engine}, generated schedule: {create_command_table}, {name:8}, channel {channel:12}: max relative difference {diff:.2e}''')
+                if diff > tolerance.get(engine, 0.0):
+                    if verbose: print('Mismatch between the uninterrupted and the continued run')
+                    exit(-3)
+
+            if candidate.record != reference.record and not (len(candidate.record) == len(reference.record) and all(
+                    c['start'] == r['start'] and c['mode'] == r['mode'] and abs(c['battery_expected_fill'] - r['battery_expected_fill']) <= tolerance.get(engine, 0.0)
+                    and c['ssd_expected_fill'] == r['ssd_expected_fill'] for c, r in zip(candidate.record.values(), reference.record.values()))):
+                if verbose: print('Mismatch in the record of the state transitions')
+                exit(-3)
+
+# Streamed Monitor: restored into another file, continued in the same file, and forked
+stream_f = ['checkpoint_test_prefix.hdf5', 'checkpoint_test_restore.hdf5', 'checkpoint_test_prefix-fork1.hdf5']
+for engine in engines:
+    reference = Simulator(orbitals, modes, devices, comtable, initial_time=initial_time, until=until)
+    reference.simulate(engine=engine)
+
+    prefix = Simulator(orbitals, modes, devices, comtable, initial_time=initial_time, until=split, monitor_f=stream_f[0], monitor_chunk=1000)
+    prefix.simulate(engine=engine)
+    cp = prefix.checkpoint(checkpoint_f)
+
+    restored = Simulator(orbitals, modes, devices, comtable, initial_time=initial_time, monitor_f=stream_f[1])
+    restored.restore(checkpoint_f)
+    branch = prefix.fork(cp)
+    resumed = Simulator(orbitals, modes, devices, comtable, initial_time=initial_time, monitor_f=stream_f[0])
+    resumed.restore(cp)
+
+    for name, candidate in (('restore', restored), ('fork', branch), ('resume', resumed)):
+        candidate.until = until
+        candidate.simulate(engine=engine)
+        with MonitorReader(candidate.monitor_f) as reader:
+            if len(reader) != until-initial_time:
+                if verbose: print(f'''Engine {engine}, streamed {name}: {len(reader)} steps in {candidate.monitor_f}''')
+                exit(-3)
+            diff = max(np.max(np.abs(reader[ch][:] - r)/np.maximum(np.abs(r), 1e-12))
+                       for ch, r in ((ch, getattr(reference.monitor, ch)[initial_time:until]) for ch in Monitor.channels))
+        if verbose: print(f'''Engine {engine}, streamed {name:8}: max relative difference {diff:.2e}''')
+        if diff > tolerance.get(engine, 0.0):
+            if verbose: print('Mismatch between the uninterrupted and the continued run')
+            exit(-3)
+
+os.remove(checkpoint_f)
+for f in stream_f: os.remove(f)
+
+if verbose: print('Success!')
+
+exit(0)
@@ -0,0 +1,89 @@
+#! /usr/bin/env python
+#######################################################################
+# The script for the test of the alternative simulation engines:
+# the Monitor output must agree with that of the SimPy engine
+#######################################################################
+
+import os
+import sys
+from sys import exit
+import argparse
+
+import numpy as np
+
+tolerance = 1e-9 # relative
+
+# The event engine integrates the battery over the long spans of constant power instead of stepping it, and relaxes
+# the thermal model with Thermal.relax_span (see Simulator.run_event): the tolerances of these channels, relative
+event_tolerance = {'battery_SOC': 1e-4, 'battery_V': 1e-4, 'boxtemp': 1e-12}
+
+##############################################
+parser = argparse.ArgumentParser()
+
+parser.add_argument("-v", "--verbose", action='store_true', help="Verbose mode")
+parser.add_argument("-e", "--engines", type=str, default='vector,event', help="Comma-separated engines to compare with SimPy")
+args    = parser.parse_args()
+
+verbose = args.verbose
+engines = args.engines.split(',')
+
+
+# ---
+try:
+    luseepy_path=os.environ['LUSEEPY_PATH']
+    if verbose: print(f'''The LUSEEPY_PATH is defined in the environment: {luseepy_path}, will be added to sys.path''')
+    sys.path.append(luseepy_path)
+except:
+    if verbose: print('The variable LUSEEPY_PATH is undefined, will rely on PYTHONPATH')
+
+# ---
+luseeopsim_path=''
+try:
+    luseeopsim_path=os.environ['LUSEEOPSIM_PATH']
+    if verbose: print(f'''The LUSEEOPSIM_PATH is defined in the environment: {luseeopsim_path}, will be added to sys.path''')
+    sys.path.append(luseeopsim_path)
+except:
+    if verbose: print('The variable LUSEEOPSIM_PATH is undefined, will rely on PYTHONPATH')
+    luseeopsim_path = '../'
+    sys.path.append(luseeopsim_path)  # Add parent to path, to enable running locally (also for data)
+
+import  sim # Main simulation module, which contains the Simulator class
+from    sim import Simulator
+
+
+# -------------------------------------------------------------
+orbitals    = luseeopsim_path + "/data/orbitals/20260110-20270116.hdf5"
+modes       = luseeopsim_path + "/config/modes.yml"
+devices     = luseeopsim_path + "/config/devices.yml"
+comtable    = luseeopsim_path + "/config/comtable-20260110-20270115.yml"
+
+initial_time    = 2
+until           = 4600
+
+channels = ['power', 'battery_SOC', 'battery_V', 'data_rate', 'ssd', 'boxtemp', 'ssd_dropped', 'ssd_wasted']
+
+for create_command_table in (False, True):
+    ct = None if create_command_table else comtable
+    reference = Simulator(orbitals, modes, devices, ct, initial_time=initial_time, until=until, monitor_channels=channels)
+    reference.simulate(create_command_table=create_command_table)
+
+    for engine in engines:
+        candidate = Simulator(orbitals, modes, devices, ct, initial_time=initial_time, until=until, monitor_channels=channels)
+        candidate.simulate(create_command_table=create_command_table, engine=engine)
+
+        for channel in channels:
+            r = getattr(reference.monitor, channel)
+            c = getattr(candidate.monitor, channel)
+            diff = np.max(np.abs(c - r)/np.maximum(np.abs(r), 1e-12))
+            if verbose: print(f'''Engine {engine}, generated schedule: {create_command_table}, channel {channel:12}: max relative difference {diff:.2e}''')
+            if diff > (event_tolerance.get(channel, tolerance) if engine == 'event' else tolerance):
+                if verbose: print('Mismatch between reference data and result')
+                exit(-3)
+
+        if [v['mode'] for v in reference.record.values()] != [v['mode'] for v in candidate.record.values()]:
+            if verbose: print('Mismatch in the record of the state transitions')
+            exit(-3)
+
+if verbose: print('Success!')
+
+exit(0)
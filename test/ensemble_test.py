@@ -0,0 +1,103 @@
+#! /usr/bin/env python
+#######################################################################
+# The script for the test of the Ensemble: identical members must
+# agree with the vector engine, members with different batteries must
+# differ, and the Simulator the Ensemble is built on must be unchanged
+#######################################################################
+
+import os
+import sys
+from sys import exit
+import argparse
+
+import numpy as np
+
+# Absolute, per channel: the voltage is steep near an empty battery
+tolerance = {'battery_SOC': 1e-9, 'battery_V': 1e-7, 'ssd': 1e-12, 'boxtemp': 1e-9}
+
+##############################################
+parser = argparse.ArgumentParser()
+
+parser.add_argument("-v", "--verbose", action='store_true', help="Verbose mode")
+args    = parser.parse_args()
+
+verbose = args.verbose
+
+
+# ---
+try:
+    luseepy_path=os.environ['LUSEEPY_PATH']
+    if verbose: print(f'''The LUSEEPY_PATH is defined in the environment: {luseepy_path}, will be added to sys.path''')
+    sys.path.append(luseepy_path)
+except:
+    if verbose: print('The variable LUSEEPY_PATH is undefined, will rely on PYTHONPATH')
+
+# ---
+luseeopsim_path=''
+try:
+    luseeopsim_path=os.environ['LUSEEOPSIM_PATH']
+    if verbose: print(f'''The LUSEEOPSIM_PATH is defined in the environment: {luseeopsim_path}, will be added to sys.path''')
+    sys.path.append(luseeopsim_path)
+except:
+    if verbose: print('The variable LUSEEOPSIM_PATH is undefined, will rely on PYTHONPATH')
+    luseeopsim_path = '../'
+    sys.path.append(luseeopsim_path)  # Add parent to path, to enable running locally (also for data)
+
+from    sim import Simulator, Ensemble
+
+
+# -------------------------------------------------------------
+orbitals    = luseeopsim_path + "/data/orbitals/20260110-20270116.hdf5"
+modes       = luseeopsim_path + "/config/modes.yml"
+devices     = luseeopsim_path + "/config/devices.yml"
+comtable    = luseeopsim_path + "/config/comtable-20260110-20270115.yml"
+
+initial_time    = 2
+until           = 9000
+K               = 3
+
+make = lambda: Simulator(orbitals, modes, devices, comtable, initial_time=initial_time, until=until)
+
+# Identical members, then the vector engine on the same Simulator, which must be left as it was
+smltr   = make()
+before  = smltr.checkpoint()
+ens     = Ensemble(smltr, K, keep_series=True)
+summary = ens.run()
+after   = smltr.checkpoint()
+
+if {k: v for k, v in before.items() if k != 'monitor'} != {k: v for k, v in after.items() if k != 'monitor'}:
+    if verbose: print('The Ensemble changed the state of the Simulator')
+    exit(-3)
+
+smltr.simulate(engine='vector')
+reference = make()
+reference.simulate(engine='vector')
+
+window  = slice(initial_time, until)
+monitor = smltr.monitor
+for ch in ('battery_SOC', 'battery_V', 'ssd', 'boxtemp'):
+    series  = getattr(ens, ch)
+    diff    = np.max(np.abs(series - getattr(monitor, ch)[window, np.newaxis]))
+    if verbose: print(f'''{ch:12}: max difference between the members and the vector engine {diff:.2e}''')
+    if diff > tolerance[ch] or not np.array_equal(getattr(monitor, ch), getattr(reference.monitor, ch)):
+        if verbose: print('Mismatch between the Ensemble and the vector engine')
+        exit(-3)
+
+if not (np.allclose(summary['min_soc'], ens.battery_SOC.min(axis=0)) and np.allclose(summary['final_soc'], ens.battery_SOC[-1])
+        and np.allclose(summary['max_boxtemp'], ens.boxtemp.max(axis=0)) and np.allclose(summary['min_boxtemp'], ens.boxtemp.min(axis=0))):
+    if verbose: print('Mismatch between the summary and the series of the Ensemble')
+    exit(-3)
+
+# Members with different initial SOC and battery capacity
+smltr   = make()
+ens     = Ensemble(smltr, K, initial_soc=[0.3, 0.6, 0.9], capacity=[200.0, 240.99, 280.0], keep_series=True)
+summary = ens.run()
+soc     = ens.battery_SOC
+if verbose: print(f'''Final SOC of the members with different batteries: {summary['final_soc']}''')
+if any(np.allclose(soc[:, a], soc[:, b]) for a in range(K) for b in range(a+1, K)) or not np.allclose(soc[0], [0.3, 0.6, 0.9], atol=0.01):
+    if verbose: print('The members with different batteries do not differ')
+    exit(-3)
+
+if verbose: print('Success!')
+
+exit(0)
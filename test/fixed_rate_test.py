@@ -0,0 +1,109 @@
+#! /usr/bin/env python
+#######################################################################
+# The script for the test of the fixed rate of the UT: with the rate
+# if_fixed.fixed_rate of the configuration, the downlink must be the
+# same with all the engines, and the one calculated by hand
+#######################################################################
+
+import os
+import sys
+from sys import exit
+import argparse
+
+import yaml
+import numpy as np
+
+tolerance = 1e-12
+
+##############################################
+parser = argparse.ArgumentParser()
+
+parser.add_argument("-v", "--verbose", action='store_true', help="Verbose mode")
+args    = parser.parse_args()
+
+verbose = args.verbose
+
+
+# ---
+try:
+    luseepy_path=os.environ['LUSEEPY_PATH']
+    if verbose: print(f'''The LUSEEPY_PATH is defined in the environment: {luseepy_path}, will be added to sys.path''')
+    sys.path.append(luseepy_path)
+except:
+    if verbose: print('The variable LUSEEPY_PATH is undefined, will rely on PYTHONPATH')
+
+# ---
+luseeopsim_path=''
+try:
+    luseeopsim_path=os.environ['LUSEEOPSIM_PATH']
+    if verbose: print(f'''The LUSEEOPSIM_PATH is defined in the environment: {luseeopsim_path}, will be added to sys.path''')
+    sys.path.append(luseeopsim_path)
+except:
+    if verbose: print('The variable LUSEEOPSIM_PATH is undefined, will rely on PYTHONPATH')
+    luseeopsim_path = '../'
+    sys.path.append(luseeopsim_path)  # Add parent to path, to enable running locally (also for data)
+
+from    sim import Simulator
+from    sim.sim import COMM_MIN_ALT
+
+
+# -------------------------------------------------------------
+orbitals    = luseeopsim_path + "/data/orbitals/20260110-20270116.hdf5"
+modes       = luseeopsim_path + "/config/modes.yml"
+devices     = luseeopsim_path + "/config/devices.yml"
+comtable    = luseeopsim_path + "/config/comtable-20260110-20270115.yml"
+
+config_rate = float(yaml.safe_load(open(devices, 'r'))['comm']['if_fixed']['fixed_rate']) # kB/s, negative for the downlink
+
+initial_time    = 2
+until           = 20000
+window          = slice(initial_time, until)
+
+channels = ['data_rate', 'ssd', 'mode', 'comm_rate', 'ssd_dropped', 'ssd_wasted']
+
+results = {}
+for engine in ('simpy', 'vector', 'event'):
+    smltr = Simulator(orbitals, modes, devices, comtable, initial_time=initial_time, until=until,
+                      overrides={'comm.adaptable_rate': False}, monitor_channels=channels)
+    if smltr.comm.adaptable_rate or smltr.comm.fixed_rate != config_rate:
+        if verbose: print('The fixed rate of the configuration was not selected')
+        exit(-3)
+    level = smltr.ssd.level
+    smltr.simulate(engine=engine)
+    results[engine] = smltr.monitor
+
+# The engines must agree
+reference = results['simpy']
+for engine in ('vector', 'event'):
+    for channel in channels:
+        diff = np.max(np.abs(getattr(results[engine], channel) - getattr(reference, channel)))
+        if verbose: print(f'''Engine {engine}, channel {channel:12}: max difference {diff:.2e}''')
+        if diff > tolerance:
+            if verbose: print('Mismatch between the engines with the fixed rate')
+            exit(-3)
+
+# By hand: the UT sends config_rate whenever LPF is above COMM_MIN_ALT in a mode with the UT on, the
+# devices fill the SSD at their tabulated rates, and the SSD is clipped to [0, capacity]
+mode_ids    = reference.mode[window]
+tx          = (smltr.lpf.alt[window] > COMM_MIN_ALT) & np.array([smltr.modes[m]['UT'] == 'ON' for m in smltr.mode_names])[mode_ids]
+ut          = smltr.device_names.index('UT')
+produced    = np.delete(smltr.device_rate_table[:, 0], ut, axis=1).sum(axis=1)[mode_ids]
+data_rate   = produced + np.where(tx, config_rate, 0.0)
+
+sent, ssd = 0.0, []
+for k in range(data_rate.size):
+    new     = min(max(level + data_rate[k]*smltr.deltaT, 0.0), smltr.ssd.capacity)
+    sent   += min(new - level - produced[k]*smltr.deltaT, 0.0)
+    level   = new
+    ssd.append(level/smltr.ssd.capacity)
+
+volume = -(reference.data_rate[window] - produced).sum()*smltr.deltaT - reference.ssd_wasted[window].sum() # nominal, less the wasted capacity
+if verbose: print(f'''{tx.sum()} steps with the UT sending, {-sent/1e3:.1f} MB downlinked''')
+if (not tx.any() or np.max(np.abs(reference.data_rate[window] - data_rate)) > tolerance or np.any(reference.comm_rate[window])
+        or np.max(np.abs(reference.ssd[window] - ssd)) > tolerance or not np.isclose(volume, -sent, rtol=tolerance)):
+    if verbose: print('Mismatch between the engines and the hand-computed downlink')
+    exit(-3)
+
+if verbose: print('Success!')
+
+exit(0)
@@ -0,0 +1,100 @@
+#! /usr/bin/env python
+#######################################################################
+# The script for the test of the solar power of the Controller: the
+# per-panel breakdown of calculate_power against Panel.power, and the
+# attitude sweep against Controllers rebuilt for each lander attitude
+#######################################################################
+
+import os
+import sys
+from sys import exit
+import copy
+import argparse
+
+import yaml
+import numpy as np
+
+tolerance = 1e-12 # relative to the peak power
+
+##############################################
+parser = argparse.ArgumentParser()
+
+parser.add_argument("-v", "--verbose", action='store_true', help="Verbose mode")
+args    = parser.parse_args()
+
+verbose = args.verbose
+
+
+# ---
+try:
+    luseepy_path=os.environ['LUSEEPY_PATH']
+    if verbose: print(f'''The LUSEEPY_PATH is defined in the environment: {luseepy_path}, will be added to sys.path''')
+    sys.path.append(luseepy_path)
+except:
+    if verbose: print('The variable LUSEEPY_PATH is undefined, will rely on PYTHONPATH')
+
+# ---
+luseeopsim_path=''
+try:
+    luseeopsim_path=os.environ['LUSEEOPSIM_PATH']
+    if verbose: print(f'''The LUSEEOPSIM_PATH is defined in the environment: {luseeopsim_path}, will be added to sys.path''')
+    sys.path.append(luseeopsim_path)
+except:
+    if verbose: print('The variable LUSEEOPSIM_PATH is undefined, will rely on PYTHONPATH')
+    luseeopsim_path = '../'
+    sys.path.append(luseeopsim_path)  # Add parent to path, to enable running locally (also for data)
+
+from    nav         import Sun
+from    hardware    import Controller
+from    sim.sim     import read_orbitals_file
+
+
+# -------------------------------------------------------------
+orbitals    = luseeopsim_path + "/data/orbitals/20260110-20270116.hdf5"
+config      = yaml.safe_load(open(luseeopsim_path+'/config/devices.yml','r'))['solar_panels']
+
+deltaT, da  = read_orbitals_file(orbitals, slice(0, 3))
+sun         = Sun(da[:,0], da[:,1], da[:,2])
+
+def controller(lander=None):
+    """ A Controller with the panels of the configuration, optionally for another lander attitude """
+    cfg = copy.deepcopy(config)
+    if lander is not None: cfg['config']['lander'] = ' '.join(str(x) for x in lander)
+    ctrl = Controller(sun=sun)
+    ctrl.add_panels_from_config(cfg)
+    return ctrl
+
+# Breakdown: each column is the power of the panel, and the total their sum
+ctrl                = controller()
+power, panel_power  = ctrl.calculate_power(breakdown=True)
+scale               = power.max()
+diff = max(np.max(np.abs(panel_power[:, k] - p.power())) for k, p in enumerate(ctrl.panels))/scale
+diff = max(diff, np.max(np.abs(power - panel_power.sum(axis=1)))/scale)
+if verbose: print(f'''Breakdown of {len(ctrl.panels)} panels: max relative difference {diff:.2e}''')
+if panel_power.shape != (sun.N, len(ctrl.panels)) or diff > tolerance:
+    if verbose: print('Mismatch between calculate_power(breakdown=True) and Panel.power')
+    exit(-3)
+
+# Attitude sweep: (pitch, roll, yaw) in degrees, as 'lander' in the configuration
+attitudes   = np.array([[0.0, 0.0, 0.0], [5.0, -3.0, 10.0], [-10.0, 2.5, 45.0], [20.0, 15.0, -90.0]])
+sweep       = ctrl.attitude_sweep(attitudes[:,0], attitudes[:,1], attitudes[:,2], series=True)
+
+day         = sun.condition[0]
+rises       = sun.crossings[sun.day[sun.crossings+1]] + 1
+complete    = slice(rises[0], rises[-1]) # the complete lunar days
+
+for m, lander in enumerate(attitudes):
+    expected    = controller(lander).calculate_power()
+    diff        = np.max(np.abs(sweep['power'][:, m] - expected))/scale
+    energy      = expected[complete].sum()*deltaT/3600.
+    ok          = diff <= tolerance
+    ok         &= np.isclose(sweep['min_day_power'][m], expected[day].min(), rtol=0, atol=tolerance*scale)
+    ok         &= np.isclose(sweep['energy'][m].sum(), energy, rtol=tolerance)
+    if verbose: print(f'''Attitude {lander}: max relative difference of the power {diff:.2e}, energy {energy:.1f} Wh''')
+    if not ok:
+        if verbose: print('Mismatch between attitude_sweep and the Controller rebuilt for the attitude')
+        exit(-3)
+
+if verbose: print('Success!')
+
+exit(0)
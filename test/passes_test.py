@@ -0,0 +1,102 @@
+#! /usr/bin/env python
+#######################################################################
+# The script for the test of the index of the satellite passes:
+# the volume, the duration and the lookups of each pass must agree
+# with the altitude series they were built from
+#######################################################################
+
+import os
+import sys
+from sys import exit
+import argparse
+
+import numpy as np
+
+tolerance = 1e-12 # relative
+
+##############################################
+parser = argparse.ArgumentParser()
+
+parser.add_argument("-v", "--verbose", action='store_true', help="Verbose mode")
+args    = parser.parse_args()
+
+verbose = args.verbose
+
+
+# ---
+try:
+    luseepy_path=os.environ['LUSEEPY_PATH']
+    if verbose: print(f'''The LUSEEPY_PATH is defined in the environment: {luseepy_path}, will be added to sys.path''')
+    sys.path.append(luseepy_path)
+except:
+    if verbose: print('The variable LUSEEPY_PATH is undefined, will rely on PYTHONPATH')
+
+# ---
+luseeopsim_path=''
+try:
+    luseeopsim_path=os.environ['LUSEEOPSIM_PATH']
+    if verbose: print(f'''The LUSEEOPSIM_PATH is defined in the environment: {luseeopsim_path}, will be added to sys.path''')
+    sys.path.append(luseeopsim_path)
+except:
+    if verbose: print('The variable LUSEEOPSIM_PATH is undefined, will rely on PYTHONPATH')
+    luseeopsim_path = '../'
+    sys.path.append(luseeopsim_path)  # Add parent to path, to enable running locally (also for data)
+
+from    nav import Sat
+from    sim.sim import read_orbitals_file, SAT_COLUMNS, COMM_MIN_ALT
+
+
+# -------------------------------------------------------------
+orbitals = luseeopsim_path + "/data/orbitals/20260110-20270116.hdf5"
+
+deltaT, da  = read_orbitals_file(orbitals)
+rng         = np.random.default_rng(1)
+
+for name, c in SAT_COLUMNS.items():
+    sat = Sat(da[:,0], da[:,c], da[:,c+1], da[:,c+2])
+    for min_alt in (0.0, COMM_MIN_ALT, 0.3): # COMM_MIN_ALT: the passes are the time steps of the TX condition
+        rate    = rng.uniform(0.0, 10.0, sat.N) # nonzero outside the passes too
+        passes  = sat.passes(min_alt, rate, deltaT)
+        up      = sat.alt > min_alt
+
+        # The passes are the runs of time steps above min_alt
+        steps   = np.zeros(sat.N, dtype=int)
+        for s, e in zip(passes.start, passes.stop): steps[s:e] += 1
+        if passes.N == 0 or not np.array_equal(steps, up.astype(int)):
+            if verbose: print(f'''{name}, min_alt {min_alt}: the passes do not match the altitude series''')
+            exit(-3)
+
+        # Volume: the rate summed over each pass only, and the number of steps for a unit rate
+        volume  = np.array([rate[s:e].sum() for s, e in zip(passes.start, passes.stop)])*deltaT
+        unit    = sat.passes(min_alt, np.ones(sat.N), 1.0).volume
+        diff    = np.max(np.abs(passes.volume - volume)/volume)
+        if verbose: print(f'''{name}, min_alt {min_alt}: {passes.N} passes, max relative difference of the volume {diff:.2e}''')
+        if diff > tolerance or not np.array_equal(unit, passes.stop - passes.start):
+            if verbose: print('Mismatch in the volume of the passes')
+            exit(-3)
+
+        # Duration: between the crossings, which are within the step before the first and after the last one in the pass
+        mjd     = sat.mjd
+        inner   = (passes.start > 0) & (passes.stop < sat.N)
+        ok      = np.allclose(passes.duration, (passes.set - passes.rise)*24.0, rtol=tolerance)
+        ok     &= np.all((passes.rise[inner] > mjd[passes.start[inner]-1]) & (passes.rise[inner] <= mjd[passes.start[inner]]))
+        ok     &= np.all((passes.set[inner] >= mjd[passes.stop[inner]-1]) & (passes.set[inner] < mjd[passes.stop[inner]]))
+        if not ok:
+            if verbose: print('Mismatch in the rise, set or duration of the passes')
+            exit(-3)
+
+        # Lookups: 'at' by time index for every step, 'find' by MJD at the middle of each pass and between passes
+        expected = np.full(sat.N, -1)
+        for k, (s, e) in enumerate(zip(passes.start, passes.stop)): expected[s:e] = k
+        middle  = 0.5*(passes.rise + passes.set)
+        between = 0.5*(passes.set[:-1] + passes.rise[1:])
+        if not (np.array_equal(passes.at(np.arange(sat.N)), expected)
+                and np.array_equal(passes.find(middle), np.arange(passes.N))
+                and np.all(passes.find(between) == -1)
+                and all(passes.at(int(s)) == k for k, s in enumerate(passes.start[:10]))):
+            if verbose: print('Mismatch in the lookups of the passes')
+            exit(-3)
+
+if verbose: print('Success!')
+
+exit(0)
@@ -0,0 +1,76 @@
+#! /usr/bin/env python
+#######################################################################
+# The script for the test of the thermal model: evolve_span, solved
+# by blocks at once, must agree with evolve step by step, including
+# for time steps long compared to the time constant
+#######################################################################
+
+import os
+import sys
+from sys import exit
+import argparse
+
+import yaml
+import numpy as np
+
+tolerance = 1e-12 # relative
+
+##############################################
+parser = argparse.ArgumentParser()
+
+parser.add_argument("-v", "--verbose", action='store_true', help="Verbose mode")
+args    = parser.parse_args()
+
+verbose = args.verbose
+
+
+# ---
+try:
+    luseepy_path=os.environ['LUSEEPY_PATH']
+    if verbose: print(f'''The LUSEEPY_PATH is defined in the environment: {luseepy_path}, will be added to sys.path''')
+    sys.path.append(luseepy_path)
+except:
+    if verbose: print('The variable LUSEEPY_PATH is undefined, will rely on PYTHONPATH')
+
+# ---
+luseeopsim_path=''
+try:
+    luseeopsim_path=os.environ['LUSEEOPSIM_PATH']
+    if verbose: print(f'''The LUSEEOPSIM_PATH is defined in the environment: {luseeopsim_path}, will be added to sys.path''')
+    sys.path.append(luseeopsim_path)
+except:
+    if verbose: print('The variable LUSEEOPSIM_PATH is undefined, will rely on PYTHONPATH')
+    luseeopsim_path = '../'
+    sys.path.append(luseeopsim_path)  # Add parent to path, to enable running locally (also for data)
+
+from    hardware import Thermal
+
+
+# -------------------------------------------------------------
+config  = yaml.safe_load(open(luseeopsim_path+'/config/devices.yml','r'))['thermal']
+rng     = np.random.default_rng(2)
+n, K    = 1000, 8
+
+for ratio in (1e-3, 0.1, 1.0, 5.0, 11.0, 12.0, 20.0, 100.0, 1000.0): # dt/tau
+    dt      = ratio*config['tau']
+    heat    = rng.uniform(0.0, 40.0, (n, K))
+    alt_deg = rng.uniform(-10.0, 70.0, n)
+
+    for shape in ('scalar', 'ensemble'):
+        h       = heat[:,0] if shape == 'scalar' else heat
+        step    = Thermal(None, config)
+        span    = Thermal(None, config)
+        if shape == 'ensemble': step.temperature = span.temperature = rng.uniform(-10.0, 50.0, K)
+
+        expected = np.array([step.evolve(h[k], alt_deg[k], dt) for k in range(n)])
+        result   = span.evolve_span(h, alt_deg, dt)
+
+        diff = np.max(np.abs(result - expected)/np.maximum(np.abs(expected), 1.0))
+        if verbose: print(f'''dt/tau {ratio:8g}, {shape:8}: max relative difference {diff:.2e}''')
+        if not (np.all(np.isfinite(result)) and diff <= tolerance and np.allclose(span.temperature, step.temperature, rtol=tolerance)):
+            if verbose: print('Mismatch between evolve_span and evolve')
+            exit(-3)
+
+if verbose: print('Success!')
+
+exit(0)
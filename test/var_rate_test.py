@@ -114,3 +114,76 @@ for i in range(len(dist_list)):
             print('Error: Rates not equal (Adaptable)')
             exit(-3)
 
+
+# The vectorized rate series over the same points
+rates, demods, pw2s = comm.rate_series(np.array(dist_list), np.array(alt_list))
+if verbose: print(f'''Rate series in kbps: {rates}''')
+if not np.array_equal(rates, rate_list):
+    print('Error: Rates not equal (rate_series)')
+    exit(-3)
+
+
+# The reference: the link budget of Comm.demodulation and the loop of Comm.get_rate as they were before the
+# closed form of LinkBudget, trying the powers of 2 from 2**5 up; the rate is zero if even 2**5 fails the margin
+def reference_demodulation(comm, dis_range, rate_pw2, extra_ant_gain):
+    Asset_EIRP = 13.0 + extra_ant_gain
+    free_space_path_loss = -20*np.log10(4*np.pi*comm.Freq_MHz*1000000*dis_range*1000/300000000)
+    Pt_error_main = comm.Pt_error_intp(dis_range)
+    SANT_main = comm.SANT_intp(comm.Off_pt_angle+Pt_error_main)
+    Mismatch_loss = 10*np.log10(1-(10**(-15/20))**2)
+    SCGT = SANT_main + Mismatch_loss - 26.8
+    Uplink_CN0 = Asset_EIRP + free_space_path_loss + SCGT - 10*np.log10(1.38e-23)
+    Data_rate = 2**rate_pw2 * 0.662430862918876
+    EbN0 = Uplink_CN0 - 1.0 - 10*np.log10(Data_rate*1000)
+    return EbN0 - 2.1, Data_rate
+
+def reference_rate(comm, distance_km, alt_deg, zero_ext_gain=False):
+    extra_gain = comm.ext_gain(alt_deg) if not zero_ext_gain else 0
+    pw2 = 5
+    rate, demod, level = 0.0, reference_demodulation(comm, distance_km, pw2, extra_gain)[0], 0
+    while True:
+        try_demod, try_rate = reference_demodulation(comm, distance_km, pw2, extra_gain)
+        if (try_demod < comm.link_margin_dB) or (pw2 == int(np.log10(comm.max_rate_kbps)/np.log10(2))-1):
+            break
+        pw2 += 1
+        rate, demod, level = try_rate, try_demod, 2**(pw2-1)
+    return rate, demod, level
+
+# On a grid of distances and altitudes, for link margins with and without the rate 0 fallback, and on both
+# sides of the 2**5 boundary (the distance where the margin at 2**5 is the link margin, found by bisection)
+tolerance = 1e-9 # dB, for the demod margin
+boundaries, fallbacks = 0, 0
+for margin in (3, 9, 12):
+    grid = Comm(max_rate_kbps=1024, link_margin_dB=margin)
+    for zero_ext_gain in (False, True):
+        dist, alt = np.meshgrid(np.linspace(430, 10000, 60), np.linspace(0, 90, 10))
+        dist, alt = dist.ravel(), alt.ravel()
+
+        extra_gain = grid.ext_gain(0.0) if not zero_ext_gain else 0
+        lo, hi = 430.0, 10000.0
+        if reference_demodulation(grid, hi, 5, extra_gain)[0] < margin <= reference_demodulation(grid, lo, 5, extra_gain)[0]:
+            for _ in range(60):
+                mid = 0.5*(lo+hi)
+                if reference_demodulation(grid, mid, 5, extra_gain)[0] >= margin: lo = mid
+                else: hi = mid
+            dist, alt = np.append(dist, [lo, hi]), np.append(alt, [0.0, 0.0])
+            boundaries += 1
+
+        expected = np.array([reference_rate(grid, d, a, zero_ext_gain) for d, a in zip(dist, alt)])
+        single = np.array([grid.get_rate(d, a, grid.max_rate_kbps, grid.link_margin_dB, zero_ext_gain) for d, a in zip(dist, alt)])
+        series = np.column_stack(grid.rate_series(dist, alt, zero_ext_gain))
+        levels = np.unique(expected[:,2])
+        fallbacks += np.count_nonzero(expected[:,2] == 0)
+        if verbose: print(f'''Link margin {margin} dB, zero_ext_gain {zero_ext_gain}: {dist.size} points, rates 2**pw2 {levels}''')
+        for result in (single, series):
+            if not (np.array_equal(result[:,0], expected[:,0]) and np.array_equal(result[:,2], expected[:,2])
+                    and np.max(np.abs(result[:,1] - expected[:,1])) <= tolerance):
+                print('Error: Rates not equal (reference loop)')
+                exit(-3)
+
+if not (boundaries and fallbacks):
+    print('Error: The grid misses the rate 0 fallback or the 2**5 boundary')
+    exit(-3)
+
+if verbose: print(f'''{boundaries} boundaries of 2**5, {fallbacks} points at the rate 0 fallback''')
+if verbose: print('Success!')
@@ -1,13 +1,15 @@
-from    astropy.time import Time
-from    dateutil     import parser
+# astropy and dateutil are imported when the conversions are first used, they are slow to load
 
 # ---
 def mjd2dt(mjd):
+    from astropy.time import Time
     t = Time(val=mjd,format='mjd')
     return t.datetime
 
 # ---
 def dt2mjd(dt):
+    from astropy.time import Time
+    from dateutil     import parser
     t = Time(val=parser.parse(dt),  format='datetime')
     return t.mjd
 